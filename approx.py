@@ -0,0 +1,167 @@
+import math
+import random
+from collections import OrderedDict
+import pipeline
+
+SAMPLE_BLOCK = 1 << 12  # rows in a block of TABLESAMPLE, smaller tables are split into about 1024 blocks
+Z_95 = 1.96  # half width of the 95% confidence interval, in standard errors
+ESTIMATED = ("SUM", "COUNT", "AVG")  # aggregates given with error bounds, MIN and MAX are the ones of the sample
+
+
+def error_name(name):
+    """
+    Name of the column having the error bound of the aggregate column
+    """
+    return "ERROR(" + name + ")"
+
+
+class BlockSample:
+    """
+    Random sample of the blocks (ranges of consecutive rows) of a table, as asked for by TABLESAMPLE SYSTEM (percent).
+    Each block is picked with probability percent / 100, by a random generator seeded with seed (REPEATABLE).
+    """
+
+    def __init__(self, n_rows, percent, seed=None):
+        self.n_rows = n_rows
+        self.percent = percent
+        self.block_rows = max(1, min(SAMPLE_BLOCK, n_rows // 1024))
+        self.n_blocks = -(-n_rows // self.block_rows)
+        rng = random.Random(seed)
+        self.blocks = [block for block in range(self.n_blocks) if rng.random() * 100 < percent]
+        if len(self.blocks) == 0 and self.n_blocks > 0 and percent > 0:
+            self.blocks = [rng.randrange(self.n_blocks)]  # at least one block is picked
+
+    def rows(self):
+        """
+        Selection vector (ascending) of the rows of the picked blocks
+        """
+        rows = []
+        for block in self.blocks:
+            rows.extend(range(block * self.block_rows, min(self.n_rows, (block + 1) * self.block_rows)))
+        return rows
+
+    def size(self, block):
+        """
+        Rows in the block, the last block may be short
+        """
+        return min(self.n_rows, (block + 1) * self.block_rows) - block * self.block_rows
+
+    def describe(self):
+        return "SYSTEM ({}%) : {} of {} blocks of {} rows".format(self.percent, len(self.blocks), self.n_blocks,
+                                                                  self.block_rows)
+
+
+def sums(table, rows, group_column, column, block_rows):
+    """
+    Sums of the values and counts of the rows of every group within every block
+    returns OrderedDict which maps each group (in the order they were first seen) to a dictionary which maps each
+    block to [sum, count]
+    """
+    groups = OrderedDict()
+    keys = table[group_column] if group_column is not None else None
+    values = table[column]
+    for i in rows:
+        key = None if keys is None else keys[i]
+        per_block = groups.get(key)
+        if per_block is None:
+            per_block = groups[key] = {}
+        totals = per_block.get(i // block_rows)
+        if totals is None:
+            per_block[i // block_rows] = [values[i], 1]
+        else:
+            totals[0] += values[i]
+            totals[1] += 1
+    return groups
+
+
+def scaled(per_block, fun, sample):
+    """
+    Estimate of the aggregate of a group over the whole table from its sums within the picked blocks, along with the
+    half width of its 95% confidence interval. Each is a ratio estimate : AVG is the sum over the count of the sampled
+    rows of the group, SUM and COUNT are their sum and count per sampled row (of any group) scaled up to all the rows
+    of the table, so that the short last block does not skew them. The error is by linearization of the ratio, blocks
+    without rows of the group count as zeros.
+    """
+    picked = len(sample.blocks)
+    fraction = picked / sample.n_blocks
+    y, x = [], []
+    for block in sample.blocks:
+        totals = per_block.get(block, (0, 0))
+        y.append(totals[0] if fun != 'COUNT' else totals[1])
+        x.append(totals[1] if fun == 'AVG' else sample.size(block))
+    ratio = sum(y) / sum(x)
+    squares = sum((yi - ratio * xi) ** 2 for yi, xi in zip(y, x))
+    variance = (1 - fraction) * squares / max(1, picked - 1) / (picked * (sum(x) / picked) ** 2)
+    if fun == 'AVG':
+        value = ratio
+    else:
+        value = int(round(ratio * sample.n_rows))
+        variance *= sample.n_rows ** 2
+    if picked < 2 and fraction < 1:
+        return value, float("inf")
+    return value, round(Z_95 * math.sqrt(variance), 2)
+
+
+def estimate(table, rows, group_column, col_operation, sample, names):
+    """
+    Estimates the aggregates over the whole table from its sampled rows which satisfy the WHERE conditions, SUM, COUNT
+    and AVG with an error bound column (ERROR(SUM(col)) is the half width of the 95% confidence interval) next to them
+    args : table -> Relation (the base table)
+            rows -> selection vector of the sampled rows satisfying the conditions (rows of the picked blocks)
+            group_column -> grouped column (None aggregates all the rows together)
+            col_operation -> a dictionary which maps cols to aggregate functions
+            sample -> BlockSample of the table
+            names -> maps cols to the names of their aggregate columns
+    returns the table (in column form) group_by would give, or without group_column one row with the aggregates
+    """
+    result = OrderedDict()
+    groups = None
+    for key, fun in col_operation.items():
+        column = key if key != '*' else (group_column if group_column is not None else next(iter(table)))
+        if column not in table.keys():
+            raise NotImplementedError("Table does not have any column named " + str(key))
+        if fun not in ESTIMATED + ("MIN", "MAX"):
+            raise NotImplementedError(str(fun) + " function can not be estimated from TABLESAMPLE")
+        per_group = sums(table, rows, group_column, column, sample.block_rows)
+        if groups is None:
+            groups = list(per_group.keys())
+        if fun in ESTIMATED:
+            if group_column is None and len(per_group) == 0:
+                per_group[None] = {}
+            values, errors = [], []
+            for group in (groups if group_column is not None else [None]):
+                if len(per_group[group]) > 0:
+                    value, error = scaled(per_group[group], fun, sample)
+                else:
+                    # no sampled rows, SUM and AVG are NULL as for an exact query
+                    value, error = (0, 0.0) if fun == 'COUNT' else (pipeline.Aggregate.empty(fun), None)
+                values.append(value)
+                errors.append(error)
+            result[names[key]] = values
+            result[error_name(names[key])] = errors
+        else:
+            values = [table[column][i] for i in rows]
+            keys = [table[group_column][i] for i in rows] if group_column is not None else [None] * len(values)
+            extreme = {}
+            for k, v in zip(keys, values):
+                if k not in extreme or (v < extreme[k] if fun == 'MIN' else v > extreme[k]):
+                    extreme[k] = v
+            # bounded like aggregate does, grouped or not
+            bound = int(1e9) if fun == 'MIN' else int(-1e9)
+            values = [extreme.get(group, bound) for group in (groups if group_column is not None else [None])]
+            result[names[key]] = [min(bound, value) if fun == 'MIN' else max(bound, value) for value in values]
+    if group_column is not None:
+        result[group_column] = groups if groups is not None else []
+    return result
+
+
+def with_errors(columns, table):
+    """
+    The selected columns, each aggregate followed by its error bound column if the table has one
+    """
+    result = []
+    for column in columns:
+        result.append(column)
+        if error_name(column) in table.keys():
+            result.append(error_name(column))
+    return result
@@ -0,0 +1,198 @@
+import json
+import functools
+from collections import OrderedDict
+from pipeline import Aggregate
+
+try:
+    import numpy as np
+except ImportError:  # numpy selection vectors are possible only when numpy is installed
+    np = None
+
+
+def is_array(values):
+    return np is not None and isinstance(values, np.ndarray)
+
+
+def intersect(selections, n_rows):
+    """
+    Rows (ascending) found in all the selection vectors, each of them ascending, of a table of n_rows rows
+    """
+    selections = sorted(selections, key=len)
+    if is_array(selections[0]):
+        rows = selections[0]
+        for other in selections[1:]:
+            found = np.zeros(n_rows, dtype=bool)
+            found[other] = True
+            rows = rows[found[rows]]
+        return rows
+    others = [set(rows) for rows in selections[1:]]
+    return [i for i in selections[0] if all(i in rows for rows in others)]
+
+
+def union(selections, n_rows):
+    """
+    Rows (ascending) found in any of the selection vectors
+    """
+    if is_array(selections[0]):
+        found = np.zeros(n_rows, dtype=bool)
+        for rows in selections:
+            found[rows] = True
+        return np.flatnonzero(found)
+    return sorted(set().union(*selections))
+
+
+class SharedScans:
+    """
+    Work shared by the queries of a batch (see main.run_batch). The batch is planned up front : the single table
+    conditions of all its queries are collected per table and each distinct condition is evaluated once, in one
+    shared scan of the table, the pushed down filters of the queries are then combined from these rows. The joins,
+    the rows left after the other conditions and the aggregates are computed for the first query needing them and
+    reused by the later ones, the aggregates asked for by the queries grouping the same rows are computed together.
+    Everything is keyed by the (mtime, size) of the tables as they were loaded, so a table which changes during the
+    batch is not served stale results.
+    """
+
+    def __init__(self, minisql, infos):
+        """
+        args : minisql -> MiniSQL instance having the database
+                infos -> dictionaries given by MySQLParser for the queries of the batch
+        """
+        self.minisql = minisql
+        self.conditions = OrderedDict()  # table -> json of condition -> condition, the distinct conditions on it
+        self.matched = OrderedDict()  # (table, json of condition) -> selection vector of the rows satisfying it
+        self.scanned = OrderedDict()  # table -> (mtime, size) of its CSV file when it was scanned
+        self.aggregates = OrderedDict()  # (rows key, grouped column) -> (column, function) pairs of the batch
+        self.results = OrderedDict()  # key -> joined rows, filtered rows or aggregate computed for the batch
+        tables = []
+        for info in infos:
+            tables.extend(table for table in info["tables"] if table not in tables)
+        tables = [table for table in tables if table in minisql.tableInfo.keys()]
+        minisql.refresh(tables)
+        for table in tables:
+            minisql.database[table]  # loads the table (and builds its indexes) if needed
+        for info in infos:
+            self.plan(info)
+        for table in self.conditions.keys():
+            self.scan(table)
+
+    def keys(self, info):
+        """
+        Keys of the joined rows of the query (its tables, pushed down conditions and join conditions) and of the rows
+        left after its other conditions, queries with equal keys share them
+        returns (join key, rows key), (None, None) if the query is not shared : TABLESAMPLE, WHERE on aggregates and
+                LIMIT stopping the scans early
+        """
+        minisql = self.minisql
+        tables = info["tables"]
+        if info["sample"] is not None or any(table not in minisql.tableInfo.keys() for table in tables) or (
+                info["hasgroupby"] and any('(' in first for first, _, _ in info["conditions"])) or (
+                info["limit"] is not None and not info["hasgroupby"] and not info["hasorderby"]):
+            return None, None
+        op = info["between_cond_op"]
+        per_table, remaining = OrderedDict(), []
+        if info["where"]:
+            per_table, remaining = minisql.split_conditions(tables, info["conditions"], op)
+        join_conditions = None
+        if len(remaining) == 1 or (len(remaining) > 1 and op == "AND"):
+            join_conditions = sorted(remaining)
+        pushed = sorted([table, sorted(conds)] for table, conds in per_table.items())
+        join_key = json.dumps(["join", tables, pushed, op, join_conditions, minisql.loaded_stamp(tables)])
+        return join_key, json.dumps(["rows", join_key, sorted(remaining)])
+
+    def plan(self, info):
+        """
+        Collects the conditions of the query to be evaluated by the shared scans, and the aggregates it asks for
+        """
+        _, rows_key = self.keys(info)
+        if rows_key is None:
+            return
+        if info["where"]:
+            per_table, _ = self.minisql.split_conditions(info["tables"], info["conditions"], info["between_cond_op"])
+            for table, conds in per_table.items():
+                for cond in conds:
+                    self.conditions.setdefault(table, OrderedDict())[json.dumps(cond)] = cond
+        if info["hasgroupby"]:
+            wanted = self.aggregates.setdefault((rows_key, info["groupby"][0]), [])
+            for pair in self.minisql.column_operations(info["columns"]).items():
+                if pair not in wanted:
+                    wanted.append(pair)
+
+    def scan(self, table):
+        """
+        Evaluates every distinct condition of the batch on the table once, by its index if one serves it (by the
+        worker processes if the table is big enough)
+        """
+        minisql = self.minisql
+        relation = minisql.database[table]
+        for text, cond in self.conditions[table].items():
+            try:
+                matched = minisql.index_lookup(cond, minisql.indexes.get(table))
+                if matched is None and minisql.use_parallel(table, [cond]):
+                    matched = minisql.parallel.filter(table, relation, minisql.row_count(relation), [cond], "AND")
+                elif matched is None:
+                    matched = minisql.custom_filter(relation, cond)
+            except (NotImplementedError, LookupError, ValueError, TypeError, ArithmeticError):
+                continue  # the query having it fails on its turn
+            self.matched[(table, text)] = matched
+        self.scanned[table] = minisql.stamps.get(table)
+
+    def memo(self, key, compute):
+        """
+        Gives the result kept for the key, compute() the first time
+        """
+        if key not in self.results:
+            self.results[key] = compute()
+        return self.results[key]
+
+    def filter(self, table, conds, op):
+        """
+        Rows of the table satisfying the conditions joined by op ('AND' or 'OR'), combined from the rows each
+        condition matched in the shared scan
+        returns the selection vector, None if the shared scan did not evaluate all the conditions (or the table
+                changed since)
+        """
+        if table not in self.scanned or self.scanned[table] != self.minisql.stamps.get(table):
+            return None
+        selections = [self.matched.get((table, json.dumps(cond))) for cond in conds]
+        if any(rows is None for rows in selections):
+            return None
+        if len(selections) == 1:
+            return selections[0]
+        key = json.dumps(["filter", table, sorted(conds), op, self.scanned[table]])
+        n_rows = self.minisql.row_count(self.minisql.database[table])
+        return self.memo(key, lambda: intersect(selections, n_rows) if op == "AND" else union(selections, n_rows))
+
+    def group_by(self, key, table, rows, column, col_operation):
+        """
+        Same as MiniSQL.group_by on the selected rows, along with the aggregates of the same rows and grouped column
+        asked for by the other queries of the batch. An aggregate is computed once, a column aggregated by several
+        functions takes several rounds as col_operation maps a column to one function.
+        args : key -> rows key of the query, as given by keys
+        """
+        minisql = self.minisql
+        if len(col_operation) == 0:
+            return minisql.group_by(minisql.select_rows(table, rows, [column]), column, col_operation)
+        wanted = list(col_operation.items()) + [
+            (agg_column, fun) for agg_column, fun in self.aggregates.get((key, column), [])
+            if (agg_column == '*' or agg_column in table.keys()) and fun in Aggregate.FUNCTIONS]
+        missing = []
+        for pair in wanted:
+            if json.dumps(["group", key, column, pair]) not in self.results and pair not in missing:
+                missing.append(pair)
+        while len(missing) > 0:
+            col_op = OrderedDict()
+            for agg_column, fun in missing:
+                col_op.setdefault(agg_column, fun)
+            needed = minisql.needed_columns(table, [column] + list(col_op.keys()))
+            grouped = minisql.group_by(minisql.select_rows(table, rows, needed), column, col_op)
+            for agg_column, name in minisql.new_cols(col_op).items():
+                pair = (agg_column, col_op[agg_column])
+                self.results[json.dumps(["group", key, column, pair])] = (grouped[column], grouped[name])
+            missing = [pair for pair in missing if col_op[pair[0]] != pair[1]]
+        result = OrderedDict()
+        groups = None
+        for agg_column, name in minisql.new_cols(col_operation).items():
+            groups, values = self.results[json.dumps(["group", key, column, (agg_column, col_operation[agg_column])])]
+            result[name] = values
+        result[column] = groups
+        return result
@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import resource
+import argparse
+from collections import OrderedDict
+from client import read_queries
+from main import MiniSQL, MySQLParser, run_query
+from explain import NullOutput, join_operator
+
+try:
+    import numpy as np
+except ImportError:  # without numpy the data is generated with the random module
+    np = None
+
+GENERATE_CHUNK = 1 << 20  # rows generated and written at a time
+
+# workloads run besides the queries of sampleQueries.txt, on the schema of metadata.txt
+WORKLOADS = OrderedDict([
+    ("join", ["SELECT act_id_am mov_year FROM actor_movie movie WHERE mov_id_am = mov_id_m;",
+              "SELECT * FROM actor actor_movie WHERE act_id_a = act_id_am AND act_gender = 1;",
+              "SELECT act_id_a mov_year FROM actor actor_movie movie WHERE act_id_a = act_id_am AND "
+              "mov_id_am = mov_id_m AND mov_year > 2000;",
+              "SELECT dir_id_dm earnings FROM director_movie movie WHERE mov_id_dm = mov_id_m LIMIT 100;"]),
+    ("groupby", ["SELECT COUNT(*) act_id_am FROM actor_movie GROUP BY act_id_am;",
+                 "SELECT AVG(earnings) mov_year FROM movie GROUP BY mov_year;",
+                 "SELECT MAX(mov_time) mov_year FROM movie WHERE earnings > 10000000 "
+                 "GROUP BY mov_year;",
+                 "SELECT SUM(earnings) act_id_am FROM actor_movie movie WHERE mov_id_am = mov_id_m "
+                 "GROUP BY act_id_am;"]),
+    ("orderby", ["SELECT mov_id_m earnings FROM movie ORDER BY earnings DESC;",
+                 "SELECT mov_id_m earnings FROM movie ORDER BY earnings DESC LIMIT 10;",
+                 "SELECT act_id_am mov_id_am FROM actor_movie ORDER BY mov_id_am;",
+                 "SELECT DISTINCT mov_year FROM movie ORDER BY mov_year;"]),
+])
+
+
+def parse_rows(text):
+    """
+    Gives the number of rows for a scale like 10000, 10K or 100M
+    """
+    text = text.strip().upper()
+    scale = {"K": 10 ** 3, "M": 10 ** 6, "G": 10 ** 9}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale != 1 else text) * scale)
+
+
+def read_schema(metadata):
+    """
+    Gives the tables of metadata.txt as an OrderedDict of table name -> list of columns
+    """
+    schema = OrderedDict()
+    table = None
+    with open(metadata) as info_file:
+        for line in info_file:
+            line = line.strip()
+            if line == "<begin_table>":
+                table = ""
+            elif line == "<end_table>" or line.startswith("<index") or line == "":
+                continue
+            elif table == "":
+                table = line
+                schema[table] = []
+            elif table is not None:
+                schema[table].append(line)
+    return schema
+
+
+def column_ranges(source, schema):
+    """
+    Gives (min, max) of every column of the CSV files of the schema found in the source directory, the generated
+    values are drawn from the same ranges
+    """
+    ranges = {}
+    for table, columns in schema.items():
+        path = os.path.join(source, table + ".csv")
+        if not os.path.isfile(path):
+            continue
+        with open(path) as csv_file:
+            for line in csv_file:
+                if line.strip() == "":
+                    continue
+                for column, value in zip(columns, line.split(",")):
+                    low, high = ranges.get(column, (int(value), int(value)))
+                    ranges[column] = (min(low, int(value)), max(high, int(value)))
+    return ranges
+
+
+def key_owners(schema):
+    """
+    Columns named <entity>_id_<suffix> are keys, the first table having a key of an entity owns it (its values are
+    unique) and the keys of that entity in the other tables refer to it
+    returns dictionary which maps each key column to the key column it refers to (itself for the owner)
+    """
+    owners = {}
+    refers = {}
+    for table, columns in schema.items():
+        for column in columns:
+            entity = column.rsplit("_", 1)[0]
+            if not entity.endswith("_id"):
+                continue
+            owners.setdefault(entity, column)
+            refers[column] = owners[entity]
+    return refers
+
+
+def zipf_ranks(n_keys, skew, uniform):
+    """
+    Maps uniform samples in [0, 1) to ranks in [0, n_keys) following a (continuous) zipf law with exponent skew, 0
+    gives uniform ranks. The inverse of the distribution function is used, so no table of n_keys weights is needed.
+    args : uniform -> numpy array or list of samples
+    """
+    if np is not None and isinstance(uniform, np.ndarray):
+        if skew == 0:
+            x = uniform * n_keys
+        elif skew == 1:
+            x = np.power(float(n_keys + 1), uniform) - 1
+        else:
+            x = np.power((math.pow(n_keys + 1, 1 - skew) - 1) * uniform + 1, 1 / (1 - skew)) - 1
+        return np.minimum(x.astype(np.int64), n_keys - 1)
+    if skew == 0:
+        return [min(int(u * n_keys), n_keys - 1) for u in uniform]
+    if skew == 1:
+        return [min(int(math.pow(n_keys + 1, u) - 1), n_keys - 1) for u in uniform]
+    base = math.pow(n_keys + 1, 1 - skew) - 1
+    return [min(int(math.pow(base * u + 1, 1 / (1 - skew)) - 1), n_keys - 1) for u in uniform]
+
+
+def generate(directory, n_rows, skew=0.0, seed=0, source="."):
+    """
+    Writes metadata.txt (copied from source) and a CSV file of n_rows rows for every table of it to directory.
+    Key columns are unique in the table owning them and follow a zipf law of exponent skew in the tables referring
+    to them, the other columns are uniform over the range of the column in the CSV files of source.
+    """
+    os.makedirs(directory, exist_ok=True)
+    shutil.copyfile(os.path.join(source, "metadata.txt"), os.path.join(directory, "metadata.txt"))
+    schema = read_schema(os.path.join(source, "metadata.txt"))
+    ranges = column_ranges(source, schema)
+    refers = key_owners(schema)
+    rng = np.random.default_rng(seed) if np is not None else random.Random(seed)
+    for table, columns in schema.items():
+        start = time.perf_counter()
+        with open(os.path.join(directory, table + ".csv"), "w", buffering=1 << 20) as csv_file:
+            for low in range(0, n_rows, GENERATE_CHUNK):
+                size = min(GENERATE_CHUNK, n_rows - low)
+                values = []
+                for column in columns:
+                    first, last = ranges.get(refers.get(column, column), (0, 1000000))
+                    if refers.get(column) == column:
+                        values.append(range(first + low, first + low + size))
+                    elif column in refers:
+                        uniform = rng.random(size) if np is not None else [rng.random() for _ in range(size)]
+                        ranks = zipf_ranks(n_rows, skew, uniform)
+                        values.append((ranks + first).tolist() if np is not None else [first + r for r in ranks])
+                    elif np is not None:
+                        values.append(rng.integers(first, last + 1, size).tolist())
+                    else:
+                        values.append([rng.randint(first, last) for _ in range(size)])
+                csv_file.write("".join(",".join(map(str, row)) + "\n" for row in zip(*values)))
+        print("{} : {} rows in {:.2f} s".format(table, n_rows, time.perf_counter() - start))
+
+
+def percentile(values, fraction):
+    """
+    Nearest rank percentile of the values
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def peak_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == "darwin" else usage  # bytes on macOS, KB elsewhere
+
+
+def run(directory, workloads, repeat=5, sample_queries="sampleQueries.txt", max_product=10 ** 7, **options):
+    """
+    Runs every query of the workloads repeat times (after one warm up run, which loads the tables) on the data of
+    directory, the results are not printed
+    args : workloads -> names of the workloads, "sample" is the queries of sample_queries
+            max_product -> the queries joining tables of more rows than this by a cartesian product are skipped
+            options -> arguments of MiniSQL (backend, workers, stream, ...)
+    returns OrderedDict of the settings and, for every query, its latencies and rows/s
+    """
+    queries = []
+    for workload in workloads:
+        if workload == "sample":
+            with open(sample_queries) as query_file:
+                queries.extend(("sample", query) for query in read_queries(query_file))
+        elif workload in WORKLOADS:
+            queries.extend((workload, query) for query in WORKLOADS[workload])
+        else:
+            raise NotImplementedError(str(workload) + " workload is not defined in the benchmark")
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        minisql = MiniSQL(out=NullOutput(), result_cache=False, **options)
+        results = []
+        for workload, query in queries:
+            result = OrderedDict([("workload", workload), ("query", query)])
+            try:
+                info = MySQLParser.parse_cached(query)
+                sizes = [MiniSQL.row_count(minisql.database[table]) for table in info["tables"]]
+                remaining = minisql.split_conditions(info["tables"], info["conditions"], info["between_cond_op"])[1]
+                product = math.prod(sizes)
+                if join_operator(minisql, info["tables"], remaining) == "CartesianProduct" and product > max_product:
+                    result["error"] = "skipped : cartesian product of " + str(product) + " rows"
+                    results.append(result)
+                    continue
+                run_query(minisql, query)
+                latencies = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    run_query(minisql, query)
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                result["error"] = type(e).__name__ + " : " + str(e)
+                results.append(result)
+                continue
+            scanned = sum(sizes)
+            result["rows"] = scanned
+            result["p50"] = percentile(latencies, 0.5)
+            result["p90"] = percentile(latencies, 0.9)
+            result["p99"] = percentile(latencies, 0.99)
+            result["mean"] = sum(latencies) / len(latencies)
+            result["rows_per_s"] = scanned / max(result["p50"], 1e-9)
+            results.append(result)
+    finally:
+        os.chdir(cwd)
+    report = OrderedDict([("directory", directory), ("repeat", repeat), ("options", options),
+                          ("peak_rss_kb", peak_rss_kb()), ("queries", results)])
+    return report
+
+
+def show_report(report, baseline=None, threshold=0.1):
+    """
+    Prints the latencies of every query, with a baseline the change of the median latency of every query and the
+    queries which got slower by more than threshold
+    returns the number of such regressions
+    """
+    old = {}
+    if baseline is not None:
+        old = {(entry["workload"], entry["query"]): entry for entry in baseline["queries"] if "p50" in entry}
+    regressions = 0
+    print("{:<8} {:>10} {:>10} {:>10} {:>14} {:>9}  {}".format("workload", "p50 ms", "p90 ms", "p99 ms", "rows/s",
+                                                              "change", "query"))
+    for entry in report["queries"]:
+        if "error" in entry:
+            print("{:<8} {:>56}  {}".format(entry["workload"], entry["error"][:56], entry["query"]))
+            continue
+        change = ""
+        before = old.get((entry["workload"], entry["query"]))
+        if before is not None:
+            ratio = entry["p50"] / max(before["p50"], 1e-9) - 1
+            change = "{:+.1%}".format(ratio)
+            if ratio > threshold:
+                change += " !"
+                regressions += 1
+        print("{:<8} {:>10.3f} {:>10.3f} {:>10.3f} {:>14.0f} {:>9}  {}".format(
+            entry["workload"], entry["p50"] * 1000, entry["p90"] * 1000, entry["p99"] * 1000, entry["rows_per_s"],
+            change, entry["query"]))
+    print("peak RSS : {} KB".format(report["peak_rss_kb"]) + (
+        " (baseline {} KB)".format(baseline["peak_rss_kb"]) if baseline is not None else ""))
+    if baseline is not None:
+        print("{} queries slower than the baseline by more than {:.0%}".format(regressions, threshold))
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Mini SQL benchmark")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    gen_parser = commands.add_parser("generate", help="generate synthetic tables of the schema of metadata.txt")
+    gen_parser.add_argument("directory", help="directory for metadata.txt and the CSV files")
+    gen_parser.add_argument("--rows", default="10K", help="rows of every table, like 10000, 10K or 100M")
+    gen_parser.add_argument("--skew", type=float, default=0.0,
+                            help="zipf exponent of the keys referring to other tables (0 is uniform)")
+    gen_parser.add_argument("--seed", type=int, default=0)
+    gen_parser.add_argument("--source", default=".", help="directory having metadata.txt and the sample CSV files")
+    run_parser = commands.add_parser("run", help="run the workloads and report their latencies")
+    run_parser.add_argument("directory", help="directory made by generate")
+    run_parser.add_argument("--workloads", default="sample," + ",".join(WORKLOADS.keys()),
+                            help="comma separated workloads among sample, " + ", ".join(WORKLOADS.keys()))
+    run_parser.add_argument("--repeat", type=int, default=5, help="timed runs of every query")
+    run_parser.add_argument("--backend", choices=["list", "numpy", "compact"], default="list")
+    run_parser.add_argument("--workers", type=int, default=1)
+    run_parser.add_argument("--stream", action="store_true")
+    run_parser.add_argument("--no-cache", action="store_true")
+    run_parser.add_argument("--max-product", type=int, default=10 ** 7,
+                            help="skip the queries joining tables of more rows by a cartesian product")
+    run_parser.add_argument("--output", metavar="FILE", help="save the report as JSON, to be used as a baseline")
+    run_parser.add_argument("--baseline", metavar="FILE", help="compare with a report saved by --output")
+    run_parser.add_argument("--threshold", type=float, default=0.1,
+                            help="slow down of the median latency counted as a regression")
+    args = arg_parser.parse_args()
+    if args.command == "generate":
+        generate(args.directory, parse_rows(args.rows), args.skew, args.seed, args.source)
+        return
+    report = run(args.directory, args.workloads.split(","), args.repeat,
+                 sample_queries=os.path.abspath("sampleQueries.txt"), max_product=args.max_product,
+                 backend=args.backend, workers=args.workers, stream=args.stream,
+                 cache_dir=None if args.no_cache else ".minisql_cache")
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    regressions = show_report(report, baseline, args.threshold)
+    if args.output is not None:
+        with open(args.output, "w") as report_file:
+            json.dump(report, report_file, indent=1)
+    sys.exit(1 if regressions > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import sys
+import socket
+import argparse
+from server import parse_address, read_message
+
+
+class MiniSQLClient:
+    """
+    Client of a Mini SQL server started with main.py --listen, one connection is used for all the queries
+    """
+
+    def __init__(self, address):
+        is_unix, address = parse_address(address)
+        self.sock = socket.socket(socket.AF_UNIX if is_unix else socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.stream = self.sock.makefile("rwb")
+
+    def query(self, query):
+        """
+        Runs the query on the server
+        returns the printed output of the query, raises RuntimeError with the server's message if it failed
+        """
+        self.stream.write((" ".join(query.split()) + "\n").encode())
+        self.stream.flush()
+        status, payload = read_message(self.stream)
+        if status is None:
+            raise ConnectionError("Mini SQL server closed the connection")
+        if status != "OK":
+            raise RuntimeError(payload)
+        return payload
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+
+def read_queries(lines):
+    """
+    Splits the lines of a workload file into queries, a query ends with ';' and can span several lines
+    """
+    current = []
+    for line in lines:
+        line = line.strip()
+        if line == "":
+            continue
+        if line.upper() == "QUIT" and len(current) == 0:
+            return
+        current.append(line)
+        if line.endswith(';'):
+            yield " ".join(current)
+            current = []
+    if len(current) > 0:
+        yield " ".join(current)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Mini SQL client")
+    arg_parser.add_argument("address", help="unix socket path or HOST:PORT of the server")
+    arg_parser.add_argument("queries", nargs="*", help="queries to be run, else they are read from --file or stdin")
+    arg_parser.add_argument("--file", help="file having the queries, each ending with ';'")
+    args = arg_parser.parse_args()
+    if len(args.queries) > 0:
+        queries = args.queries
+    elif args.file is not None:
+        with open(args.file) as query_file:
+            queries = list(read_queries(query_file))
+    else:
+        queries = read_queries(sys.stdin)
+    client = MiniSQLClient(args.address)
+    failed = False
+    try:
+        for query in queries:
+            try:
+                sys.stdout.write(client.query(query))
+            except RuntimeError as e:
+                failed = True
+                print(query + "\n" + str(e), file=sys.stderr)
+    finally:
+        client.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
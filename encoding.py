@@ -0,0 +1,352 @@
+import bisect
+import operator
+import itertools
+from array import array
+from collections import Counter, OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # the encoded columns are decoded in python without numpy
+    np = None
+
+INT_TYPES = ('b', 'h', 'i', 'l', 'q')  # signed typecodes of the array module, narrowest first
+CODE_TYPES = ('B', 'H', 'I', 'L', 'Q')  # unsigned typecodes for the codes of a dictionary encoded column
+MAX_DICTIONARY = 1 << 16  # a column with more distinct values than these is not dictionary encoded
+BOX_BYTES = 36  # bytes taken by a value of a python list (pointer and int object), to compare with
+
+
+def int_type(low, high):
+    """
+    Narrowest signed typecode of the array module holding the values from low to high
+    """
+    for typecode in INT_TYPES:
+        bits = 8 * array(typecode).itemsize
+        if -(1 << (bits - 1)) <= low and high < (1 << (bits - 1)):
+            return typecode
+    raise OverflowError("values do not fit in 64 bits")
+
+
+def code_type(n_codes):
+    """
+    Narrowest unsigned typecode of the array module holding the codes 0 to n_codes - 1
+    """
+    for typecode in CODE_TYPES:
+        if n_codes <= 1 << (8 * array(typecode).itemsize):
+            return typecode
+    raise OverflowError("too many codes")
+
+
+def widen(values, typecode):
+    """
+    The array with its values in an array of the typecode, if that is wider
+    """
+    if array(typecode).itemsize > values.itemsize:
+        return array(typecode, values)
+    return values
+
+
+def test(operator_name, value):
+    """
+    Function (implemented in C) telling whether a value v satisfies 'v operator value'
+    """
+    tests = {'=': value.__eq__, '<': value.__gt__, '>': value.__lt__, '>=': value.__le__, '<=': value.__ge__}
+    if operator_name not in tests:
+        raise NotImplementedError(str(operator_name) + " is not implemented in Mini SQL")
+    return tests[operator_name]
+
+
+def bounded(fun, values, n_rows):
+    """
+    Aggregate of a column from its distinct values (values) and number of rows, as MiniSQL.aggregate gives it
+    """
+    if fun == 'MAX':
+        return max(int(-1e9), max(values))
+    elif fun == 'MIN':
+        return min(int(1e9), min(values))
+    elif fun == 'COUNT':
+        return n_rows
+    elif fun == 'COUNT_DISTINCT':
+        return len(set(values))
+    return None
+
+
+class EncodedColumn:
+    """
+    Column of a table stored in a compact encoding. It is read like a list : len, indexing (a slice gives a list)
+    and iteration decode the values, appended rows are added with extend. The filters on a constant and the
+    aggregates of the whole column run on the encoded values.
+    """
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.value(j) for j in range(*i.indices(self.n_rows))]
+        if i < 0:
+            i += self.n_rows
+        if not 0 <= i < self.n_rows:
+            raise IndexError("list index out of range")
+        return self.value(i)
+
+    def take(self, rows):
+        """
+        Values (list) of the rows of the selection vector
+        """
+        return [self.value(i) for i in rows]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.fromiter(iter(self), dtype=np.int64 if dtype is None else dtype, count=self.n_rows)
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return "{}({} rows, {} bytes)".format(type(self).__name__, self.n_rows, self.nbytes())
+
+
+class PlainColumn(EncodedColumn):
+    """
+    Values in an array of the narrowest integer type holding them
+    """
+    kind = "plain"
+
+    def __init__(self, values, typecode=None):
+        if typecode is None:
+            typecode = int_type(min(values), max(values)) if len(values) > 0 else 'b'
+        self.values = array(typecode, values)
+        self.n_rows = len(self.values)
+
+    def value(self, i):
+        return self.values[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.values[i].tolist()
+        return self.values[i]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def take(self, rows):
+        return list(map(self.values.__getitem__, rows))
+
+    def extend(self, values):
+        if len(values) == 0:
+            return
+        self.values = widen(self.values, int_type(min(values), max(values)))
+        self.values.extend(values)
+        self.n_rows = len(self.values)
+
+    def filter(self, operator_name, value, rows=None):
+        passes = test(operator_name, value)
+        if rows is None:
+            return list(itertools.compress(range(self.n_rows), map(passes, self.values)))
+        return list(itertools.compress(rows, map(passes, map(self.values.__getitem__, rows))))
+
+    def aggregate(self, fun):
+        if fun in ('SUM', 'AVG'):
+            total = sum(self.values)
+            return total if fun == 'SUM' else total / self.n_rows
+        return bounded(fun, self.values, self.n_rows)
+
+    def counts(self):
+        return Counter(self.values)
+
+    def nbytes(self):
+        return self.values.itemsize * len(self.values)
+
+
+class DictionaryColumn(EncodedColumn):
+    """
+    Distinct values of the column (in the order they were first seen) and the code of every row, the position of its
+    value among them, in an array of the narrowest unsigned type. The number of rows of each code is kept, so the
+    aggregates of the whole column look at the distinct values only, and a filter checks each distinct value once.
+    """
+    kind = "dictionary"
+
+    def __init__(self, values):
+        self.dictionary = []
+        self.codes_of = {}  # value -> code
+        self.codes = array('B')
+        self.code_rows = []  # code -> number of rows having it
+        self.n_rows = 0
+        self.extend(values)
+
+    def value(self, i):
+        return self.dictionary[self.codes[i]]
+
+    def __iter__(self):
+        return map(self.dictionary.__getitem__, self.codes)
+
+    def take(self, rows):
+        return list(map(self.dictionary.__getitem__, map(self.codes.__getitem__, rows)))
+
+    def extend(self, values):
+        codes = []
+        for v in values:
+            code = self.codes_of.get(v)
+            if code is None:
+                code = self.codes_of[v] = len(self.dictionary)
+                self.dictionary.append(v)
+                self.code_rows.append(0)
+            codes.append(code)
+        self.codes = widen(self.codes, code_type(len(self.dictionary)))
+        self.codes.extend(codes)
+        for code, n in Counter(codes).items():
+            self.code_rows[code] += n
+        self.n_rows = len(self.codes)
+
+    def filter(self, operator_name, value, rows=None):
+        passes = test(operator_name, value)
+        table = bytes(1 if passes(v) else 0 for v in self.dictionary)  # code -> whether its value passes
+        if self.codes.typecode == 'B':
+            # every code byte is mapped to its 0 / 1 byte in one call
+            mask = self.codes.tobytes().translate(table + bytes(256 - len(table)))
+        else:
+            mask = bytes(map(table.__getitem__, self.codes))
+        if rows is None:
+            return list(itertools.compress(range(self.n_rows), mask))
+        return list(itertools.compress(rows, map(mask.__getitem__, rows)))
+
+    def aggregate(self, fun):
+        if fun in ('SUM', 'AVG'):
+            total = sum(v * n for v, n in zip(self.dictionary, self.code_rows))
+            return total if fun == 'SUM' else total / self.n_rows
+        return bounded(fun, self.dictionary, self.n_rows)
+
+    def counts(self):
+        return dict(zip(self.dictionary, self.code_rows))
+
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes) + BOX_BYTES * len(self.dictionary)
+
+
+class RunLengthColumn(EncodedColumn):
+    """
+    Runs of equal consecutive values, the value of every run and the row its run ends at (exclusive), suits sorted
+    or clustered columns. A row is found by binary search over the run ends.
+    """
+    kind = "run length"
+
+    def __init__(self, values):
+        self.values = array('b')
+        self.ends = array('q')
+        self.n_rows = 0
+        self.extend(values)
+
+    def value(self, i):
+        return self.values[bisect.bisect_right(self.ends, i)]
+
+    def __iter__(self):
+        starts = itertools.chain((0,), self.ends)
+        return itertools.chain.from_iterable(
+            itertools.repeat(v, end - start) for v, start, end in zip(self.values, starts, self.ends))
+
+    def take(self, rows):
+        ends = self.ends
+        run = 0
+        result = []
+        previous = -1
+        for i in rows:
+            if i < previous:
+                run = bisect.bisect_right(ends, i)  # the rows are not ascending, the run is searched for again
+            elif ends[run] <= i:
+                run = bisect.bisect_right(ends, i, run)
+            previous = i
+            result.append(self.values[run])
+        return result
+
+    def extend(self, values):
+        if len(values) == 0:
+            return
+        self.values = widen(self.values, int_type(min(values), max(values)))
+        for v, run in itertools.groupby(values):
+            length = sum(1 for _ in run)
+            if len(self.values) > 0 and self.values[-1] == v:
+                self.ends[-1] += length
+            else:
+                self.values.append(v)
+                self.ends.append(self.n_rows + length)
+            self.n_rows += length
+
+    def filter(self, operator_name, value, rows=None):
+        passes = test(operator_name, value)
+        if rows is None:
+            result = []
+            start = 0
+            for v, end in zip(self.values, self.ends):
+                if passes(v):
+                    result.extend(range(start, end))
+                start = end
+            return result
+        passing = [passes(v) for v in self.values]
+        return [i for i in rows if passing[bisect.bisect_right(self.ends, i)]]
+
+    def aggregate(self, fun):
+        if fun in ('SUM', 'AVG'):
+            starts = itertools.chain((0,), self.ends)
+            total = sum(v * (end - start) for v, start, end in zip(self.values, starts, self.ends))
+            return total if fun == 'SUM' else total / self.n_rows
+        return bounded(fun, self.values, self.n_rows)
+
+    def counts(self):
+        result = {}
+        start = 0
+        for v, end in zip(self.values, self.ends):
+            result[v] = result.get(v, 0) + end - start
+            start = end
+        return result
+
+    def nbytes(self):
+        return (self.values.itemsize + self.ends.itemsize) * len(self.values)
+
+
+def is_encoded(values):
+    return isinstance(values, EncodedColumn)
+
+
+def encode(values):
+    """
+    Encodes a column (list of ints) in the encoding taking the least memory : a plain array of the narrowest type
+    holding its values, dictionary encoding (for at most MAX_DICTIONARY distinct values) or run length encoding
+    """
+    if len(values) == 0:
+        return PlainColumn(values)
+    width = array(int_type(min(values), max(values))).itemsize
+    n_runs = 1 + sum(map(operator.ne, values, itertools.islice(values, 1, None)))
+    sizes = OrderedDict([("plain", width * len(values)), ("run length", (width + 8) * n_runs)])
+    distinct = len(set(values))
+    if distinct <= MAX_DICTIONARY:
+        sizes["dictionary"] = array(code_type(distinct)).itemsize * len(values) + BOX_BYTES * distinct
+    kind = min(sizes, key=sizes.get)
+    if kind == "run length":
+        return RunLengthColumn(values)
+    if kind == "dictionary":
+        return DictionaryColumn(values)
+    return PlainColumn(values)
+
+
+def encode_table(content):
+    """
+    Encodes every column of the table (in column form), see encode
+    """
+    return OrderedDict((column, encode(values)) for column, values in content.items())
+
+
+def describe(content):
+    """
+    Encoding and bytes of every column of the table, with the bytes the columns would take as python lists
+    """
+    parts = []
+    n_bytes = 0
+    n_values = 0
+    for column, values in content.items():
+        if is_encoded(values):
+            parts.append("{} {} ({} B)".format(column, values.kind, values.nbytes()))
+            n_bytes += values.nbytes()
+        else:
+            n_bytes += BOX_BYTES * len(values)
+        n_values += len(values)
+    return "{:.2f} MB encoded, {:.2f} MB as lists : {}".format(n_bytes / 1e6, BOX_BYTES * n_values / 1e6,
+                                                              ", ".join(parts))
@@ -0,0 +1,271 @@
+import re
+import json
+import time
+import tracemalloc
+import contextlib
+from collections import OrderedDict
+from index import INDEX_KINDS
+import approx
+import output
+
+EXPLAIN = re.compile(r"^\s*EXPLAIN((?:\s+(?:ANALYZE|FORMAT\s*=\s*(?:JSON|TEXT)))*)\s+(.*)$", re.IGNORECASE | re.DOTALL)
+
+
+def parse_explain(query):
+    """
+    Splits EXPLAIN [ANALYZE] [FORMAT=JSON|TEXT] <query>
+    returns (analyze, as_json, query)
+    """
+    match = EXPLAIN.match(query)
+    if match is None:
+        raise NotImplementedError("Syntax error in EXPLAIN, use EXPLAIN [ANALYZE] [FORMAT=JSON] <query>")
+    options = match.group(1).upper()
+    return "ANALYZE" in options, re.search(r"FORMAT\s*=\s*JSON", options) is not None, match.group(2)
+
+
+def conditions_text(conditions, op=None):
+    """
+    Gives the conditions as they are written in the query
+    """
+    return (" " + str(op) + " ").join(str(first) + " " + str(operator) + " " + str(second)
+                                       for first, second, operator in conditions)
+
+
+def aggregate_name(column, fun):
+    """
+    Name of the column given by the aggregate function on the column, like COUNT(col) or COUNT(DISTINCT col)
+    """
+    if fun == "COUNT_DISTINCT":
+        return "COUNT(DISTINCT " + column + ")"
+    return fun.upper() + "(" + column + ")"
+
+
+def aggregates_text(col_operation):
+    return ", ".join(aggregate_name(column, fun) for column, fun in col_operation.items())
+
+
+def access_text(minisql, table, conditions):
+    """
+    Tells how the conditions on the base table are checked, using an index, on the worker processes or by a scan
+    """
+    for first, second, operator in conditions:
+        for column, kind in minisql.indexInfo.get(table, []):
+            if column == first and second.isdigit() and operator in INDEX_KINDS[kind].operators:
+                return kind + " index on " + column
+    if minisql.use_parallel(table, conditions):
+        return "scan on " + str(minisql.parallel.workers) + " workers"
+    return "scan"
+
+
+def join_operator(minisql, table_list, conditions):
+    """
+    Name of the operator which join_view runs for the tables
+    """
+    if len(table_list) == 1:
+        return "Scan"
+    if conditions is not None and len(minisql.equi_join_predicates(table_list, conditions)) > 0:
+        return "HashJoin"
+    return "CartesianProduct"
+
+
+def join_order_text(minisql, table_list, predicates, per_table, op):
+    """
+    Tells the order of the joins picked by MiniSQL.join_plan, with the build side and the estimated rows of each join
+    args : per_table -> maps the table names to their pushed down conditions
+    """
+    sizes = OrderedDict((table, minisql.estimate_rows(table, per_table.get(table, ()), op)) for table in table_list)
+    steps = []
+    for table, build, rows in minisql.join_plan(table_list, predicates, sizes):
+        if build is None and len(steps) > 0:
+            build = "cartesian"
+        steps.append(table + ("" if build is None else " (build " + build + ")") + " ~" + str(int(round(rows))))
+    return "(order : " + " -> ".join(steps) + " rows)"
+
+
+def stages(minisql, info, col_op, group_by_first, parallel_table=None, first_rows=None, top_rows=None, sketched=None):
+    """
+    Gives the stages run_query runs for the parsed query (without running them), in order
+    args : info -> dictionary given by MySQLParser
+            col_op -> maps the aggregated columns to their aggregate functions
+            group_by_first -> the WHERE conditions use the aggregates
+            parallel_table -> table aggregated by the worker processes (None if the workers are not used)
+            first_rows, top_rows -> rows needed by LIMIT, as computed by run_query
+            sketched -> (table, column) whose sketch answers the query (see MiniSQL.sketched_column)
+    returns list of (operator, detail)
+    """
+    table_list = info["tables"]
+    for table in table_list:
+        if table not in minisql.tableInfo.keys():
+            raise FileNotFoundError(str(table) + " table does not exist in the database")
+    op = info["between_cond_op"]
+    plan = []
+    remaining = info["conditions"]
+    per_table = OrderedDict()
+    if info["sample"] is not None:
+        detail = table_list[0] + " SYSTEM (" + str(info["sample"]) + "%)"
+        if info["sample_seed"] is not None:
+            detail += " REPEATABLE (" + str(info["sample_seed"]) + ")"
+        plan.append(("TableSample", detail + " in blocks of up to " + str(approx.SAMPLE_BLOCK) + " rows"))
+    if sketched is not None:
+        plan.append(("Sketch", aggregates_text(col_op) + " of " + sketched[0] + " (HyperLogLog of the whole column)"))
+        remaining = []
+    elif parallel_table is not None:
+        detail = aggregates_text(col_op) + " of " + parallel_table
+        if info["where"]:
+            detail += " WHERE " + conditions_text(info["conditions"], op)
+        if info["hasgroupby"]:
+            detail += " GROUP BY " + info["groupby"][0]
+        plan.append(("ParallelAggregate", detail + " on " + str(minisql.parallel.workers) + " workers"))
+        remaining = []
+    elif info["where"] and not group_by_first:
+        per_table, remaining = minisql.split_conditions(table_list, info["conditions"], op)
+        details = [table + " : " + conditions_text(conds, op) + " (" + access_text(minisql, table, conds) + ")"
+                   for table, conds in per_table.items()]
+        plan.append(("PushDownFilter", "; ".join(details) if len(details) > 0 else "no single table conditions"))
+    if parallel_table is None and sketched is None:
+        join_conditions = None
+        if len(remaining) == 1 or (len(remaining) > 1 and op == "AND"):
+            join_conditions = remaining
+        operator = join_operator(minisql, table_list, join_conditions)
+        detail = ", ".join(table_list)
+        if operator == "HashJoin":
+            predicates = minisql.equi_join_predicates(table_list, join_conditions)
+            detail += " on " + conditions_text([(first, second, '=') for first, _, second, _ in predicates], "AND")
+            if len(table_list) >= 3:
+                detail += " " + join_order_text(minisql, table_list, predicates, per_table, op)
+        if first_rows is not None and (join_conditions is not None or len(remaining) == 0):
+            detail += " (first " + str(first_rows) + " rows)"
+        plan.append((operator, detail))
+        if join_conditions is not None:
+            remaining = minisql.residual_conditions(table_list, remaining)
+    group_detail = aggregates_text(col_op) + " GROUP BY " + (info["groupby"][0] if info["hasgroupby"] else "")
+    if group_by_first:
+        plan.append(("GroupBy", group_detail))
+    if len(remaining) > 0:
+        plan.append(("Filter", conditions_text(remaining, op)))
+    aggregated = parallel_table is not None or sketched is not None
+    if info["sample"] is not None and len(col_op) > 0:
+        detail = aggregates_text(col_op) + (" GROUP BY " + info["groupby"][0] if info["hasgroupby"] else "")
+        plan.append(("SampleAggregate", detail + " with 95% error bounds"))
+        aggregated = True
+    if info["hasgroupby"] and not group_by_first and not aggregated:
+        plan.append(("GroupBy", group_detail))
+    if info["hasorderby"]:
+        detail = str(info["orderby"][0]) + " " + info["orderbytype"]
+        plan.append(("OrderBy", detail + (" (top " + str(top_rows) + " rows)" if top_rows is not None else "")))
+    if not info["hasgroupby"] and len(col_op) == 1 and not aggregated:
+        plan.append(("Aggregate", aggregates_text(col_op)))
+    plan.append(("Project", ", ".join(info["columns"])))
+    if info["distinct"]:
+        plan.append(("Distinct", ", ".join(info["columns"])))
+    if info["limit"] is not None or info["offset"] > 0:
+        plan.append(("Limit", "LIMIT " + str(info["limit"]) + " OFFSET " + str(info["offset"])))
+    plan.append(("Output", minisql.output_format))
+    return plan
+
+
+class NullOutput:
+    """
+    File which drops what is written to it, EXPLAIN ANALYZE formats the result but does not print it
+    """
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class Profile:
+    """
+    Wall time, input and output rows and peak memory (traced by tracemalloc) of the operators run by a query, for
+    EXPLAIN ANALYZE. A disabled profile measures nothing.
+    """
+
+    def __init__(self, planned=(), enabled=True):
+        """
+        args : planned -> list of (operator, detail) of the operators expected to run, gives their details
+                enabled -> measure the operators
+        """
+        self.planned = list(planned)
+        self.enabled = enabled
+        self.operators = []  # OrderedDict of the metrics of each operator run
+        self.seconds = 0
+        self.peak_bytes = 0
+        self.tracing = False
+        self.start_time = 0
+        self.base = 0
+
+    def start(self):
+        self.tracing = tracemalloc.is_tracing()
+        if not self.tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.base = tracemalloc.get_traced_memory()[0]
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.start_time
+        self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1] - self.base)
+        if not self.tracing:
+            tracemalloc.stop()
+
+    def detail(self, operator):
+        for i in range(len(self.planned)):
+            if self.planned[i][0] == operator:
+                return self.planned.pop(i)[1]
+        return ""
+
+    def add(self, operator, detail, seconds, rows_in, rows_out, peak_bytes=None):
+        record = OrderedDict([("operator", operator), ("detail", detail), ("seconds", seconds), ("rows_in", rows_in),
+                              ("rows_out", rows_out), ("peak_bytes", peak_bytes)])
+        self.operators.append(record)
+        return record
+
+    @contextlib.contextmanager
+    def stage(self, operator, rows_in=None):
+        """
+        Measures the code run inside the with block, which should set record["rows_out"] (and "rows_in" if it is not
+        known up front)
+        """
+        if not self.enabled:
+            yield OrderedDict()
+            return
+        record = self.add(operator, self.detail(operator), None, rows_in, None)
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            record["peak_bytes"] = peak - current
+            self.peak_bytes = max(self.peak_bytes, peak - self.base)
+
+    def report(self, query, as_json=False):
+        """
+        Prints the metrics, as a table or as one JSON object
+        """
+        if as_json:
+            print(json.dumps(OrderedDict([("query", query), ("seconds", self.seconds),
+                                          ("peak_bytes", self.peak_bytes), ("operators", self.operators)])))
+            return
+        rows = []
+        for record in self.operators:
+            rows.append((record["operator"], record["detail"], "%.3f" % (record["seconds"] * 1000),
+                         "-" if record["rows_in"] is None else record["rows_in"], record["rows_out"],
+                         "-" if record["peak_bytes"] is None else "%.1f" % (record["peak_bytes"] / 1024)))
+        output.write_rows(["operator", "detail", "time (ms)", "rows in", "rows out", "peak (KB)"], [rows])
+        print("Total : %.3f ms, peak memory %.1f KB" % (self.seconds * 1000, self.peak_bytes / 1024))
+
+
+def show_plan(plan, as_json=False):
+    """
+    Prints the plan of EXPLAIN, a list of (operator, detail)
+    """
+    if as_json:
+        print(json.dumps({"plan": [OrderedDict([("operator", operator), ("detail", detail)])
+                                   for operator, detail in plan]}))
+        return
+    output.write_rows(["operator", "detail"], [plan])
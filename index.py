@@ -0,0 +1,150 @@
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # numpy columns are possible only when numpy is installed
+    np = None
+
+
+def is_array(values):
+    return np is not None and isinstance(values, np.ndarray)
+
+
+class HashIndex:
+    """
+    Maps each value of a column to the indices of the rows having it, serves '=' lookups
+    """
+    kind = "hash"
+    operators = ('=',)  # operators of the conditions the index serves
+
+    def __init__(self, values):
+        self.rows = {}
+        if is_array(values):
+            order = np.argsort(values, kind='stable')
+            keys, starts = np.unique(values[order], return_index=True)
+            ends = list(starts[1:]) + [len(order)]
+            for key, start, end in zip(keys.tolist(), starts, ends):
+                self.rows[key] = order[start:end]
+            self.empty = np.zeros(0, dtype=np.int64)
+        else:
+            for i, v in enumerate(values):
+                self.rows.setdefault(v, []).append(i)
+            self.empty = []
+
+    def append(self, values, start):
+        """
+        Adds the rows start, start + 1, ... having the values, which were appended to the column
+        """
+        if is_array(values):
+            index = HashIndex(values)
+            for key, rows in index.rows.items():
+                old = self.rows.get(key)
+                self.rows[key] = rows + start if old is None else np.concatenate((old, rows + start))
+        else:
+            for i, v in enumerate(values, start):
+                self.rows.setdefault(v, []).append(i)
+
+    def lookup(self, operator, value):
+        """
+        Gives the indices (ascending) of the rows whose value satisfies the condition, None if the index can not
+        serve the operator
+        """
+        if operator != '=':
+            return None
+        rows = self.rows.get(value, self.empty)
+        return rows.copy() if is_array(rows) else list(rows)
+
+
+class SortedIndex:
+    """
+    Keeps the row indices sorted by the value of a column, serves '=', '<', '<=', '>' and '>=' lookups by binary search.
+    Appended rows go to a second, smaller sorted run (searched as well), which is merged into the main one once it
+    has an eighth of the rows.
+    """
+    kind = "sorted"
+    operators = ('=', '<', '<=', '>', '>=')
+
+    def __init__(self, values):
+        self.order, self.keys = SortedIndex.sort(values, 0)
+        self.delta_order, self.delta_keys = SortedIndex.sort(values[:0], 0)
+
+    @staticmethod
+    def sort(values, start):
+        """
+        returns (row indices sorted by value, the sorted values), the rows are numbered from start
+        """
+        if is_array(values):
+            order = np.argsort(values, kind='stable')
+            return order + start, values[order]
+        order = sorted(range(len(values)), key=values.__getitem__)
+        return [start + i for i in order], [values[i] for i in order]
+
+    def append(self, values, start):
+        """
+        Adds the rows start, start + 1, ... having the values, which were appended to the column
+        """
+        if len(values) == 0:
+            return
+        if is_array(values):
+            rows = np.concatenate((self.delta_order, np.arange(start, start + len(values))))
+            keys = np.concatenate((self.delta_keys, values))
+        else:
+            rows = list(self.delta_order) + list(range(start, start + len(values)))
+            keys = list(self.delta_keys) + list(values)
+        order, self.delta_keys = SortedIndex.sort(keys, 0)
+        self.delta_order = rows[order] if is_array(rows) else [rows[i] for i in order]
+        if len(self.delta_keys) * 8 > len(self.keys):
+            if is_array(keys):
+                keys = np.concatenate((self.keys, self.delta_keys))
+                order = np.argsort(keys, kind='stable')
+                self.order, self.keys = np.concatenate((self.order, self.delta_order))[order], keys[order]
+            else:
+                keys = list(self.keys) + list(self.delta_keys)
+                rows = list(self.order) + list(self.delta_order)
+                order = sorted(range(len(keys)), key=keys.__getitem__)
+                self.order, self.keys = [rows[i] for i in order], [keys[i] for i in order]
+            self.delta_order, self.delta_keys = self.delta_order[:0], self.delta_keys[:0]
+
+    @staticmethod
+    def bisect(keys, value, right):
+        if is_array(keys):
+            return int(np.searchsorted(keys, value, side='right' if right else 'left'))
+        return bisect_right(keys, value) if right else bisect_left(keys, value)
+
+    @staticmethod
+    def bounds(keys, operator, value):
+        """
+        Gives the (low, high) positions of the sorted keys satisfying the condition, None if the operator can not be
+        served
+        """
+        if operator == '=':
+            return SortedIndex.bisect(keys, value, False), SortedIndex.bisect(keys, value, True)
+        elif operator == '<':
+            return 0, SortedIndex.bisect(keys, value, False)
+        elif operator == '<=':
+            return 0, SortedIndex.bisect(keys, value, True)
+        elif operator == '>':
+            return SortedIndex.bisect(keys, value, True), len(keys)
+        elif operator == '>=':
+            return SortedIndex.bisect(keys, value, False), len(keys)
+        return None
+
+    def lookup(self, operator, value):
+        """
+        Gives the indices (ascending) of the rows whose value satisfies the condition, None if the index can not
+        serve the operator
+        """
+        found = SortedIndex.bounds(self.keys, operator, value)
+        if found is None:
+            return None
+        rows = self.order[found[0]:found[1]]
+        if len(self.delta_keys) > 0:
+            low, high = SortedIndex.bounds(self.delta_keys, operator, value)
+            if is_array(rows):
+                rows = np.concatenate((rows, self.delta_order[low:high]))
+            else:
+                rows = list(rows) + list(self.delta_order[low:high])
+        return np.sort(rows) if is_array(rows) else sorted(rows)
+
+
+INDEX_KINDS = {"hash": HashIndex, "sorted": SortedIndex}
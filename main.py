@@ -1,15 +1,107 @@
 import os
 import copy
-import sqlparse
+import json
 import functools
 import sys
+import re
+import heapq
+import itertools
+import time
+import argparse
 from collections import OrderedDict
+from storage import ColumnCache, ResultCache, SketchStore, file_stamp, read_csv_columns, format_stats
+from index import INDEX_KINDS
+from planner import TableStats, join_order
+from sketch import HyperLogLog, PRECISION, GROUP_PRECISION, group_counts, array_group_counts
+from parallel import ParallelExecutor, OPERATORS
+import pipeline
+import approx
+import batch
+import encoding
+import output
+import explain
+import server
+from client import read_queries
+
+try:
+    import numpy as np
+except ImportError:  # numpy is needed only for the numpy backend
+    np = None
+
+# errors a query can end with (the engine reports unsupported SQL as NotImplementedError, missing tables as
+# FileNotFoundError, and a malformed query can fail anywhere with a lookup, value, type or arithmetic error), the
+# repl and batch mode report them and go on with the next query
+QUERY_ERRORS = (NotImplementedError, OSError, LookupError, ValueError, TypeError, ArithmeticError)
+
+
+class LazyDatabase(OrderedDict):
+    """
+    database[TABLE_NAME] which loads a table only when it is accessed for the first time
+    """
+
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader  # function which gives the table (in column form) for a table name
+
+    def __missing__(self, table):
+        self[table] = self.loader(table)
+        return self[table]
 
 
 class MiniSQL:
-    def __init__(self):
+    SCAN_BLOCK = 1 << 16  # rows checked at a time by a WHERE which needs just a limited number of rows
+    TAIL_BYTES = 64  # last bytes read of a CSV file, checked to tell an appended file from a rewritten one
+    MERGEABLE = ("COUNT", "SUM", "MIN", "MAX")  # aggregates whose cached results are updated with appended rows
+
+    def __init__(self, backend="list", lazy=True, cache_dir=".minisql_cache", workers=1, stream=False,
+                 output_format="table", out=None, result_cache=True):
+        """
+        args : backend -> "list" stores each column as a python list, "numpy" stores each column as an int64 numpy
+                          array and runs the filters and aggregates as vectorized kernels, "compact" stores each
+                          column in the smallest of a narrow integer array, dictionary or run length encoding (see
+                          encoding.py) and runs the filters on constants and the aggregates on the encoded values
+                lazy -> load the tables only when a query touches them, else all of them are loaded right away
+                cache_dir -> directory of the binary columnar cache of the parsed tables (None disables the cache)
+                workers -> number of worker processes for the scans, filters and aggregations of big tables (1 runs
+                           everything in this process)
+                stream -> run the queries as pipelines of operators passing batches of rows (see pipeline.py), the
+                          rows are printed as soon as they are produced
+                output_format -> format of the printed results, one of output.FORMATS
+                out -> file the results are written to (None means stdout)
+                result_cache -> keep the results of the queries in a cache (in memory, and in cache_dir if it is not
+                                None) which is used as long as the CSV files and metadata.txt do not change
+        The HyperLogLog sketches of the columns (APPROX_COUNT_DISTINCT) are kept in cache_dir too.
+        """
+        if backend == "numpy" and np is None:
+            raise NotImplementedError("numpy backend needs numpy to be installed")
+        if backend not in ("list", "numpy", "compact"):
+            raise NotImplementedError(str(backend) + " backend is not implemented in Mini SQL")
+        self.backend = backend
         self.tableInfo = OrderedDict()
-        self.database = OrderedDict()  # database[TABLE_NAME][COLUMN_NAME] -> gives list of values in this column
+        self.indexInfo = OrderedDict()  # indexInfo[TABLE_NAME] -> list of (column, kind) of the declared indexes
+        self.indexes = OrderedDict()  # indexes[TABLE_NAME][COLUMN_NAME] -> list of the indexes built on the column
+        # database[TABLE_NAME][COLUMN_NAME] -> gives list of values in this column
+        self.database = LazyDatabase(self.load_table) if lazy else OrderedDict()
+        self.lazy = lazy
+        self.load_stats = OrderedDict()  # table -> rows, bytes, seconds and source of its load
+        self.table_stats = OrderedDict()  # table -> TableStats (rows, distinct values, min and max of the columns)
+        self.parallel = ParallelExecutor(workers) if workers > 1 else None
+        self.cache = ColumnCache(cache_dir) if cache_dir is not None else None
+        self.results = None
+        if result_cache:
+            self.results = ResultCache(os.path.join(cache_dir, "results") if cache_dir is not None else None)
+        self.stamps = OrderedDict()  # table -> (mtime, size) of its CSV file when it was loaded
+        self.offsets = OrderedDict()  # table -> (bytes of its CSV file read so far, the last TAIL_BYTES of them)
+        self.column_buffers = OrderedDict()  # table -> column -> numpy array (with spare room) the column is a view of
+        self.sketches = OrderedDict()  # (table, column) -> (stamp, HyperLogLog of the whole column), see column_sketch
+        self.sketch_store = SketchStore(os.path.join(cache_dir, "sketches")) if cache_dir is not None else None
+        self.shared = None  # batch.SharedScans of the batch being run (see run_batch), None outside of a batch
+        self.meta_stamp = None  # (mtime, size) of metadata.txt when it was read
+        if output_format not in output.FORMATS:
+            raise NotImplementedError(str(output_format) + " output format is not implemented in Mini SQL")
+        self.stream = stream
+        self.output_format = output_format
+        self.out = out
         self.joinT = OrderedDict()
         self.get_meta_info()
         self.fill_content()
@@ -19,6 +111,7 @@ class MiniSQL:
         Reads the metadata.txt file to read in the schema of the database.
         Each table in database is stored in 
         """
+        self.meta_stamp = file_stamp('metadata.txt')
         try:
             info_file = open('metadata.txt', 'r')
         except FileNotFoundError:
@@ -36,6 +129,14 @@ class MiniSQL:
                     table_started = False
                     table_name = ro.strip()
                     self.tableInfo[table_name] = []
+                    self.indexInfo[table_name] = []
+                    continue
+                if ro.strip().startswith('<index'):
+                    # <index hash column> or <index sorted column> declares an index on the column
+                    parts = ro.strip()[1:-1].split()
+                    if len(parts) != 3 or parts[1] not in INDEX_KINDS:
+                        raise NotImplementedError("Invalid index declaration in metadata.txt : " + ro.strip())
+                    self.indexInfo[table_name].append((parts[2], parts[1]))
                     continue
                 # append the column names into the table dict
                 self.tableInfo[table_name].append(ro.strip())
@@ -76,22 +177,342 @@ class MiniSQL:
             print(table)
             del self.tableInfo[table]
 
-        # Initialise the database
-        for table in self.tableInfo.keys():
-            self.database[table] = OrderedDict()
-            for column in self.tableInfo[table]:
-                self.database[table][column] = []  # Each column has a list of data
+        # Finally fill the content in database, with lazy loading the tables are filled when they are first used
+        if not self.lazy:
+            for table in self.tableInfo.keys():
+                self.database[table] = self.load_table(table)
 
-        # Finally fill the content in database
-        for table in self.tableInfo.keys():
-            rows = MiniSQL.get_csv(str(table) + ".csv")
-            for row in rows:
-                data = row.split(',')
-                for i in range(len(data)):
-                    col_name = self.tableInfo[table][i]
-                    d = data[i].strip()
-                    d = d.strip('\n')
-                    self.database[table][col_name].append(int(d))
+    def load_table(self, table):
+        """
+        Reads the content of the table from its CSV file
+        returns the table in column form
+        """
+        self.stamps[table] = file_stamp(str(table) + ".csv")
+        self.column_buffers.pop(table, None)
+        if self.cache is not None:
+            start = time.perf_counter()
+            content = self.cache.load(table, self.tableInfo[table], self.backend == "numpy")
+            if content is not None:
+                self.offsets[table] = (self.stamps[table][1], self.csv_tail(table, self.stamps[table][1]))
+                self.load_stats[table] = OrderedDict([("rows", MiniSQL.row_count(content)),
+                                                      ("bytes", os.path.getsize(self.cache.path(table))),
+                                                      ("seconds", time.perf_counter() - start), ("source", "cache")])
+                return self.collect_stats(table, self.build_indexes(table, self.compact(content)))
+        # Each column has a list of data (an int64 array for the numpy backend)
+        content, stats = read_csv_columns(str(table) + ".csv", self.tableInfo[table], self.backend == "numpy")
+        stats["source"] = "csv"
+        self.load_stats[table] = stats
+        self.offsets[table] = (stats["bytes"], self.csv_tail(table, stats["bytes"]))
+        if self.cache is not None:
+            self.cache.store(table, content)
+        return self.collect_stats(table, self.build_indexes(table, self.compact(content)))
+
+    def compact(self, content):
+        """
+        Encodes the columns of the freshly read table for the compact backend (see encoding.encode)
+        """
+        if self.backend == "compact":
+            return encoding.encode_table(content)
+        return content
+
+    def collect_stats(self, table, content):
+        """
+        Collects the statistics of the freshly loaded table, used to plan the joins
+        """
+        self.table_stats[table] = TableStats(content)
+        return content
+
+    def estimate_rows(self, table, conditions=(), op=None):
+        """
+        Estimated rows of the table satisfying the conditions (which touch just this table), from its statistics
+        """
+        self.database[table]  # loads the table (and collects its statistics) if needed
+        stats = self.table_stats[table]
+        if len(conditions) == 0:
+            return stats.rows
+        return stats.rows * stats.selectivity(conditions, op)
+
+    def join_plan(self, table_list, predicates, sizes):
+        """
+        Cost based order of the joins of the tables, see planner.join_order
+        args : sizes -> maps the table names to their (estimated) rows taking part in the join
+        returns list of (table, build side, estimated rows)
+        """
+        stats = OrderedDict((table, self.table_stats[table]) for table in table_list)
+        return join_order(table_list, sizes, predicates, stats, MiniSQL.join_links)
+
+    @staticmethod
+    def csv_tail(table, offset):
+        """
+        Gives the last TAIL_BYTES bytes before offset of the CSV file of the table
+        """
+        with open(str(table) + ".csv", "rb") as csv_file:
+            csv_file.seek(max(0, offset - MiniSQL.TAIL_BYTES))
+            return csv_file.read(offset - max(0, offset - MiniSQL.TAIL_BYTES))
+
+    def refresh(self, tables=None):
+        """
+        Brings the loaded tables up to date with their CSV files, which are taken as append only logs. The rows
+        appended to a file since it was read are parsed and added to the table (see append_rows), which costs in the
+        order of the new rows. A file which was rewritten or shrunk is loaded again from scratch.
+        args : tables -> names of the tables (None means all the loaded tables)
+        """
+        for table in list(self.database.keys()) if tables is None else tables:
+            if table not in self.database.keys():
+                continue
+            stamp = file_stamp(str(table) + ".csv")
+            if stamp == self.stamps.get(table):
+                continue
+            offset, tail = self.offsets[table]
+            if stamp is None or stamp[1] < offset or (len(tail) > 0 and not tail.endswith(b"\n")) or (
+                    self.csv_tail(table, offset) != tail):
+                self.unload(table)
+            else:
+                self.append_rows(table)
+
+    def unload(self, table):
+        """
+        Drops the loaded content of the table, it is read again from its CSV file when it is next used
+        """
+        del self.database[table]
+        for loaded in (self.indexes, self.table_stats, self.column_buffers, self.offsets):
+            loaded.pop(table, None)
+        for key in [key for key in self.sketches.keys() if key[0] == table]:
+            del self.sketches[key]
+        if self.parallel is not None:
+            self.parallel.forget(table)
+        if not self.lazy:
+            self.database[table] = self.load_table(table)
+
+    def append_rows(self, table):
+        """
+        Parses the rows appended to the CSV file of the table since it was read and appends them to its columns,
+        indexes, statistics and sketches, the shared copy of the workers is dropped and the cached COUNT/SUM/MIN/MAX
+        results of the table are updated with the new rows (see merge_aggregates)
+        """
+        offset, _ = self.offsets[table]
+        old_stamp = self.loaded_stamp([table])
+        path = str(table) + ".csv"
+        new, stats = read_csv_columns(path, self.tableInfo[table], self.backend == "numpy", offset=offset,
+                                      whole_lines=True)
+        content = self.database[table]
+        low = MiniSQL.row_count(content)
+        offset += stats["bytes"]
+        self.offsets[table] = (offset, self.csv_tail(table, offset))
+        stamp = file_stamp(path)
+        # a line still being written is left for the next refresh, the results are not cached till then
+        self.stamps[table] = stamp if stamp is not None and stamp[1] == offset else (None, offset)
+        if stats["rows"] > 0:
+            for column, values in new.items():
+                self.extend_column(table, column, values)
+            for column, indexes in self.indexes[table].items():
+                for index in indexes:
+                    index.append(new[column], low)
+            self.table_stats[table].append(content, low)
+            if self.parallel is not None:
+                self.parallel.forget(table)
+        for (sketched, column), (_, sketch) in list(self.sketches.items()):
+            if sketched == table:
+                sketch.add(new[column])
+                self.keep_sketch(table, column, sketch)
+        if self.results is not None:
+            self.results.update(old_stamp, self.loaded_stamp([table]),
+                                lambda key, result: self.merge_aggregates(table, key, result, low))
+
+    def extend_column(self, table, column, values):
+        """
+        Appends the values to the column of the loaded table, a numpy column is a view of a bigger array whose spare
+        room takes the appended values (the array is doubled when it is full) so that appending is not a full copy
+        """
+        content = self.database[table]
+        old = content[column]
+        if not MiniSQL.is_array(old):
+            old.extend(values)
+            return
+        buffers = self.column_buffers.setdefault(table, OrderedDict())
+        buffer = buffers.get(column)
+        n_rows = len(old)
+        if buffer is None or len(buffer) < n_rows + len(values):
+            buffer = np.empty(2 * (n_rows + len(values)), dtype=np.int64)
+            buffer[:n_rows] = old
+            buffers[column] = buffer
+        buffer[n_rows:n_rows + len(values)] = values
+        content[column] = buffer[:n_rows + len(values)]
+
+    def merge_aggregates(self, table, key, result, low):
+        """
+        Updates the cached result of a query with the rows low onwards of the table, which were appended to it. The
+        results of single table COUNT/SUM/MIN/MAX queries (grouped or not) without ORDER BY, DISTINCT and LIMIT are
+        updated by merging them with the aggregates of the new rows, the new groups go last as they are seen last.
+        args : key -> key of the cached result, as given by ResultCache.key
+                result -> the cached result, as stored by run_query
+        returns the updated result, None if it has to be computed again
+        """
+        content = self.database[table]
+        if low == MiniSQL.row_count(content):
+            return result
+        info = json.loads(key)[0]
+        kind, cached, headings = result
+        col_op = MiniSQL.column_operations(info["columns"])
+        group = info["groupby"][0] if info["hasgroupby"] else None
+        if kind != "table" or headings is not None or info["tables"] != [table] or info["hasorderby"] or (
+                info.get("sample") is not None) or (
+                info["distinct"] or info["limit"] is not None or info["offset"] > 0 or len(col_op) == 0):
+            return None
+        if any(fun not in MiniSQL.MERGEABLE for fun in col_op.values()) or any(
+                '(' in first for first, _, _ in info["conditions"]):
+            return None
+        names = OrderedDict((name, col_op[key]) for key, name in MiniSQL.new_cols(col_op).items())
+        if any(column not in names and column != group for column in cached.keys()) or (
+                group is None and len(cached) != 1):
+            return None
+        rows = range(low, MiniSQL.row_count(content))
+        if len(info["conditions"]) > 0:
+            rows = self.where_rows(content, info["conditions"], info["between_cond_op"], rows)
+        if len(rows) == 0:
+            return result
+        new = MiniSQL.select_rows(content, rows, MiniSQL.needed_columns(
+            content, ([] if group is None else [group]) + list(col_op.keys())))
+        if group is None:
+            column, fun = next(iter(col_op.items()))
+            partial = {MiniSQL.new_cols(col_op)[column]: [self.aggregate(new, column, fun)]}
+        else:
+            partial = self.group_by(new, group, col_op)
+        merged = OrderedDict((column, list(values.tolist() if MiniSQL.is_array(values) else values))
+                             for column, values in cached.items())
+        partial = {column: list(values.tolist() if MiniSQL.is_array(values) else values)
+                   for column, values in partial.items()}
+        if group is None:
+            positions = {None: 0}
+            new_groups = [None]
+        else:
+            positions = {value: i for i, value in enumerate(merged[group])}
+            new_groups = partial[group]
+        for i, value in enumerate(new_groups):
+            j = positions.get(value)
+            for column in merged.keys():
+                if j is None:
+                    merged[column].append(partial[column][i])
+                elif column != group:
+                    old, fun = merged[column][j], names[column]
+                    if old is None:  # SUM of no rows
+                        merged[column][j] = partial[column][i]
+                    else:
+                        merged[column][j] = old + partial[column][i] if fun in ("COUNT", "SUM") else (
+                            min(old, partial[column][i]) if fun == "MIN" else max(old, partial[column][i]))
+            if j is None:
+                positions[value] = len(merged[group]) - 1
+        for column, values in cached.items():
+            if MiniSQL.is_array(values):
+                merged[column] = np.asarray(merged[column])
+        return kind, merged, headings
+
+    def loaded_stamp(self, tables):
+        """
+        Same as ResultCache.stamp, but for the files as they were when the tables and metadata.txt were read, a result
+        is cached only if these match the current files
+        """
+        return tuple(self.stamps.get(table) for table in tables) + (self.meta_stamp,)
+
+    @staticmethod
+    def sketched_column(info, col_op):
+        """
+        Gives (table, column) if the query is just APPROX_COUNT_DISTINCT over a whole column of a single table, which
+        the sketch of the column answers (see column_sketch), else None
+        """
+        if len(info["tables"]) != 1 or info["where"] or info["hasgroupby"] or info["sample"] is not None or (
+                len(info["columns"]) != 1 or list(col_op.values()) != ["APPROX_COUNT_DISTINCT"]):
+            return None
+        return info["tables"][0], next(iter(col_op))
+
+    def column_sketch(self, table, column):
+        """
+        HyperLogLog sketch of all the values of the column. The sketch is kept in memory and in the sketch store along
+        with the mtime and size of the CSV file and metadata.txt it was built from, so that as long as they do not
+        change it is reused without loading the table, the rows appended to the table are added to it.
+        """
+        if table not in self.tableInfo.keys():
+            raise FileNotFoundError(str(table) + " table does not exist in the database")
+        if column == '*':
+            column = self.tableInfo[table][0]
+        if column not in self.tableInfo[table]:
+            raise NotImplementedError("Table does not have any column named " + str(column))
+        stamp = self.sketch_stamp(table)
+        kept = self.sketches.get((table, column))
+        if kept is not None and kept[0] == stamp:
+            return kept[1]
+        stored = self.sketch_store.load(table, column, stamp) if self.sketch_store is not None else None
+        if stored is not None:
+            sketch = HyperLogLog(*stored)
+            self.sketches[(table, column)] = (stamp, sketch)
+            return sketch
+        sketch = HyperLogLog()
+        sketch.add(self.database[table][column])
+        self.keep_sketch(table, column, sketch)
+        return sketch
+
+    def sketch_stamp(self, table):
+        """
+        (mtime, size) of the CSV file of the table and of metadata.txt as they were read, a table not loaded yet is
+        read from the current file
+        """
+        loaded = self.stamps.get(table) if table in self.database.keys() else file_stamp(str(table) + ".csv")
+        return loaded, self.meta_stamp
+
+    def keep_sketch(self, table, column, sketch):
+        """
+        Keeps the (up to date) sketch of the column in memory and in the sketch store
+        """
+        stamp = self.sketch_stamp(table)
+        self.sketches[(table, column)] = (stamp, sketch)
+        if self.sketch_store is not None:
+            self.sketch_store.store(table, column, stamp, sketch.precision, sketch.registers)
+
+    def build_indexes(self, table, content):
+        """
+        Builds the indexes declared for the table on its freshly loaded content
+        """
+        self.indexes[table] = OrderedDict()
+        for column, kind in self.indexInfo.get(table, []):
+            if column not in content.keys():
+                raise NotImplementedError("Table " + str(table) + " does not have any column named " + str(column))
+            self.indexes[table].setdefault(column, []).append(INDEX_KINDS[kind](content[column]))
+        return content
+
+    def create_index(self, table, column, kind="sorted"):
+        """
+        Declares an index on the column, it is built right away if the table is already loaded else when it is loaded
+        args : table -> name of the table
+                column -> name of the column
+                kind -> "hash" (serves =) or "sorted" (serves =, <, <=, >, >=)
+        """
+        if table not in self.tableInfo.keys():
+            raise FileNotFoundError(str(table) + " table does not exist in the database")
+        if column not in self.tableInfo[table]:
+            raise NotImplementedError("Table " + str(table) + " does not have any column named " + str(column))
+        if kind not in INDEX_KINDS:
+            raise NotImplementedError(str(kind) + " index is not implemented in Mini SQL")
+        if (column, kind) in self.indexInfo[table]:
+            return
+        self.indexInfo[table].append((column, kind))
+        if table in self.database.keys():
+            self.indexes[table].setdefault(column, []).append(INDEX_KINDS[kind](self.database[table][column]))
+
+    def to_backend(self, table):
+        """
+        Converts the columns of the table (in place) to the storage used by the backend
+        """
+        if self.backend == "numpy":
+            for column in table.keys():
+                table[column] = np.asarray(table[column], dtype=np.int64)
+        return table
+
+    @staticmethod
+    def is_array(values):
+        """
+        Tells whether the column is stored as a numpy array
+        """
+        return np is not None and isinstance(values, np.ndarray)
 
     def aggregate(self, table, column, fun, grouped_column=None, valu=None):
         """
@@ -110,6 +531,14 @@ class MiniSQL:
         if grouped_column is not None and grouped_column not in table.keys():
             raise NotImplementedError("Table does not have any column named " + str(column))
 
+        if grouped_column is None and len(table[column]) == 0:
+            return pipeline.Aggregate.empty(fun)
+        if grouped_column is None and MiniSQL.is_array(table[column]):
+            return MiniSQL.array_aggregate(table[column], fun)
+        if grouped_column is None and encoding.is_encoded(table[column]) and len(table[column]) > 0:
+            value = table[column].aggregate(fun)
+            if value is not None:
+                return value
         if fun == 'MAX':
             val = int(-1e9)
             i = 0
@@ -152,6 +581,17 @@ class MiniSQL:
                 return s
             else:
                 return functools.reduce(lambda a, b: a + b, table[column])
+        elif fun == 'COUNT_DISTINCT':
+            if grouped_column is not None:
+                return len(set(v for v, k in zip(table[column], table[grouped_column]) if k == valu))
+            return len(set(table[column]))
+        elif fun == 'APPROX_COUNT_DISTINCT':
+            values = table[column]
+            if grouped_column is not None:
+                values = [v for v, k in zip(table[column], table[grouped_column]) if k == valu]
+            sketch = HyperLogLog(GROUP_PRECISION if grouped_column is not None else PRECISION)
+            sketch.add(values)
+            return sketch.count()
         elif fun == 'AVG':
             summ = 0
             elements = 0
@@ -169,11 +609,37 @@ class MiniSQL:
         else:
             raise NotImplementedError(str(fun) + " function is not implemented in Mini SQL")
 
+    @staticmethod
+    def array_aggregate(values, fun):
+        """
+        Vectorized version of aggregate for a column stored as numpy array, gives the same results as aggregate
+        """
+        if len(values) == 0:
+            return pipeline.Aggregate.empty(fun)
+        if fun == 'MAX':
+            return max(int(-1e9), int(values.max()))
+        elif fun == 'MIN':
+            return min(int(1e9), int(values.min()))
+        elif fun == 'COUNT':
+            return len(values)
+        elif fun == 'SUM':
+            return int(values.sum())
+        elif fun == 'AVG':
+            return int(values.sum()) / len(values)
+        elif fun == 'COUNT_DISTINCT':
+            return len(np.unique(values))
+        elif fun == 'APPROX_COUNT_DISTINCT':
+            sketch = HyperLogLog()
+            sketch.add(values)
+            return sketch.count()
+        else:
+            raise NotImplementedError(str(fun) + " function is not implemented in Mini SQL")
+
     @staticmethod
     def condition(first, second, operator):
         """
         checks the condition
-        args : first,second -> int operands
+        args : first,second -> int operands (for numpy arrays a boolean mask is returned)
                 operator -> binary function
         """
         if operator == '=':
@@ -189,12 +655,14 @@ class MiniSQL:
         else:
             raise NotImplementedError(str(operator) + " is not implemented in Mini SQL")
 
-    def join_helper(self, table_list, ind, row_list):
+    def join_helper(self, table_list, ind, row_list, selections, limit=None):
         """
         Recursive function for joining tables
         args : table_list -> list of tables to be joined (list of strings)
                 ind -> index of current table that is being processed (int)
                 row_list -> list of indices of rows of various tables (list of int)
+                selections -> maps each table name to the indices of its rows taking part in the join
+                limit -> stop once the joined table has these many rows (None means no limit)
         """
         if ind == len(table_list):
             for i in range(ind):
@@ -205,45 +673,267 @@ class MiniSQL:
             return
 
         table = table_list[ind]
-        col_name = self.tableInfo[table][0]
-        for i in range(len(self.database[table][col_name])):
+        for i in selections[table]:
+            if limit is not None and MiniSQL.row_count(self.joinT) >= limit:
+                return
             row_list.append(i)
-            self.join_helper(table_list, ind + 1, row_list)
+            self.join_helper(table_list, ind + 1, row_list, selections, limit)
             row_list.pop()
 
-    def join_tables(self, table_list):
+    def column_owner(self, column, table_list):
+        """
+        Returns the table (among table_list) which has the given column, None if no table has it
+        args : column -> name of the column (string)
+                table_list -> list of tables to be searched (list of strings)
+        """
+        for table in table_list:
+            if column in self.tableInfo[table]:
+                return table
+        return None
+
+    def equi_join_predicates(self, table_list, conditions):
+        """
+        Picks the column = column conditions whose columns belong to two different tables of table_list
+        args : table_list -> list of tables to be joined (list of strings)
+                conditions -> where conditions, each a tuple of (first, second, op)
+        returns list of tuples (column1, table1, column2, table2)
+        """
+        predicates = []
+        for first, second, operator in conditions:
+            if operator != '=':
+                continue
+            first_table = self.column_owner(first, table_list)
+            second_table = self.column_owner(second, table_list)
+            if first_table is None or second_table is None or first_table == second_table:
+                continue
+            predicates.append((first, first_table, second, second_table))
+        return predicates
+
+    def residual_conditions(self, table_list, conditions):
+        """
+        The conditions still to be checked after join_view joined the tables on them, the equi-join predicates are
+        already applied by the hash join
+        """
+        used = set((first, second) for first, _, second, _ in self.equi_join_predicates(table_list, conditions))
+        return [cond for cond in conditions if cond[2] != '=' or (cond[0], cond[1]) not in used]
+
+    def hash_join(self, table_list, predicates, selections, limit=None):
+        """
+        Joins the tables using build/probe hash joins on the equi-join predicates, tables which are not connected
+        by any predicate are joined using the cartesian product.
+        Three or more tables are joined in the order (and with the build sides) picked by join_plan from the
+        statistics of the tables.
+        The resulting rows are in the same order as the cartesian product (followed by filtering) would give.
+        args : table_list -> list of tables to be joined (list of strings)
+                predicates -> equi-join predicates as given by equi_join_predicates
+                selections -> maps each table name to the indices of its rows taking part in the join
+                limit -> only the first limit rows are needed (None means all)
+        """
+        order = None
+        if len(table_list) >= 3:
+            order = self.join_plan(table_list, predicates,
+                                   OrderedDict((table, len(selections[table])) for table in table_list))
+        first = table_list[0] if order is None else order[0][0]
+        joined = [first]
+        rows = [(i,) for i in selections[first]]
+        remaining = [table for table in table_list if table != first]
+        reordered = False  # the rows are not in the order of the joined tables
+        while len(remaining) > 0:
+            build_side = "table"
+            if order is not None:
+                table, build_side, _ = order[len(joined)]
+                links = self.join_links(table, joined, predicates)
+            else:
+                # prefer a table which is connected to the already joined tables by some predicate
+                table = remaining[0]
+                links = []
+                for candidate in remaining:
+                    links = self.join_links(candidate, joined, predicates)
+                    if len(links) > 0:
+                        table = candidate
+                        break
+            remaining.remove(table)
+            # the last join can stop early if the tables were joined in their order, else the rows are sorted later
+            cap = None
+            if (limit is not None and len(remaining) == 0 and joined + [table] == list(table_list) and
+                    build_side != "joined" and not reordered):
+                cap = limit
+            if len(links) == 0:
+                rows = list(itertools.islice((row + (i,) for row in rows for i in selections[table]), cap))
+            elif build_side == "joined":
+                # build side is the (smaller) already joined result, probe side is the new table
+                build = {}
+                build_cols = [(joined.index(other), self.database[other][col]) for _, other, col in links]
+                for row in rows:
+                    build.setdefault(tuple(col[row[pos]] for pos, col in build_cols), []).append(row)
+                probe_cols = [self.database[table][col] for col, _, _ in links]
+                new_rows = []
+                for i in selections[table]:
+                    matches = build.get(tuple(col[i] for col in probe_cols))
+                    if matches is not None:
+                        for row in matches:
+                            new_rows.append(row + (i,))
+                rows = new_rows
+                reordered = True
+            else:
+                # build side is the new table, probe side is the already joined result
+                build = {}
+                build_cols = [self.database[table][col] for col, _, _ in links]
+                for i in selections[table]:
+                    build.setdefault(tuple(col[i] for col in build_cols), []).append(i)
+                probe_cols = [(joined.index(other), self.database[other][col]) for _, other, col in links]
+                new_rows = []
+                for row in rows:
+                    if cap is not None and len(new_rows) >= cap:
+                        break
+                    matches = build.get(tuple(col[row[pos]] for pos, col in probe_cols))
+                    if matches is not None:
+                        for i in matches:
+                            new_rows.append(row + (i,))
+                rows = new_rows[:cap]
+            joined.append(table)
+
+        positions = [joined.index(table) for table in table_list]
+        if positions != list(range(len(table_list))) or reordered:
+            rows = [tuple(row[pos] for pos in positions) for row in rows]
+            rows.sort()
+        for pos in range(len(table_list)):
+            table = table_list[pos]
+            for col in self.tableInfo[table]:
+                values = self.database[table][col]
+                self.joinT[col] = [values[row[pos]] for row in rows]
+
+    @staticmethod
+    def join_links(table, joined, predicates):
+        """
+        Returns the predicates connecting table with any of the joined tables as (column of table, other table,
+        column of other table)
+        """
+        links = []
+        for first, first_table, second, second_table in predicates:
+            if first_table == table and second_table in joined:
+                links.append((first, second_table, second))
+            elif second_table == table and first_table in joined:
+                links.append((second, first_table, first))
+        return links
+
+    def join_tables(self, table_list, conditions=None, pushed=None):
         """
-        Cartesian product tables in table_list
+        Joins the tables in table_list, using hash join if there is some equi-join condition among the conditions
+        else cartesian product
         args : table_list -> list of tables to be joined (list of strings)
+                conditions -> where conditions which are ANDed together (can be None)
+                pushed -> maps table names to the indices of their rows satisfying the pushed down conditions, as
+                          given by push_down (can be None)
+        """
+        table, rows = self.join_view(table_list, conditions, pushed)
+        return MiniSQL.select_rows(table, rows)
+
+    def join_view(self, table_list, conditions=None, pushed=None, limit=None):
+        """
+        Same as join_tables, but a single table is not copied, instead it returns the base table along with the
+        selection vector of its rows (None if all the rows are selected)
+        limit -> only the first limit joined rows are needed (None means all), the join stops early only if all the
+                 conditions are served by the hash join
+        returns (table, rows)
         """
         for tableName in table_list:
             if tableName not in self.tableInfo.keys():
                 raise FileNotFoundError(str(tableName) + " table does not exist in the database")
 
+        selections = OrderedDict()
+        for table in table_list:
+            if pushed is not None and table in pushed:
+                selections[table] = pushed[table]
+            else:
+                selections[table] = range(MiniSQL.row_count(self.database[table]))
         if len(table_list) == 1:
-            return self.database[table_list[0]]
+            if pushed is not None and table_list[0] in pushed:
+                return self.database[table_list[0]], pushed[table_list[0]]
+            return self.database[table_list[0]], None
         self.joinT = OrderedDict()
         for i in range(len(table_list)):
             for col in self.tableInfo[table_list[i]]:
                 self.joinT[col] = []
-        row_list = []
-        self.join_helper(table_list, 0, row_list)
-        return self.joinT
+        predicates = []
+        if conditions is not None:
+            predicates = self.equi_join_predicates(table_list, conditions)
+        if conditions is not None and len(predicates) != len(conditions):
+            limit = None  # the other conditions may still remove rows after the join
+        if len(predicates) > 0:
+            self.hash_join(table_list, predicates, selections, limit)
+        else:
+            row_list = []
+            self.join_helper(table_list, 0, row_list, selections, limit)
+        return self.to_backend(self.joinT), None
+
+    @staticmethod
+    def row_count(table):
+        """
+        Number of rows in the table (dictionary, in column form)
+        """
+        for values in table.values():
+            return len(values)
+        return 0
+
+    @staticmethod
+    def selected_count(table, rows):
+        """
+        Number of rows given by the selection vector (None means all the rows of the table)
+        """
+        return MiniSQL.row_count(table) if rows is None else len(rows)
+
+    @staticmethod
+    def select_rows(table, rows, column_list=None):
+        """
+        Materializes the rows of the table given by the selection vector
+        args : table -> Relation
+                rows -> list of row indices to be kept in that order (None means all the rows, they are not copied)
+                column_list -> columns to be kept (None means all the columns)
+        """
+        if column_list is None:
+            if rows is None:
+                return table
+            column_list = table.keys()
+        result = OrderedDict()
+        for column in column_list:
+            values = table[column]
+            if rows is None:
+                result[column] = values
+            elif MiniSQL.is_array(values):
+                result[column] = values[np.asarray(rows, dtype=np.int64)]
+            elif encoding.is_encoded(values):
+                result[column] = values.take(rows)
+            else:
+                result[column] = [values[i] for i in rows]
+        return result
+
+    @staticmethod
+    def needed_columns(table, column_list):
+        """
+        Columns of the table used by column_list, '*' (as in COUNT(*)) needs just the first column of the table
+        """
+        needed = []
+        for column in column_list:
+            if column == '*':
+                column = next(iter(table))
+            if column in table.keys() and column not in needed:
+                needed.append(column)
+        return needed
 
-    def project(self, table, column_list):
+    def project(self, table, column_list, rows=None):
         """
         Projection in SQL
         args : table -> Relation on which projection has to be applied (dictionary, in column form)
                 column_list -> list of columns to be project (list of strings)
+                rows -> selection vector of the rows to be kept (None means all the rows)
         """
-        result = OrderedDict()
         if len(column_list) == 1 and column_list[0] == '*':
-            return table
+            return MiniSQL.select_rows(table, rows)
         for column in column_list:
             if column not in table.keys():
                 raise NotImplementedError(str(column) + " column does not exist in this table (projection)")
-            result[column] = table[column]
-        return result
+        return MiniSQL.select_rows(table, rows, column_list)
 
     @staticmethod
     def row_form(table):
@@ -269,26 +959,60 @@ class MiniSQL:
     @staticmethod
     def distinct(table):
         """
-        We receive a list of table names, first we need to get a single table by joining them.
+        Keeps the first occurrence of every row of the table. The rows are hashed straight from the columns a batch at
+        a time, only the distinct rows are kept as tuples (numpy columns are deduplicated by np.unique on the rows).
         args : table -> Relation
-        returns distinct table in "ROW form" list of tuples
+        returns distinct table in "ROW form" list of tuples, and its headings
         """
-        tupleset = OrderedDict()  # keeps the order intact
-        row_table, headings = MiniSQL.row_form(table)
+        headings = list(table.keys())
+        columns = list(table.values())
+        # an aggregate selected along with other columns gives a shorter column, column_batches pads it with None
+        if len(columns) > 0 and len(set(len(values) for values in columns)) == 1 and all(
+                MiniSQL.is_array(values) and values.dtype.kind in "iu" for values in columns):
+            rows = np.stack(columns, axis=1)
+            first = np.sort(np.unique(rows, axis=0, return_index=True)[1])  # first occurrences, in order
+            return list(zip(*[values[first].tolist() for values in columns])), headings
+        tupleset = {}  # dict keeps the rows in the order they were first seen
+        for batch in output.column_batches(table):
+            tupleset.update(dict.fromkeys(batch))
+        return list(tupleset), headings
 
-        for row in row_table:
-            tupleset[tuple(row)] = 1
-        result = []
-        for key, val in tupleset.items():
-            result.append(key)
-        return result, headings
+    @staticmethod
+    def column_operations(columns):
+        """
+        Extracts the column-operation dictionary using "SELECTED" columns
+        returns OrderedDict which maps the aggregated columns to their aggregate functions
+        """
+        col_op = OrderedDict()
+        for col in columns:
+            aggregate = False
+            cc: str = ""
+            for char in col:
+                if char == ')':
+                    aggregate = False
+                if aggregate:
+                    cc += str(char)
+                if char == '(':
+                    aggregate = True
+            if "" != cc:
+                if cc.startswith("DISTINCT "):
+                    if col[0] != 'C':
+                        raise NotImplementedError("DISTINCT is supported only in COUNT(DISTINCT column)")
+                    col_op[cc[len("DISTINCT "):]] = "COUNT_DISTINCT"
+                elif col.startswith("APPROX_COUNT_DISTINCT("):
+                    col_op[cc] = "APPROX_COUNT_DISTINCT"
+                elif col[0] == 'C':
+                    col_op[cc] = "COUNT"
+                else:
+                    col_op[cc] = str(col[:3])  # for min, max, sum, avg
+        return col_op
 
     @staticmethod
     def new_cols(colOP):
         cols = OrderedDict()
         for key, val in colOP.items():
             val = val.upper()
-            cols[key] = val + "(" + key + ")"
+            cols[key] = explain.aggregate_name(key, val)
         return cols
 
     def group_by(self, table, column, col_operation):
@@ -299,7 +1023,6 @@ class MiniSQL:
         We need to give names to the newly created columns, which will be like COUNT(col1), MAX(col2), etc
         """
         cols = MiniSQL.new_cols(col_operation)
-        seen = OrderedDict()
         new_table = OrderedDict()
         for key, val in cols.items():
             new_table[val] = []
@@ -307,27 +1030,139 @@ class MiniSQL:
 
         if column not in table.keys():
             raise NotImplementedError(str(column) + " column does not exist in this table (projection)")
-        for v in table[column]:
-            if v not in seen.keys():
-                seen[v] = 1
-                new_table[column].append(v)
-                for key, val in cols.items():
-                    res = self.aggregate(table, key, col_operation[key], column, v)
-                    new_table[val].append(res)
+        keys = table[column]
+        for key in col_operation.keys():
+            if key != '*' and key not in table.keys():
+                raise NotImplementedError("Table does not have any column named " + str(key))
+        if MiniSQL.is_array(keys):
+            return MiniSQL.array_group_by(table, column, col_operation)
+        results = OrderedDict()
+        for key, fun in col_operation.items():
+            agg_column = column if key == '*' else key
+            results[key] = MiniSQL.hash_aggregate(keys, table[agg_column], fun)
+
+        # dict keeps the insertion order, hence the groups are in the order they were first seen
+        for v in dict.fromkeys(keys):
+            new_table[column].append(v)
+            for key, val in cols.items():
+                new_table[val].append(results[key][v])
 
         return new_table
 
     @staticmethod
-    def filter_helper(table, col1, col2, operator, val=None):
+    def array_group_by(table, column, col_operation):
+        """
+        Vectorized version of group_by for columns stored as numpy arrays. The rows are sorted by group (stable), so
+        that every group is a contiguous slice and the aggregates are computed with reduceat kernels.
+        """
+        cols = MiniSQL.new_cols(col_operation)
+        keys = table[column]
+        groups, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        seen_order = np.argsort(first, kind='stable')  # groups in the order they were first seen
+        order = np.argsort(inverse, kind='stable')
+        counts = np.bincount(inverse, minlength=len(groups))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(groups) > 0 else counts
+        new_table = OrderedDict()
+        for key, fun in col_operation.items():
+            agg_column = column if key == '*' else key
+            values = table[agg_column][order]
+            if len(groups) == 0:
+                result = np.zeros(0, dtype=np.int64)
+            elif fun == 'COUNT':
+                result = counts
+            elif fun == 'SUM':
+                result = np.add.reduceat(values, starts)
+            elif fun == 'MAX':
+                result = np.maximum(np.maximum.reduceat(values, starts), int(-1e9))  # bounded as aggregate does
+            elif fun == 'MIN':
+                result = np.minimum(np.minimum.reduceat(values, starts), int(1e9))
+            elif fun == 'AVG':
+                result = np.add.reduceat(values, starts) / counts
+            elif fun == 'COUNT_DISTINCT':
+                # the rows sorted by (group, value), a row starts a new (group, value) pair if it differs from the
+                # previous one
+                pairs = np.lexsort((table[agg_column], inverse))
+                sorted_groups, sorted_values = inverse[pairs], table[agg_column][pairs]
+                new_pair = np.ones(len(pairs), dtype=bool)
+                new_pair[1:] = (sorted_groups[1:] != sorted_groups[:-1]) | (sorted_values[1:] != sorted_values[:-1])
+                result = np.bincount(sorted_groups[new_pair], minlength=len(groups))
+            elif fun == 'APPROX_COUNT_DISTINCT':
+                result = array_group_counts(inverse, len(groups), table[agg_column])
+            else:
+                raise NotImplementedError(str(fun) + " function is not implemented in Mini SQL")
+            new_table[cols[key]] = result[seen_order]
+        new_table[column] = groups[seen_order]
+        return new_table
+
+    @staticmethod
+    def hash_aggregate(keys, values, fun):
+        """
+        Computes the aggregate function 'fun' for every group in a single pass over the column
+        args : keys -> values of the grouped column (list, or an encoded column whose COUNT is given by its counts)
+                values -> values of the aggregated column (list, same length as keys)
+                fun -> function applied
+        returns dictionary which maps each group value to its aggregate
+        """
+        acc = {}
+        if fun == 'COUNT' and encoding.is_encoded(keys):
+            acc = keys.counts()
+        elif fun == 'COUNT':
+            for k in keys:
+                acc[k] = acc.get(k, 0) + 1
+        elif fun == 'SUM':
+            for k, v in zip(keys, values):
+                acc[k] = acc.get(k, 0) + v
+        elif fun == 'MAX':
+            for k, v in zip(keys, values):
+                if k not in acc or v > acc[k]:
+                    acc[k] = v
+            for k in acc:
+                acc[k] = max(int(-1e9), acc[k])  # bounded as aggregate does
+        elif fun == 'MIN':
+            for k, v in zip(keys, values):
+                if k not in acc or v < acc[k]:
+                    acc[k] = v
+            for k in acc:
+                acc[k] = min(int(1e9), acc[k])
+        elif fun == 'COUNT_DISTINCT':
+            for k, v in zip(keys, values):
+                acc.setdefault(k, set()).add(v)
+            for k in acc:
+                acc[k] = len(acc[k])
+        elif fun == 'APPROX_COUNT_DISTINCT':
+            acc = group_counts(keys, values)
+        elif fun == 'AVG':
+            counts = {}
+            for k, v in zip(keys, values):
+                acc[k] = acc.get(k, 0) + v
+                counts[k] = counts.get(k, 0) + 1
+            for k in acc:
+                acc[k] = acc[k] / counts[k]
+        else:
+            raise NotImplementedError(str(fun) + " function is not implemented in Mini SQL")
+        return acc
+
+    @staticmethod
+    def filter_helper(table, col1, col2, operator, val=None, rows=None):
         """
         This method removes rows(tuples) which do not satisfy the condition
         return a list of row indices which should be preserved in the resulting table
         args : table -> Relation
                 col1 -> first operand
                 col2 -> second operand (can be a column or a constant value)
+                rows -> indices of the rows to be checked (None means all the rows)
         """
+        if MiniSQL.is_array(table[col1]):
+            rows = np.arange(len(table[col1])) if rows is None else np.asarray(rows, dtype=np.int64)
+            second = int(val) if val is not None else np.asarray(table[col2])[rows]
+            return rows[MiniSQL.condition(table[col1][rows], second, operator)]
+        if val is not None and encoding.is_encoded(table[col1]):
+            return table[col1].filter(operator, int(val), rows)
         result = []
-        for i in range(len(table[col1])):
+        if rows is None:
+            rows = range(len(table[col1]))
+        for i in rows:
             if val is not None:
                 if MiniSQL.condition(table[col1][i], int(val), operator):
                     result.append(i)
@@ -336,20 +1171,148 @@ class MiniSQL:
                     result.append(i)
         return result
 
-    def custom_filter(self, table, where_cond):
+    @staticmethod
+    def is_constant(operand):
+        """
+        Tells whether the second operand of a condition is a constant value (and not a column)
         """
-        It modifies the table according to the where condition, there can be only atmost one 'AND' or 'OR'
+        for char in operand:
+            if not ('0' <= char <= '9'):
+                return False
+        return True
+
+    def custom_filter(self, table, where_cond, rows=None):
+        """
+        It modifies the table according to the where condition
         args : table -> Relation
                 where_cond -> condition to be satisfied tuple of three values (column, (column or constant value), operator)
+                rows -> indices of the rows to be checked (None means all the rows)
         """
-        const_val = True
-        for char in where_cond[1]:
-            if not ('0' <= char <= '9'):
-                const_val = False
-        if const_val:
-            return self.filter_helper(table, where_cond[0], "Does'nt Matter", where_cond[2], int(where_cond[1]))
+        if MiniSQL.is_constant(where_cond[1]):
+            return self.filter_helper(table, where_cond[0], "Does'nt Matter", where_cond[2], int(where_cond[1]), rows)
         else:
-            return self.filter_helper(table, where_cond[0], where_cond[1], where_cond[2])
+            return self.filter_helper(table, where_cond[0], where_cond[1], where_cond[2], rows=rows)
+
+    def condition_owner(self, cond, table_list):
+        """
+        Returns the table which owns all the columns used in the condition, None if the condition uses columns of
+        more than one table (or unknown columns)
+        args : cond -> tuple of (first, second, op)
+                table_list -> list of tables in the query (list of strings)
+        """
+        owner = self.column_owner(cond[0], table_list)
+        if owner is None or MiniSQL.is_constant(cond[1]):
+            return owner
+        if self.column_owner(cond[1], table_list) != owner:
+            return None
+        return owner
+
+    def split_conditions(self, table_list, conditions, op=None):
+        """
+        Splits the where conditions into the ones which touch just one table, which can be applied on that base table
+        before the join, and the rest. With 'AND' every single table condition is pushed on its own, with 'OR' the
+        conditions are pushed only if all of them belong to the same table.
+        returns (per_table, remaining) where per_table maps table names to their conditions
+        """
+        per_table = OrderedDict()
+        owners = [self.condition_owner(cond, table_list) for cond in conditions]
+        if len(conditions) == 1 or op == "AND":
+            remaining = []
+            for cond, owner in zip(conditions, owners):
+                if owner is None:
+                    remaining.append(cond)
+                else:
+                    per_table.setdefault(owner, []).append(cond)
+            return per_table, remaining
+        if op == "OR" and owners[0] is not None and owners.count(owners[0]) == len(owners):
+            per_table[owners[0]] = conditions
+            return per_table, []
+        return per_table, conditions
+
+    def push_down(self, table_list, conditions, op=None, limit=None, samples=None):
+        """
+        Applies the conditions which touch just one table on that base table, so that the join gets smaller input
+        (see split_conditions)
+        args : table_list -> list of tables in the query (list of strings)
+                conditions -> where conditions
+                op -> 'AND' or 'OR' joining the conditions (None if there is just one condition)
+                limit -> the query needs just the first limit rows of the tables satisfying the conditions, used only
+                         if there is just one table (None means all the rows)
+                samples -> maps the tables read by TABLESAMPLE to the rows of their picked blocks, only these rows are
+                           checked (None means no table is sampled)
+        In a batch the rows are combined from the shared scans of the tables (see batch.SharedScans).
+        returns (pushed, remaining) where pushed maps table names to the indices of their rows satisfying the pushed
+        conditions and remaining is the list of conditions which still have to be applied after the join
+        """
+        for tableName in table_list:
+            if tableName not in self.tableInfo.keys():
+                raise FileNotFoundError(str(tableName) + " table does not exist in the database")
+        pushed = OrderedDict()
+        if len(table_list) != 1:
+            limit = None
+        per_table, remaining = self.split_conditions(table_list, conditions, op)
+        op = "OR" if op == "OR" and len(conditions) > 1 else "AND"
+        for table, conds in per_table.items():
+            relation = self.database[table]  # loads the table (and builds its indexes) if needed
+            rows = samples.get(table) if samples is not None else None
+            if limit is None and rows is None and self.shared is not None:
+                pushed[table] = self.shared.filter(table, conds, op)
+                if pushed[table] is not None:
+                    continue
+            if limit is None and rows is None and self.use_parallel(table, conds):
+                pushed[table] = self.parallel.filter(table, relation, MiniSQL.row_count(relation), conds, op)
+                continue
+            pushed[table] = self.where_rows(relation, conds, op, rows, indexes=self.indexes.get(table), limit=limit)
+        if samples is not None:
+            for table, rows in samples.items():
+                pushed.setdefault(table, rows)
+        return pushed, remaining
+
+    def use_parallel(self, table, conditions):
+        """
+        Tells whether the conditions on the base table should be checked by the worker processes, that is when the
+        table is big enough and no index serves any of the conditions
+        """
+        if self.parallel is None or MiniSQL.row_count(self.database[table]) < self.parallel.min_rows:
+            return False
+        indexes = self.indexes.get(table, {})
+        for first, second, operator in conditions:
+            if first in indexes or operator not in OPERATORS:
+                return False
+        return True
+
+    def parallel_aggregate(self, table, conditions, op, column, col_operation):
+        """
+        Filters the base table and aggregates it (grouped by column, if not None) on the worker processes
+        returns the same table as group_by would give for the filtered table, without grouping a table having one row
+        with the aggregate
+        """
+        relation = self.database[table]
+        aggregates = []
+        for key, fun in col_operation.items():
+            agg_column = next(iter(relation)) if key == '*' else key
+            if agg_column not in relation.keys():
+                raise NotImplementedError("Table does not have any column named " + str(key))
+            aggregates.append((agg_column, fun))
+        if column is not None and column not in relation.keys():
+            raise NotImplementedError(str(column) + " column does not exist in this table (projection)")
+        groups, results = self.parallel.aggregate(table, relation, MiniSQL.row_count(relation), conditions, op,
+                                                  column, aggregates)
+        new_table = OrderedDict()
+        for (key, fun), result in zip(col_operation.items(), results):
+            if column is None and None not in result:
+                new_table[explain.aggregate_name(key, fun)] = [pipeline.Aggregate.empty(fun)]
+                continue
+            values = [result[g] for g in groups] if column is not None else [result[None]]
+            # same results as aggregate, MIN and MAX are bounded grouped or not
+            if fun == 'MAX':
+                values = [max(int(-1e9), v) for v in values]
+            elif fun == 'MIN':
+                values = [min(int(1e9), v) for v in values]
+            new_table[explain.aggregate_name(key, fun)] = values
+        if column is not None:
+            new_table[column] = groups
+        return new_table
 
     def where(self, table, conditions, op=None):
         """
@@ -357,32 +1320,85 @@ class MiniSQL:
         args : table -> Relation
                 conditions -> conditions to be applied
         """
-        # IF there is just one condition
-        rows_to_keep = []
-        if len(conditions) == 1:
-            rows_to_keep = self.custom_filter(table, conditions[0])
+        return MiniSQL.select_rows(table, self.where_rows(table, conditions, op))
+
+    @staticmethod
+    def index_lookup(cond, indexes):
+        """
+        Gives the rows satisfying the condition using an index on its column, None if no index can serve it
+        args : cond -> tuple of (first, second, op)
+                indexes -> maps column names to the list of their indexes (can be None)
+        """
+        if indexes is None or cond[0] not in indexes or not MiniSQL.is_constant(cond[1]):
+            return None
+        for index in indexes[cond[0]]:
+            rows = index.lookup(cond[2], int(cond[1]))
+            if rows is not None:
+                return rows
+        return None
+
+    def where_rows(self, table, conditions, op=None, rows=None, indexes=None, limit=None):
+        """
+        Returns the selection vector (list of row indices) of the rows satisfying the supplied conditions
+        args : table -> Relation
+                conditions -> conditions to be applied
+                rows -> selection vector of the rows to be checked (None means all the rows)
+                indexes -> maps column names of the (base) table to the list of their indexes (can be None)
+                limit -> only the first limit rows satisfying the conditions are needed (None means all)
+        """
+        if limit is not None:
+            # the rows are checked block by block till enough of them are found
+            if rows is None:
+                rows = range(MiniSQL.row_count(table))
+            rows_to_keep = []
+            for start in range(0, len(rows), MiniSQL.SCAN_BLOCK):
+                if len(rows_to_keep) >= limit:
+                    break
+                block = rows[start:start + MiniSQL.SCAN_BLOCK]
+                rows_to_keep.extend(self.where_rows(table, conditions, op, block)[:limit - len(rows_to_keep)])
+            return rows_to_keep
+        if len(conditions) == 1 or op == "AND":
+            # each condition is checked only on the rows which satisfied all the previous ones, a condition served by
+            # an index goes first so that the rest are checked only on the rows it gives
+            rows_to_keep = rows
+            if rows is None:
+                for position in range(len(conditions)):
+                    matched = MiniSQL.index_lookup(conditions[position], indexes)
+                    if matched is not None:
+                        rows_to_keep = matched
+                        conditions = conditions[:position] + conditions[position + 1:]
+                        break
+            for cond in conditions:
+                rows_to_keep = self.custom_filter(table, cond, rows_to_keep)
+            return rows_to_keep
+        elif op == "OR":
+            # bitmap of the selected rows, each condition is checked only on the rows not selected so far
+            if rows is None:
+                some_column = conditions[0][0]
+                rows = range(len(table[some_column]))
+            if MiniSQL.is_array(table[conditions[0][0]]):
+                rows = np.asarray(rows, dtype=np.int64)
+                selected = np.zeros(MiniSQL.row_count(table), dtype=bool)
+                candidates = rows
+                for cond in conditions:
+                    matched = MiniSQL.index_lookup(cond, indexes)
+                    if matched is None:
+                        matched = self.custom_filter(table, cond, candidates)
+                    selected[matched] = True
+                    candidates = candidates[~selected[candidates]]
+                return rows[selected[rows]]
+            selected = bytearray(MiniSQL.row_count(table))
+            candidates = rows
+            for cond in conditions:
+                matched = MiniSQL.index_lookup(cond, indexes)
+                if matched is None:
+                    matched = self.custom_filter(table, cond, candidates)
+                for i in matched:
+                    selected[i] = 1
+                candidates = [i for i in candidates if not selected[i]]
+            return [i for i in rows if selected[i]]
         else:
-            # IF there are two conditions
-            row1 = self.custom_filter(table, conditions[0])
-            row2 = self.custom_filter(table, conditions[1])
-            some_column = conditions[0][0]
-            total = len(table[some_column])
-            if op == "OR":
-                for i in range(total):
-                    if i in row1 or i in row2:
-                        rows_to_keep.append(i)
-            elif op == "AND":
-                for i in range(total):
-                    if i in row1 and i in row2:
-                        rows_to_keep.append(i)
-            else:
-                raise NotImplementedError("Invalid where condition (syntax error)")
-        new_table = OrderedDict()
-        for key, val in table.items():
-            new_table[key] = []
-            for i in rows_to_keep:
-                new_table[key].append(table[key][i])
-        return new_table
+            raise NotImplementedError("Invalid where condition (syntax error)")
 
     @staticmethod
     def order_by(table, column, sorting_type):
@@ -391,53 +1407,88 @@ class MiniSQL:
         args : table -> Relation
                 column -> column based on which we want to sort
         """
-        new_tuple = []  # list of tuples
-        i = 0
-        for val in table[column]:
-            new_tuple.append((val, i))
-            i += 1
-        if sorting_type == "ASC":
-            new_tuple.sort(key=lambda x: x[0])
-        else:
-            new_tuple.sort(key=lambda x: x[0], reverse=True)
-        new_table = OrderedDict()
-        # table is stored in form of dictionary, key is column name and val is list of values
-        for key, col in table.items():
-            new_table[key] = []
-            for tt in new_tuple:
-                ind = tt[1]  # index which is to be next appended
-                new_table[key].append(col[ind])
-        return new_table
+        return MiniSQL.select_rows(table, MiniSQL.order_by_rows(table, column, sorting_type))
 
     @staticmethod
-    def show_output(table, headings=None):
+    def order_by_rows(table, column, sorting_type, rows=None, limit=None):
         """
-        Prints the table for output
+        Returns the selection vector which gives the rows sorted based on the column, the sort is stable
+        args : table -> Relation
+                column -> column based on which we want to sort
+                rows -> selection vector of the rows to be sorted (None means all the rows)
+                limit -> only the first limit sorted rows are needed (None means all), a bounded heap is used then
         """
-        sep = "-----------------"
-        sep = len(table) * sep
-        if isinstance(table, OrderedDict):
-            print(sep)
-            for key in table.keys():
-                print(key, end="\t")
-            print()
-        else:
-            for key in headings:
-                print(key, end="\t")
-            print()
-        print(sep)
-        new_table = table
+        values = table[column]
+        if MiniSQL.is_array(values):
+            rows = np.arange(len(values)) if rows is None else np.asarray(rows, dtype=np.int64)
+            keys = values[rows]
+            if limit is not None and limit < len(rows):
+                if limit == 0:
+                    return rows[:0]
+                # only the rows whose key is not beyond the limit-th key (ties included) can be in the result
+                if sorting_type == "ASC":
+                    keep = keys <= np.partition(keys, limit - 1)[limit - 1]
+                else:
+                    keep = keys >= np.partition(keys, len(keys) - limit)[len(keys) - limit]
+                rows, keys = rows[keep], keys[keep]
+            if sorting_type == "ASC":
+                return rows[np.argsort(keys, kind='stable')][:limit]
+            # sorting the reversed keys and reversing the result keeps the equal keys in their original order
+            order = np.argsort(keys[::-1], kind='stable')[::-1]
+            return rows[len(rows) - 1 - order][:limit]
+        if rows is None:
+            rows = range(len(values))
+        if limit is not None:
+            # same as sorting and taking the first limit rows, but O(n log limit)
+            if sorting_type == "ASC":
+                return heapq.nsmallest(limit, rows, key=values.__getitem__)
+            return heapq.nlargest(limit, rows, key=values.__getitem__)
+        return sorted(rows, key=values.__getitem__, reverse=(sorting_type != "ASC"))
+
+    @staticmethod
+    def limit_rows(table, limit, offset=0):
+        """
+        Keeps limit rows of the table after skipping offset rows
+        args : table -> Relation (dictionary in column form) or list of rows (as given by distinct)
+                limit -> maximum number of rows to be kept (None means all)
+        """
+        end = None if limit is None else offset + limit
         if isinstance(table, OrderedDict):
-            new_table, _ = MiniSQL.row_form(table)
+            result = OrderedDict()
+            for key, values in table.items():
+                result[key] = values[offset:end]
+            return result
+        return table[offset:end]
 
-        for row in new_table:
-            for entry in row:
-                print(entry, end="\t\t")
-            print()
-        print(sep)
+    @staticmethod
+    def show_output(table, headings=None, fmt="table", out=None):
+        """
+        Prints the table for output, the rows are formatted and written a batch at a time straight from the columns
+        args : table -> Relation (dictionary in column form) or list of rows (as given by distinct)
+                headings -> column names of the list of rows
+                fmt -> one of output.FORMATS
+                out -> file to write to (None means stdout)
+        """
+        if isinstance(table, OrderedDict):
+            output.write_rows(list(table.keys()), output.column_batches(table), fmt, out)
+        else:
+            output.write_distinct(headings, table, fmt, out)
 
 
 class MySQLParser:
+    KEYWORDS = ("SELECT", "DISTINCT", "FROM", "WHERE", "GROUP", "ORDER", "BY", "AND", "OR", "ASC", "DESC", "LIMIT",
+                "OFFSET")
+    CLAUSES = (["SELECT"], ["DISTINCT"], ["FROM"], ["WHERE"], ["GROUP"], ["ORDER"], ["GROUP", "BY"], ["ORDER", "BY"],
+               ["LIMIT"], ["OFFSET"])
+    # aggregate call, comparison operator or any other word, commas and white space only separate tokens
+    TOKEN = re.compile(r"\w+\s*\([^)]*\)|<=|>=|<>|!=|=|<|>|[^\s,=<>!]+")
+    CREATE_INDEX = re.compile(r"CREATE\s+INDEX\s+(?:\w+\s+)?ON\s+(\w+)\s*\(\s*(\w+)\s*\)(?:\s+USING\s+(\w+))?\s*;\s*$",
+                              re.IGNORECASE)
+    TABLESAMPLE = re.compile(r"TABLESAMPLE\s*(?:SYSTEM)?\s*\(\s*(\d+(?:\.\d*)?)\s*(?:PERCENT)?\s*\)"
+                             r"(?:\s*REPEATABLE\s*\(\s*(\d+)\s*\))?$", re.IGNORECASE)
+    PLAN_CACHE_SIZE = 256
+    plan_cache = OrderedDict()  # normalized query -> parsed info, least recently used first
+
     def __init__(self, query):
         self.query = query
         self.info = OrderedDict()
@@ -445,14 +1496,18 @@ class MySQLParser:
         self.info["tables"] = []
         self.info["groupby"] = []  # there will be atmost one column
         self.info["orderby"] = []  # there will be atmost one column
-        self.info["conditions"] = []  # Atmost 2 conditions, each condition is tuple of (first, second, op), first is
-        # a column, second can be a column or constant value
+        self.info["conditions"] = []  # each condition is tuple of (first, second, op), first is a column, second can
+        # be a column or constant value
         self.info["between_cond_op"] = ""
         self.info["orderbytype"] = "ASC"
         self.info["hasgroupby"] = False
         self.info["hasorderby"] = False
         self.info["distinct"] = False
         self.info["where"] = False
+        self.info["limit"] = None  # maximum number of rows in the result, None if there is no LIMIT
+        self.info["offset"] = 0  # number of rows of the result to be skipped
+        self.info["sample"] = None  # percent of the blocks of the table picked by TABLESAMPLE, None reads all of them
+        self.info["sample_seed"] = None  # seed of REPEATABLE, None picks different blocks on every run
 
     def parse(self):
         """
@@ -485,36 +1540,90 @@ class MySQLParser:
 
         return self.info
 
+    @staticmethod
+    def parse_create_index(query):
+        """
+        parses CREATE INDEX [name] ON table (column) [USING HASH|SORTED];
+        returns (table, column, kind), the kind is sorted if not mentioned
+        """
+        match = MySQLParser.CREATE_INDEX.match(query.strip())
+        if match is None:
+            raise NotImplementedError("Syntax error in CREATE INDEX, use CREATE INDEX ON table (column) USING HASH;")
+        kind = match.group(3).lower() if match.group(3) is not None else "sorted"
+        return match.group(1), match.group(2), kind
+
+    @classmethod
+    def parse_cached(cls, query):
+        """
+        Same as MySQLParser(query).parse(), but the parsed info of the recently used queries is kept in a LRU cache
+        keyed by the query with its white space normalized, so a repeated query is not parsed again
+        """
+        key = " ".join(query.split())
+        info = cls.plan_cache.get(key)
+        if info is None:
+            info = cls(key).parse()
+            cls.plan_cache[key] = info
+            if len(cls.plan_cache) > cls.PLAN_CACHE_SIZE:
+                cls.plan_cache.popitem(last=False)
+        else:
+            cls.plan_cache.move_to_end(key)
+        return copy.deepcopy(info)  # the caller may modify its copy
+
+    def parse_tablesample(self, clause):
+        """
+        parses TABLESAMPLE [SYSTEM] (percent [PERCENT]) [REPEATABLE (seed)] after the table name
+        """
+        match = MySQLParser.TABLESAMPLE.match(clause)
+        if match is None:
+            raise NotImplementedError("Syntax error in TABLESAMPLE, use TABLESAMPLE SYSTEM (percent) REPEATABLE (seed)")
+        self.info["sample"] = float(match.group(1))
+        if self.info["sample"] <= 0 or self.info["sample"] > 100:
+            raise NotImplementedError("Syntax error in TABLESAMPLE, the percent should be more than 0 and at most 100")
+        if match.group(2) is not None:
+            self.info["sample_seed"] = int(match.group(2))
+
     def print_parse_info(self):
         for key, val in self.info.items():
             print(key, end=" : ")
             print(val)
     
+    @staticmethod
+    def tokenize(query):
+        """
+        Splits the query into tokens, an aggregate like SUM ( col ) is a single token SUM(col), comparison operators
+        are tokens of their own and the keywords (and aggregate names) are upper cased
+        """
+        tokens = []
+        for token in MySQLParser.TOKEN.findall(query):
+            if '(' in token:
+                name, _, rest = token.partition('(')
+                words = rest[:-1].split()
+                if len(words) == 2 and words[0].upper() == "DISTINCT":
+                    token = name.strip().upper() + "(DISTINCT " + words[1] + ")"
+                else:
+                    token = name.strip().upper() + '(' + "".join(rest.split())
+            elif token.upper() in MySQLParser.KEYWORDS:
+                token = token.upper()
+            tokens.append(token)
+        return tokens
+
     def separator(self):
         """
         separates the query to list of list where each sublist is one part of the query, example WHERE clause.
         it returns the list of list
         """
-        raw = copy.deepcopy(self.query)
-        raw = sqlparse.format(raw, reindent=True, keyword_case='upper')
-        parsed = sqlparse.parse(raw)
-        parsed = parsed[0]
-        keywords = []
-        for i in range(len(parsed.tokens)):
-            if str(parsed.tokens[i]) != ' ':
-                keywords.append(str(parsed.tokens[i]).strip('\n\r '))
         new_keywords = []
-        for s in keywords:
-            s = s.strip()
-            s = s.split(' ')
-            if s[0] == '' or s[0] == ' ':
-                continue
-            temp = []
-            # remove any space or empty strings
-            for val in s:
-                if val != '' and val != ' ':
-                    temp.append(val)
-            new_keywords.append(temp)
+        for token in MySQLParser.tokenize(self.query):
+            last = new_keywords[-1] if len(new_keywords) > 0 else None
+            if token in ("SELECT", "DISTINCT", "FROM", "WHERE", "GROUP", "ORDER", "LIMIT", "OFFSET"):
+                new_keywords.append([token])
+            elif token == "BY" and last in (["GROUP"], ["ORDER"]):
+                last.append(token)
+            elif last is None or (last[0] != "WHERE" and last in MySQLParser.CLAUSES):
+                # the values after a clause keyword form a new part, everything after WHERE is one part
+                new_keywords.append([token])
+            else:
+                last.append(token)
         if len(new_keywords) < 4:
             raise NotImplementedError("Syntax error in SQL query, very short incomplete query")
         return new_keywords
@@ -527,26 +1636,28 @@ class MySQLParser:
         tab_start = False
         group = False
         order = False
+        limit = False
+        offset = False
         for s in keywords:
             if "WHERE" in s:
                 if len(s) < 4:
                     raise NotImplementedError("Syntax error in WHERE clause, condition not mentioned properly")
                 self.info["where"] = True
-                if "AND" in s or "OR" in s or len(s) > 4:
-                    # if some invalid between condition is present like NAND, it will be handled in where function in
-                    # MiniSQL class 
-                    self.info["between_cond_op"] = s[4]
-                    ss = ""
-                    for k in s[3]:
+                if len(s) % 4 != 0:
+                    raise NotImplementedError("Syntax error in WHERE clause, condition not mentioned properly")
+                # conditions are joined by the same operator, if some invalid between condition is present like
+                # NAND, it will be handled in where function in MiniSQL class
+                for i in range(1, len(s), 4):
+                    if i > 1:
+                        if self.info["between_cond_op"] == "":
+                            self.info["between_cond_op"] = s[i - 1]
+                        elif self.info["between_cond_op"] != s[i - 1]:
+                            raise NotImplementedError("Syntax error in WHERE clause, AND and OR can not be mixed")
+                    operand = ""
+                    for k in s[i + 2]:
                         if k != '\n':
-                            ss += str(k)
-                    cond1 = (s[1], ss, s[2])
-                    cond2 = (s[5], s[7], s[6])
-                    self.info["conditions"].append(cond1)
-                    self.info["conditions"].append(cond2)
-                else:
-                    cond = (s[1], s[3], s[2])
-                    self.info["conditions"].append(cond)
+                            operand += str(k)
+                    self.info["conditions"].append((s[i], operand, s[i + 1]))
             if "GROUP" in s:
                 group = True
                 order = False
@@ -567,8 +1678,35 @@ class MySQLParser:
             if "DISTINCT" in s:
                 self.info["distinct"] = True
                 continue
-            if tab_start:
+            if "LIMIT" in s or "OFFSET" in s:
+                limit = "LIMIT" in s
+                offset = "OFFSET" in s
+                tab_start = False
+                order = False
+                group = False
+                continue
+            if limit or offset:
+                for val in s:
+                    if not MiniSQL.is_constant(val) or val == "":
+                        raise NotImplementedError("Syntax error in LIMIT clause, " + str(val) + " is not a number")
+                if offset and len(s) == 1:
+                    self.info["offset"] = int(s[0])
+                elif limit and len(s) == 1:
+                    self.info["limit"] = int(s[0])
+                elif limit and len(s) == 2:
+                    # LIMIT offset, count
+                    self.info["offset"] = int(s[0])
+                    self.info["limit"] = int(s[1])
+                else:
+                    raise NotImplementedError("Syntax error in LIMIT clause")
+                limit = False
+                offset = False
+            elif tab_start:
                 tab_start = False
+                sampled = [i for i, tab in enumerate(s) if str(tab).upper().startswith("TABLESAMPLE")]
+                if len(sampled) > 0:
+                    self.parse_tablesample(" ".join(s[sampled[0]:]))
+                    s = s[:sampled[0]]
                 for tab in s:
                     self.info["tables"].append(str(tab))
             elif order:
@@ -594,102 +1732,396 @@ class MySQLParser:
             self.info["columns"].append(column)
 
 
-def main():
-    minisql = MiniSQL()
-    keep = True
-    # print("Please print all the aggregate functions in capital like COUNT, etc, wherever it is used. And don't use "
-    #       "comma in the query")
-    while keep:
-        # query = input("mini$> ")
-        query = sys.argv[1]
-        if query.upper() == "QUIT":
-            print("Ok")
-            keep = False
+def run_query(minisql, query):
+    """
+    Parses the query, runs it on minisql and prints the resulting table. EXPLAIN <query> prints the stages the query
+    runs instead, EXPLAIN ANALYZE <query> runs it and prints the time, rows and memory of each stage.
+    args : minisql -> MiniSQL instance having the database
+            query -> the sql query (string)
+    """
+    if query.strip().upper().startswith("CREATE"):
+        minisql.create_index(*MySQLParser.parse_create_index(query))
+        print("Ok", file=minisql.out)
+        return
+    analyze = None  # None runs the query, False just explains it, True explains and measures it
+    as_json = False
+    if query.strip().upper().startswith("EXPLAIN"):
+        analyze, as_json, query = explain.parse_explain(query)
+    info = MySQLParser.parse_cached(query)
+    # pick up the rows appended to the CSV files of the tables since they were loaded
+    minisql.refresh(info["tables"])
+    # a repeated query on unchanged tables is answered from the result cache (not when it is explained, nor when it
+    # samples different blocks on every run)
+    cache_key = None
+    if minisql.results is not None and analyze is None and (info["sample"] is None or info["sample_seed"] is not None):
+        cache_key = ResultCache.key(info, minisql.stream, minisql.backend)
+        stamp = minisql.results.stamp(info["tables"])
+        cached = minisql.results.get(cache_key, stamp)
+        if cached is not None:
+            kind, table, headings = cached
+            if kind == "rows":
+                output.write_rows(headings, output.row_batches(table), minisql.output_format, minisql.out)
+            else:
+                MiniSQL.show_output(table, headings, minisql.output_format, minisql.out)
+            return
+    col_op = MiniSQL.column_operations(info["columns"])
+    group_by_first = False
+    if info["hasgroupby"]:
+        if len(col_op) == 0:
+            pass
+        grouped_column = info["groupby"][0]
+        if grouped_column in info["columns"]:
+            if (1 + len(col_op)) != len(info["columns"]):
+                raise NotImplementedError(
+                    "SELECTED columns should have all the other columns as some aggregation, except the "
+                    "grouped column")
         else:
-            query = query.strip()
-            my_parser = MySQLParser(query)
-            info = my_parser.parse()
-            col_op = OrderedDict()
-            group_by_first = False
-            # extract the column-operation dictionary using "SELECTED" columns
-            for col in info["columns"]:
-                aggregate = False
-                cc: str = ""
-                for char in col:
-                    if char == ')':
-                        aggregate = False
-                    if aggregate:
-                        cc += str(char)
+            if len(col_op) != len(info["columns"]):
+                print(len(col_op))
+                print(len(info["columns"]))
+                raise NotImplementedError(
+                    "SELECTED columns should have all the columns as some aggregation")
+        # IF the conditions require grouping by , then we first group by else, we group by after WHERE
+        if info["where"]:
+            for tup in info["conditions"]:
+                for char in tup[0]:
                     if char == '(':
-                        aggregate = True
-                if "" != cc:
-                    if col[0] == 'C':
-                        col_op[cc] = "COUNT"
-                    else:
-                        col_op[cc] = str(col[:3])  # for min, max, sum, avg
-            if info["hasgroupby"]:
-                if len(col_op) == 0:
-                    pass
-                grouped_column = info["groupby"][0]
-                if grouped_column in info["columns"]:
-                    if (1 + len(col_op)) != len(info["columns"]):
-                        raise NotImplementedError(
-                            "SELECTED columns should have all the other columns as some aggregation, except the "
-                            "grouped column")
-                else:
-                    if len(col_op) != len(info["columns"]):
-                        print(len(col_op))
-                        print(len(info["columns"]))
-                        raise NotImplementedError(
-                            "SELECTED columns should have all the columns as some aggregation")
-                # IF the conditions require grouping by , then we first group by else, we group by after WHERE
-                if info["where"]:
-                    for tup in info["conditions"]:
-                        for char in tup[0]:
-                            if char == '(':
-                                group_by_first = True
-            else:
-                if len(col_op) > 1:
-                    raise NotImplementedError("Only one aggregation allowed when GROUP BY is not used")
-
-            # join the tables
-            joined_table = copy.deepcopy(minisql.join_tables(info["tables"]))
-            if group_by_first:
-                joined_table = copy.deepcopy(minisql.group_by(joined_table, info["groupby"][0], col_op))
-            # apply the where condition
-            if info["where"]:
-                if info['between_cond_op'] != "aman":
-                    joined_table = copy.deepcopy(
-                        minisql.where(joined_table, info["conditions"], info["between_cond_op"]))
+                        group_by_first = True
+    else:
+        if len(col_op) > 1:
+            raise NotImplementedError("Only one aggregation allowed when GROUP BY is not used")
+    if info["sample"] is not None:
+        if len(info["tables"]) != 1:
+            raise NotImplementedError("TABLESAMPLE is supported only on a single table")
+        if group_by_first or (not info["hasgroupby"] and len(col_op) == 1 and len(info["columns"]) != 1):
+            raise NotImplementedError("TABLESAMPLE does not support aggregates in WHERE or along with other columns")
+    sketched = MiniSQL.sketched_column(info, col_op)
+
+    # with LIMIT only the first rows are needed, if nothing after the WHERE changes the rows (or their order) the
+    # scans and joins stop once they give enough rows, if just ORDER BY does, it keeps only the top rows
+    needed_rows = None if info["limit"] is None else info["offset"] + info["limit"]
+    top_rows = None
+    if not info["distinct"] and (info["hasgroupby"] or len(col_op) == 0):
+        top_rows = needed_rows
+    first_rows = None
+    if top_rows is not None and not info["hasgroupby"] and not info["hasorderby"]:
+        first_rows = needed_rows
+
+    # a big single table query which just aggregates is filtered and aggregated by the worker processes
+    parallel_table = None
+    if minisql.parallel is not None and len(info["tables"]) == 1 and not group_by_first and (
+            "COUNT_DISTINCT" not in col_op.values() and "APPROX_COUNT_DISTINCT" not in col_op.values()) and (
+            info["sample"] is None) and (
+            info["hasgroupby"] or (len(col_op) == 1 and len(info["columns"]) == 1)):
+        table = info["tables"][0]
+        if table in minisql.tableInfo.keys() and all(
+                minisql.condition_owner(cond, info["tables"]) == table for cond in info["conditions"]) and (
+                minisql.use_parallel(table, info["conditions"])):
+            parallel_table = table
 
+    out = minisql.out
+    profile = explain.Profile(enabled=False)
+    if analyze:
+        out = explain.NullOutput()  # the result is formatted but not printed
+
+    if minisql.stream and parallel_table is None and sketched is None:
+        plan = pipeline.build_plan(minisql, info, col_op, group_by_first)
+        if plan is not None:
+            if analyze is False:
+                explain.show_plan(pipeline.describe(plan), as_json)
+                return
+            if analyze:
+                profile = explain.Profile()
+                plan, measured = pipeline.measure(plan)
+                profile.start()
+                try:
+                    pipeline.show_output(plan, minisql.output_format, out, info["distinct"])
+                finally:
+                    profile.stop()
+                pipeline.profile(measured, profile)
+                profile.report(query, as_json)
+                return
+            if cache_key is not None:
+                plan = pipeline.Collect(plan, minisql.results.max_bytes // (8 * max(1, len(plan.columns))))
+            pipeline.show_output(plan, minisql.output_format, out, info["distinct"])
+            if cache_key is not None and plan.rows is not None and minisql.loaded_stamp(info["tables"]) == stamp:
+                # distinct rows are kept as MiniSQL.distinct gives them, so they are shown the same way
+                minisql.results.put(cache_key, stamp, ("table" if info["distinct"] else "rows", plan.rows,
+                                                       plan.columns))
+            return
+
+    if analyze is not None:
+        stages = explain.stages(minisql, info, col_op, group_by_first, parallel_table, first_rows, top_rows,
+                                sketched)
+        if not analyze:
+            explain.show_plan(stages, as_json)
+            return
+        profile = explain.Profile(stages)
+        profile.start()
+    # an error in a stage stops the profile too, else tracemalloc would slow down the later queries
+    try:
+        aggregated = False
+        if parallel_table is not None:
+            relation = minisql.database[parallel_table]
+            with profile.stage("ParallelAggregate", MiniSQL.row_count(relation)) as stage:
+                group_column = info["groupby"][0] if info["hasgroupby"] else None
+                joined_table = minisql.parallel_aggregate(parallel_table, info["conditions"], info["between_cond_op"],
+                                                          group_column, col_op)
+                stage["rows_out"] = MiniSQL.row_count(joined_table)
+            aggregated = True
+        elif sketched is not None:
+            with profile.stage("Sketch") as stage:
+                column = sketched[1]
+                joined_table = OrderedDict([(explain.aggregate_name(column, col_op[column]),
+                                             [minisql.column_sketch(*sketched).count()])])
+                stage["rows_out"] = 1
+            aggregated = True
+        # in a batch the joins, filtered rows and aggregates are shared by the queries with the same keys
+        join_key, rows_key = None, None
+        if minisql.shared is not None and not aggregated:
+            join_key, rows_key = minisql.shared.keys(info)
+        # TABLESAMPLE reads just the rows of the picked blocks of the table
+        sample = None
+        samples = None
+        if info["sample"] is not None:
+            table = info["tables"][0]
+            if table not in minisql.tableInfo.keys():
+                raise FileNotFoundError(str(table) + " table does not exist in the database")
+            with profile.stage("TableSample", MiniSQL.row_count(minisql.database[table])) as stage:
+                sample = approx.BlockSample(MiniSQL.row_count(minisql.database[table]), info["sample"],
+                                            info["sample_seed"])
+                samples = OrderedDict([(table, sample.rows())])
+                stage["rows_out"] = len(samples[table])
+
+        # apply the single table conditions on the base tables before joining them
+        pushed = samples
+        remaining = info["conditions"]
+        if aggregated:
+            remaining = []
+            rows = None
+        elif info["where"] and not group_by_first:
+            with profile.stage("PushDownFilter") as stage:
+                pushed, remaining = minisql.push_down(info["tables"], info["conditions"], info["between_cond_op"],
+                                                      first_rows, samples)
+                stage["rows_in"] = sum(MiniSQL.row_count(minisql.database[table]) if samples is None
+                                       else len(samples[table]) for table in pushed)
+                stage["rows_out"] = sum(len(rows) for rows in pushed.values())
+        # join the tables, the conditions can be used for hash join only if all of them must hold
+        join_conditions = None
+        if len(remaining) == 1 or (len(remaining) > 1 and info["between_cond_op"] == "AND"):
+            join_conditions = remaining
+        # the stages pass around the table along with a selection vector of its rows, the columns are copied
+        # only when they are needed
+        if not aggregated:
+            with profile.stage(explain.join_operator(minisql, info["tables"], join_conditions)) as stage:
+                join = functools.partial(minisql.join_view, info["tables"], join_conditions, pushed,
+                                         first_rows if join_conditions is not None or len(remaining) == 0 else None)
+                if join_key is not None and len(info["tables"]) > 1:
+                    joined_table, rows = minisql.shared.memo(join_key, join)
                 else:
-                    joined_table = copy.deepcopy(minisql.where(joined_table, info["conditions"]))
-            # order by and group by will use same columns (in mini sql)
-            # apply group by
-            if info["hasgroupby"] and not group_by_first:
-                joined_table = copy.deepcopy(minisql.group_by(joined_table, info["groupby"][0], col_op))
-            # apply order by
-            if info["hasorderby"]:
-                joined_table = copy.deepcopy(
-                    minisql.order_by(joined_table, str(info["orderby"][0]), info["orderbytype"]))
-            if info["hasgroupby"] == False and len(col_op) == 1:
+                    joined_table, rows = join()
+                stage["rows_in"] = sum(len(pushed[table]) if pushed is not None and table in pushed
+                                       else MiniSQL.row_count(minisql.database[table]) for table in info["tables"])
+                stage["rows_out"] = MiniSQL.selected_count(joined_table, rows)
+            if join_conditions is not None:
+                remaining = minisql.residual_conditions(info["tables"], remaining)
+        if group_by_first:
+            with profile.stage("GroupBy", MiniSQL.selected_count(joined_table, rows)) as stage:
+                needed = MiniSQL.needed_columns(joined_table, info["groupby"] + list(col_op.keys()))
+                joined_table = minisql.group_by(MiniSQL.select_rows(joined_table, rows, needed), info["groupby"][0],
+                                                col_op)
+                rows = None
+                stage["rows_out"] = MiniSQL.row_count(joined_table)
+        # apply the where condition
+        if len(remaining) > 0:
+            with profile.stage("Filter", MiniSQL.selected_count(joined_table, rows)) as stage:
+                op = info["between_cond_op"] if len(remaining) > 1 else None
+                where = functools.partial(minisql.where_rows, joined_table, remaining, op, rows)
+                rows = minisql.shared.memo(rows_key, where) if rows_key is not None else where()
+                stage["rows_out"] = len(rows)
+        if first_rows is not None:
+            rows = (rows if rows is not None else range(MiniSQL.row_count(joined_table)))[:first_rows]
+        # the aggregates of a sample are scaled up to estimates over the whole table, with their error bounds
+        if sample is not None and len(col_op) > 0:
+            with profile.stage("SampleAggregate", MiniSQL.selected_count(joined_table, rows)) as stage:
+                group_column = info["groupby"][0] if info["hasgroupby"] else None
+                if group_column is not None and group_column not in joined_table.keys():
+                    raise NotImplementedError(str(group_column) + " column does not exist in this table (projection)")
+                joined_table = approx.estimate(joined_table, rows, group_column, col_op, sample,
+                                               MiniSQL.new_cols(col_op))
+                rows = None
+                stage["rows_out"] = MiniSQL.row_count(joined_table)
+            aggregated = True
+        # order by and group by will use same columns (in mini sql)
+        # apply group by
+        if info["hasgroupby"] and not group_by_first and not aggregated:
+            with profile.stage("GroupBy", MiniSQL.selected_count(joined_table, rows)) as stage:
+                if rows_key is not None:
+                    joined_table = minisql.shared.group_by(rows_key, joined_table, rows, info["groupby"][0], col_op)
+                else:
+                    needed = MiniSQL.needed_columns(joined_table, info["groupby"] + list(col_op.keys()))
+                    joined_table = minisql.group_by(MiniSQL.select_rows(joined_table, rows, needed), info["groupby"][0],
+                                                    col_op)
+                rows = None
+                stage["rows_out"] = MiniSQL.row_count(joined_table)
+        # apply order by
+        if info["hasorderby"]:
+            with profile.stage("OrderBy", MiniSQL.selected_count(joined_table, rows)) as stage:
+                rows = minisql.order_by_rows(joined_table, str(info["orderby"][0]), info["orderbytype"], rows, top_rows)
+                stage["rows_out"] = len(rows)
+        if info["hasgroupby"] == False and len(col_op) == 1 and not aggregated:
+            with profile.stage("Aggregate", MiniSQL.selected_count(joined_table, rows)) as stage:
                 query_col = ""
                 query_fun = ""
                 for key, val in col_op.items():
                     query_col = key
                     query_fun = val
-                value = minisql.aggregate(joined_table, query_col, query_fun)
-                joined_table[query_fun + "(" + query_col + ")"] = [value]
+                needed = MiniSQL.needed_columns(joined_table, [query_col])
+                aggregate = lambda: minisql.aggregate(MiniSQL.select_rows(joined_table, rows, needed), query_col,
+                                                      query_fun)
+                if rows_key is not None:
+                    value = minisql.shared.memo(json.dumps(["aggregate", rows_key, query_col, query_fun]), aggregate)
+                else:
+                    value = aggregate()
+                joined_table = MiniSQL.select_rows(joined_table, rows,
+                                                   MiniSQL.needed_columns(joined_table, info["columns"]))
+                rows = None
+                joined_table[explain.aggregate_name(query_col, query_fun)] = [value]
+                stage["rows_out"] = 1
 
-            # project the columns
-            joined_table = copy.deepcopy(minisql.project(joined_table, info["columns"]))
-            # apply distinct
-            if info["distinct"]:
+        # project the columns
+        with profile.stage("Project", MiniSQL.selected_count(joined_table, rows)) as stage:
+            columns = info["columns"] if sample is None else approx.with_errors(info["columns"], joined_table)
+            joined_table = minisql.project(joined_table, columns, rows)
+            stage["rows_out"] = MiniSQL.row_count(joined_table)
+        # apply distinct
+        headings = None
+        if info["distinct"]:
+            with profile.stage("Distinct", MiniSQL.row_count(joined_table)) as stage:
                 joined_table, headings = MiniSQL.distinct(joined_table)
-                MiniSQL.show_output(joined_table, headings)
+                stage["rows_out"] = len(joined_table)
+        if info["limit"] is not None or info["offset"] > 0:
+            n_rows = len(joined_table) if headings is not None else MiniSQL.row_count(joined_table)
+            with profile.stage("Limit", n_rows) as stage:
+                joined_table = MiniSQL.limit_rows(joined_table, info["limit"], info["offset"])
+                stage["rows_out"] = len(joined_table) if headings is not None else MiniSQL.row_count(joined_table)
+        # the result is cached only if the tables were loaded from the current files
+        if cache_key is not None and minisql.loaded_stamp(info["tables"]) == stamp:
+            if isinstance(joined_table, OrderedDict):
+                n_values = len(joined_table) * MiniSQL.row_count(joined_table)
             else:
-                MiniSQL.show_output(joined_table)
-            keep = False
+                n_values = len(joined_table) * len(headings)
+            if n_values * 8 <= minisql.results.max_bytes:
+                minisql.results.put(cache_key, stamp, ("table", joined_table, headings))
+        n_rows = len(joined_table) if headings is not None else MiniSQL.row_count(joined_table)
+        with profile.stage("Output", n_rows) as stage:
+            MiniSQL.show_output(joined_table, headings, minisql.output_format, out)
+            stage["rows_out"] = n_rows
+    finally:
+        if analyze:
+            profile.stop()
+    if analyze:
+        profile.report(query, as_json)
+
+
+def repl(minisql):
+    """
+    Interactive mode, the queries are read from stdin (one per line) and run on the same loaded database till QUIT
+    """
+    while True:
+        try:
+            query = input("mini$> ")
+        except EOFError:
+            break
+        if query.strip() == "":
+            continue
+        if query.strip().upper() == "QUIT":
+            print("Ok")
+            break
+        try:
+            run_query(minisql, query)
+        except QUERY_ERRORS as e:
+            print("Error : " + str(e))
+
+
+def run_batch(minisql, queries):
+    """
+    Runs the queries as one batch, their results are printed in order. All of them are parsed first and the work
+    they have in common is shared : each table is scanned once for the conditions of all the queries, and the joins,
+    filtered rows and aggregates of the queries reading the same rows are computed once (see batch.SharedScans).
+    args : queries -> list of the queries (strings)
+    """
+    infos = []
+    for query in queries:
+        if query.strip().upper().startswith(("CREATE", "EXPLAIN")):
+            continue
+        try:
+            infos.append(MySQLParser.parse_cached(query))
+        except QUERY_ERRORS:
+            continue  # the error is printed on its turn
+    try:
+        minisql.shared = batch.SharedScans(minisql, infos)
+    except QUERY_ERRORS:
+        minisql.shared = None  # the queries run on their own, each one reports its error on its turn
+    try:
+        for query in queries:
+            try:
+                run_query(minisql, query)
+            except QUERY_ERRORS as e:
+                print("Error : " + str(e))
+    finally:
+        minisql.shared = None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Mini SQL engine")
+    arg_parser.add_argument("query", nargs="?", help="query to be run, QUIT to exit")
+    arg_parser.add_argument("--backend", choices=["list", "numpy", "compact"], default="list",
+                            help="storage of the columns, numpy gives vectorized filters and aggregates, compact "
+                                 "encodes them to take less memory")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="do not use the binary columnar cache of the parsed tables")
+    arg_parser.add_argument("--no-result-cache", action="store_true",
+                            help="do not keep the results of the queries for repeated queries")
+    arg_parser.add_argument("--workers", type=int, default=1,
+                            help="worker processes for scans, filters and aggregations of big tables")
+    arg_parser.add_argument("--stream", action="store_true",
+                            help="run the queries as pipelines passing batches of rows, printing rows as they come")
+    arg_parser.add_argument("--format", choices=output.FORMATS, default="table",
+                            help="format of the results, table is the pretty table, csv/tsv/jsonl suit big results")
+    arg_parser.add_argument("--output", metavar="FILE", help="write the results to FILE instead of stdout")
+    arg_parser.add_argument("--load-stats", action="store_true",
+                            help="report the rows/s and MB/s of loading each table (on stderr)")
+    arg_parser.add_argument("--repl", action="store_true", help="read the queries from stdin till QUIT")
+    arg_parser.add_argument("--batch", metavar="FILE",
+                            help="run the queries of FILE (each ending with ';') as a batch sharing scans and joins")
+    arg_parser.add_argument("--listen", metavar="ADDRESS",
+                            help="serve queries on a unix socket path or HOST:PORT, see client.py")
+    args = arg_parser.parse_args()
+    if args.query is None and not args.repl and args.listen is None and args.batch is None:
+        arg_parser.error("a query is needed unless --repl, --listen or --batch is used")
+    out = open(args.output, "w", buffering=1 << 20) if args.output is not None else None
+    minisql = MiniSQL(args.backend, cache_dir=None if args.no_cache else ".minisql_cache", workers=args.workers,
+                      stream=args.stream, output_format=args.format, out=out,
+                      result_cache=not args.no_result_cache)
+    if args.listen is not None:
+        server.serve(args.listen, lambda query: run_query(minisql, query))
+    elif args.repl:
+        repl(minisql)
+    elif args.batch is not None:
+        with open(args.batch) as query_file:
+            run_batch(minisql, list(read_queries(query_file)))
+    elif args.query.upper() == "QUIT":
+        print("Ok")
+    else:
+        run_query(minisql, args.query)
+    if out is not None:
+        out.close()
+    if args.load_stats:
+        for table, stats in minisql.load_stats.items():
+            print(format_stats(table, stats), file=sys.stderr)
+            if minisql.backend == "compact" and table in minisql.database.keys():
+                print(table + " : " + encoding.describe(minisql.database[table]), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,91 @@
+import sys
+import json
+import itertools
+
+FORMATS = ("table", "csv", "tsv", "jsonl")
+BATCH_ROWS = 4096  # rows formatted and written at a time
+NULLS = {"table": "NULL", "csv": "", "tsv": "", "jsonl": "null"}  # how each format writes a missing value (None)
+
+
+def column_batches(table, batch_rows=BATCH_ROWS):
+    """
+    Gives the rows of a table in column form as batches (lists) of tuples, without converting the whole table. The
+    first column gives the number of rows, a shorter column (an aggregate selected along with other columns) is None
+    in the rows past its end.
+    args : table -> Relation (dictionary in column form, lists or numpy arrays)
+    """
+    columns = list(table.values())
+    n_rows = len(columns[0]) if len(columns) > 0 else 0
+    if any(len(values) > n_rows for values in columns):
+        # as with row_form, the first column gives the number of rows of the table
+        raise IndexError("list index out of range")
+    padded = any(len(values) < n_rows for values in columns)
+    for low in range(0, n_rows, batch_rows):
+        parts = [values[low:low + batch_rows] for values in columns]
+        parts = [part.tolist() if hasattr(part, "tolist") else part for part in parts]
+        if not padded:
+            yield list(zip(*parts))
+        else:
+            yield list(itertools.zip_longest(*parts))
+
+
+def row_batches(rows, batch_rows=BATCH_ROWS):
+    """
+    Gives a list of rows (as given by distinct) as batches
+    """
+    for low in range(0, len(rows), batch_rows):
+        yield rows[low:low + batch_rows]
+
+
+def with_nulls(batch, null):
+    """
+    The rows of the batch with their None values written as null
+    """
+    return [row if None not in row else tuple(null if entry is None else entry for entry in row) for row in batch]
+
+
+def write_rows(headings, batches, fmt="table", out=None, sep=None, top_sep=True):
+    """
+    Writes the result of a query, one write per batch of rows
+    args : headings -> names of the columns
+            batches -> iterable of batches (lists) of rows (tuples)
+            fmt -> "table" (the pretty table), "csv", "tsv" (both with a header line) or "jsonl" (an object per row)
+            out -> file to write to (None means stdout)
+            sep -> separator line of the table (None means one dash group per column)
+            top_sep -> the table starts with a separator line
+    A None value is written as NULL in the table, as an empty value in csv and tsv and as null in jsonl.
+    """
+    out = sys.stdout if out is None else out
+    if fmt not in FORMATS:
+        raise NotImplementedError(str(fmt) + " output format is not implemented in Mini SQL")
+    if fmt == "table":
+        sep = len(headings) * "-----------------" if sep is None else sep
+        out.write((sep + "\n" if top_sep else "") + "".join(str(key) + "\t" for key in headings) + "\n" + sep + "\n")
+        for batch in batches:
+            batch = with_nulls(batch, NULLS[fmt])
+            out.write("".join("".join(str(entry) + "\t\t" for entry in row) + "\n" for row in batch))
+            out.flush()
+        out.write(sep + "\n")
+    elif fmt == "jsonl":
+        keys = [json.dumps(str(key)) + ": " for key in headings]
+        for batch in batches:
+            batch = with_nulls(batch, NULLS[fmt])
+            out.write("".join("{" + ", ".join(key + str(entry) for key, entry in zip(keys, row)) + "}\n"
+                              for row in batch))
+            out.flush()
+    else:
+        delimiter = "," if fmt == "csv" else "\t"
+        out.write(delimiter.join(str(key) for key in headings) + "\n")
+        for batch in batches:
+            batch = with_nulls(batch, NULLS[fmt])
+            out.write("".join(delimiter.join(map(str, row)) + "\n" for row in batch))
+            out.flush()
+
+
+def write_distinct(headings, rows, fmt="table", out=None):
+    """
+    Writes the result of a DISTINCT query, the same with and without --stream. The table has no top separator line
+    and its separator lines have a dash group per row
+    args : rows -> list of the distinct rows (tuples)
+    """
+    write_rows(headings, row_batches(rows), fmt, out, len(rows) * "-----------------", top_sep=False)
@@ -0,0 +1,268 @@
+import atexit
+import operator
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # without numpy the workers loop over the shared columns in python
+    np = None
+
+OPERATORS = {'=': operator.eq, '<': operator.lt, '>': operator.gt, '>=': operator.ge, '<=': operator.le}
+
+_attached = {}  # shared memory blocks attached by this worker process, by name
+
+
+def attach(name):
+    """
+    Attaches (once per worker process) the shared memory block created by the parent, without letting the worker
+    unlink it when it exits
+    """
+    if name not in _attached:
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # python < 3.13 always registers the block with the resource tracker, which would unlink it when the
+            # worker exits (or forget the parent's registration when the tracker is shared)
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                block = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        _attached[name] = block
+    return _attached[name]
+
+
+def column_view(spec, low, high):
+    """
+    Gives rows low to high of a shared int64 column, as a numpy array if numpy is installed else as a memoryview
+    """
+    name, n_rows = spec
+    block = attach(name)
+    if np is not None:
+        return np.ndarray((n_rows,), dtype=np.int64, buffer=block.buf)[low:high]
+    return block.buf[:n_rows * 8].cast('q')[low:high]
+
+
+def partition_rows(columns, low, high, conditions, op):
+    """
+    Gives the rows (offsets from low, ascending) of the partition satisfying the conditions, None if all of them do
+    """
+    if len(conditions) == 0:
+        return None
+    if op not in ("AND", "OR") and len(conditions) > 1:
+        raise NotImplementedError("Invalid where condition (syntax error)")
+    if np is not None:
+        mask = None
+        for first, second, op_name in conditions:
+            other = int(second) if second.isdigit() else column_view(columns[second], low, high)
+            current = OPERATORS[op_name](column_view(columns[first], low, high), other)
+            if mask is None:
+                mask = current
+            elif op == "OR":
+                mask |= current
+            else:
+                mask &= current
+        return np.flatnonzero(mask)
+    checks = []
+    for first, second, op_name in conditions:
+        other = int(second) if second.isdigit() else None
+        checks.append((column_view(columns[first], low, high),
+                       column_view(columns[second], low, high) if other is None else None, other,
+                       OPERATORS[op_name]))
+    combine = any if op == "OR" else all
+    result = []
+    for i in range(high - low):
+        if combine(check(col[i], other if other_col is None else other_col[i])
+                   for col, other_col, other, check in checks):
+            result.append(i)
+    return result
+
+
+def scan_partition(task):
+    """
+    Worker task, filters one range of rows and gives either the matching rows or the partial aggregates
+    args : task -> (columns, low, high, conditions, op, group_column, aggregates) where columns maps the column names
+                    to their shared memory specs and aggregates is a list of (column, function), group_column and
+                    aggregates are None for just filtering
+    returns list of matching row indices, or (groups, partials) where groups are the group values in the order they
+            were first seen and partials[j] maps each group to the partial state of aggregate j
+    """
+    columns, low, high, conditions, op, group_column, aggregates = task
+    selected = partition_rows(columns, low, high, conditions, op)
+    if aggregates is None:
+        if selected is None:
+            return list(range(low, high))
+        return [low + int(i) for i in selected]
+
+    def values(column):
+        view = column_view(columns[column], low, high)
+        if selected is None:
+            return view
+        return view[selected] if np is not None else [view[i] for i in selected]
+
+    n_selected = (high - low) if selected is None else len(selected)
+    if np is not None:
+        return numpy_partials(values(group_column) if group_column is not None else None, values, n_selected,
+                              aggregates)
+    keys = list(values(group_column)) if group_column is not None else [None] * n_selected
+    groups = list(dict.fromkeys(keys))
+    partials = []
+    for column, fun in aggregates:
+        partial = {}
+        for k, v in zip(keys, values(column)):
+            state = partial.get(k)
+            if state is None:
+                partial[k] = [v, v, v, 1]  # sum, min, max, count
+            else:
+                state[0] += v
+                if v < state[1]:
+                    state[1] = v
+                if v > state[2]:
+                    state[2] = v
+                state[3] += 1
+        partials.append(partial)
+    return groups, partials
+
+
+def numpy_partials(keys, values, n_selected, aggregates):
+    """
+    Vectorized partial aggregates of a partition, the rows are sorted by group so that each group is a contiguous
+    slice for the reduceat kernels
+    args : keys -> group values of the selected rows (None if there is no grouping)
+            values -> function which gives the selected values of a column
+    """
+    if n_selected == 0:
+        return [], [{} for _ in aggregates]
+    if keys is None:
+        groups = [None]
+        order = slice(None)
+        starts = np.zeros(1, dtype=np.int64)
+        counts = np.array([n_selected])
+    else:
+        uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        groups = uniq.tolist()
+        order = np.argsort(inverse, kind='stable')
+        counts = np.bincount(inverse, minlength=len(uniq))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    partials = []
+    for column, fun in aggregates:
+        vals = values(column)[order]
+        states = zip(np.add.reduceat(vals, starts).tolist(), np.minimum.reduceat(vals, starts).tolist(),
+                     np.maximum.reduceat(vals, starts).tolist(), counts.tolist())
+        partials.append({k: list(state) for k, state in zip(groups, states)})
+    if keys is not None:
+        groups = [groups[i] for i in np.argsort(first, kind='stable')]  # in the order they were first seen
+    return groups, partials
+
+
+class ParallelExecutor:
+    """
+    Runs scans, filters and partial aggregations of a table on a pool of worker processes. Each column is copied once
+    to shared memory, the workers work on ranges of rows of the shared columns.
+    """
+
+    def __init__(self, workers, min_rows=100000):
+        self.workers = workers
+        self.min_rows = min_rows  # smaller tables are not worth starting the workers
+        self.pool = None
+        self.shared = {}  # table name -> OrderedDict of column name -> (SharedMemory, rows)
+        atexit.register(self.close)
+
+    def share(self, table, content):
+        """
+        Copies the columns of the table to shared memory (once per table)
+        returns the shared memory specs of the columns
+        """
+        if table not in self.shared:
+            blocks = OrderedDict()
+            for column, values in content.items():
+                block = shared_memory.SharedMemory(create=True, size=max(1, len(values) * 8))
+                if np is not None:
+                    np.ndarray((len(values),), dtype=np.int64, buffer=block.buf)[:] = values
+                else:
+                    target = block.buf[:len(values) * 8].cast('q')
+                    for i, v in enumerate(values):
+                        target[i] = v
+                    target.release()
+                blocks[column] = (block, len(values))
+            self.shared[table] = blocks
+        return {column: (block.name, n_rows) for column, (block, n_rows) in self.shared[table].items()}
+
+    def forget(self, table):
+        """
+        Drops the shared copy of the table, to be called when its content changes
+        """
+        for block, _ in self.shared.pop(table, {}).values():
+            block.close()
+            block.unlink()
+
+    def run(self, table, content, n_rows, conditions, op, group_column=None, aggregates=None):
+        columns = self.share(table, content)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        step = max(1, -(-n_rows // (self.workers * 2)))
+        tasks = [(columns, low, min(n_rows, low + step), conditions, op, group_column, aggregates)
+                 for low in range(0, n_rows, step)]
+        return list(self.pool.map(scan_partition, tasks))
+
+    def filter(self, table, content, n_rows, conditions, op):
+        """
+        Gives the indices (ascending) of the rows of the table satisfying the conditions
+        """
+        result = []
+        for rows in self.run(table, content, n_rows, conditions, op):
+            result.extend(rows)
+        return result
+
+    def aggregate(self, table, content, n_rows, conditions, op, group_column, aggregates):
+        """
+        Filters the table and aggregates the rows per group, the partial aggregates of the workers are merged here
+        args : aggregates -> list of (column, function) where function is one of COUNT, SUM, MIN, MAX, AVG
+        returns (groups, results) where groups are the group values in the order they were first seen (just None
+                without group_column) and results[j] maps each group to the value of aggregate j
+        """
+        groups = OrderedDict()
+        merged = [{} for _ in aggregates]
+        for part_groups, partials in self.run(table, content, n_rows, conditions, op, group_column, aggregates):
+            for k in part_groups:
+                groups[k] = True
+            for j in range(len(aggregates)):
+                for k, state in partials[j].items():
+                    total = merged[j].get(k)
+                    if total is None:
+                        merged[j][k] = state
+                    else:
+                        total[0] += state[0]
+                        total[1] = min(total[1], state[1])
+                        total[2] = max(total[2], state[2])
+                        total[3] += state[3]
+        results = []
+        for j in range(len(aggregates)):
+            fun = aggregates[j][1]
+            result = {}
+            for k, (total, low, high, count) in merged[j].items():
+                if fun == 'SUM':
+                    result[k] = total
+                elif fun == 'MIN':
+                    result[k] = low
+                elif fun == 'MAX':
+                    result[k] = high
+                elif fun == 'COUNT':
+                    result[k] = count
+                elif fun == 'AVG':
+                    result[k] = total / count
+                else:
+                    raise NotImplementedError(str(fun) + " function is not implemented in Mini SQL")
+            results.append(result)
+        return list(groups.keys()), results
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        for table in list(self.shared.keys()):
+            self.forget(table)
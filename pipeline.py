@@ -0,0 +1,629 @@
+"""
+Pull based (volcano style) execution of the queries. Every operator is iterable, iterating it gives batches (lists)
+of rows (tuples) with the values of its columns, in order. An operator pulls the batches of its input only when its
+own next batch is asked for, so a query without GROUP BY, ORDER BY or an aggregate keeps just a few batches in memory
+and the first rows are printed before the tables are fully scanned.
+"""
+import time
+import heapq
+import tracemalloc
+from collections import OrderedDict
+from parallel import OPERATORS
+from sketch import HyperLogLog, PRECISION, GROUP_PRECISION
+import explain
+import output
+
+BATCH_SIZE = 1024  # rows passed from an operator to the next one at a time
+
+
+def column_values(values, rows):
+    """
+    Gives the values of the column at the given rows as a python list
+    args : values -> column (list, numpy array or encoded column)
+            rows -> row indices (list, range or numpy array)
+    """
+    if hasattr(values, "tolist"):
+        return values[rows].tolist() if not isinstance(rows, range) else values[rows.start:rows.stop].tolist()
+    if isinstance(rows, range):
+        return values[rows.start:rows.stop]
+    if hasattr(values, "take"):
+        return values.take(rows)  # encoded column (see encoding.py)
+    return [values[i] for i in rows]
+
+
+def position(columns, column):
+    """
+    Position of the column in the rows of an operator, a missing column raises KeyError like a missing key of a table
+    """
+    if column not in columns:
+        raise KeyError(column)
+    return columns.index(column)
+
+
+class Scan:
+    """
+    Gives the rows of a base table (in column form), all of them or just the ones in the selection vector
+    """
+
+    inputs = ()
+
+    def __init__(self, content, rows=None, batch_size=BATCH_SIZE, name=""):
+        """
+        args : content -> table in column form
+                rows -> selection vector of the rows to be given, in that order (None means all the rows)
+                name -> name of the table
+        """
+        self.name = name
+        self.content = content
+        self.rows = rows
+        self.batch_size = batch_size
+        self.columns = list(content.keys())
+
+    def describe(self):
+        return "Scan", self.name + (" (" + str(len(self.rows)) + " rows given by an index)" if self.rows is not None
+                                    else "")
+
+    def __iter__(self):
+        rows = self.rows
+        if rows is None:
+            n_rows = 0
+            for values in self.content.values():
+                n_rows = len(values)
+                break
+            rows = range(n_rows)
+        for low in range(0, len(rows), self.batch_size):
+            block = rows[low:low + self.batch_size]
+            yield list(zip(*[column_values(values, block) for values in self.content.values()]))
+
+
+class Filter:
+    """
+    Keeps the rows satisfying the conditions, joined by op
+    """
+    inputs = ("child",)
+
+    def __init__(self, child, conditions, op=None):
+        """
+        args : child -> input operator
+                conditions -> list of tuples (first, second, operator), second is a column or a constant
+                op -> 'AND' or 'OR' (None if there is just one condition)
+        """
+        if len(conditions) > 1 and op not in ("AND", "OR"):
+            raise NotImplementedError("Invalid where condition (syntax error)")
+        self.child = child
+        self.conditions = conditions
+        self.op = op
+        self.columns = child.columns
+        self.checks = []
+        for first, second, operator in conditions:
+            if operator not in OPERATORS:
+                raise NotImplementedError(str(operator) + " is not implemented in Mini SQL")
+            if second.isdigit():
+                self.checks.append((position(self.columns, first), None, int(second), OPERATORS[operator]))
+            else:
+                self.checks.append((position(self.columns, first), position(self.columns, second), None,
+                                    OPERATORS[operator]))
+
+    def describe(self):
+        return "Filter", explain.conditions_text(self.conditions, self.op)
+
+    def test(self, row):
+        combine = any if self.op == "OR" else all
+        return combine(check(row[first], value if second is None else row[second])
+                       for first, second, value, check in self.checks)
+
+    def __iter__(self):
+        test = self.test
+        for batch in self.child:
+            kept = [row for row in batch if test(row)]
+            if len(kept) > 0:
+                yield kept
+
+
+class Join:
+    """
+    Joins the rows of the left input with the rows of the right input. With links it is a hash join, the right input
+    is the build side and the left one is streamed as the probe side, else it is the cartesian product. The rows come
+    in the order of the left rows, and for each of them in the order of the matching right rows.
+    """
+    inputs = ("left", "right")
+
+    def __init__(self, left, right, links=()):
+        """
+        args : left, right -> input operators
+                links -> list of (column of left, column of right) which must be equal
+        """
+        self.left = left
+        self.right = right
+        self.columns = left.columns + right.columns
+        self.links = [(position(left.columns, first), position(right.columns, second)) for first, second in links]
+
+    def describe(self):
+        if len(self.links) == 0:
+            return "CartesianProduct", ""
+        return "HashJoin", explain.conditions_text([(self.left.columns[first], self.right.columns[second], '=')
+                                                    for first, second in self.links], "AND")
+
+    def __iter__(self):
+        build = {}
+        right_rows = []
+        for batch in self.right:
+            if len(self.links) == 0:
+                right_rows.extend(batch)
+                continue
+            for row in batch:
+                build.setdefault(tuple(row[pos] for _, pos in self.links), []).append(row)
+        for batch in self.left:
+            joined = []
+            for row in batch:
+                if len(self.links) == 0:
+                    matches = right_rows
+                else:
+                    matches = build.get(tuple(row[pos] for pos, _ in self.links), ())
+                for match in matches:
+                    joined.append(row + match)
+                if len(joined) >= BATCH_SIZE:
+                    yield joined
+                    joined = []
+            if len(joined) > 0:
+                yield joined
+
+
+class Aggregate:
+    """
+    Hash aggregation of the input (blocking), one row per group with the aggregates followed by the grouped column
+    as group_by gives, or without a grouped column one row with the aggregates of all the rows as aggregate gives
+    """
+    FUNCTIONS = ("SUM", "MIN", "MAX", "COUNT", "AVG", "COUNT_DISTINCT", "APPROX_COUNT_DISTINCT")
+    inputs = ("child",)
+
+    def __init__(self, child, column, col_operation):
+        """
+        args : child -> input operator
+                column -> grouped column (None aggregates all the rows together)
+                col_operation -> a dictionary which maps cols to aggregate functions
+        """
+        self.child = child
+        self.column = column
+        self.functions = list(col_operation.values())
+        self.columns = [explain.aggregate_name(key, fun) for key, fun in col_operation.items()]
+        if column is not None:
+            if column not in child.columns:
+                raise NotImplementedError(str(column) + " column does not exist in this table (projection)")
+            self.columns.append(column)
+        self.positions = []
+        for key, fun in col_operation.items():
+            if key == '*':
+                key = column if column is not None else child.columns[0]
+            if key not in child.columns:
+                raise NotImplementedError("Table does not have any column named " + str(key))
+            if fun not in Aggregate.FUNCTIONS:
+                raise NotImplementedError(str(fun) + " function is not implemented in Mini SQL")
+            self.positions.append(child.columns.index(key))
+
+    def describe(self):
+        aggregates = ", ".join(self.columns[:len(self.functions)])
+        return "HashAggregate", aggregates + (" GROUP BY " + self.column if self.column is not None else "")
+
+    def __iter__(self):
+        # sum, min, max and count of every aggregate of every group (and the set of its values for COUNT DISTINCT, or
+        # the sketch of them for APPROX_COUNT_DISTINCT), dict keeps the groups in the order they were first seen
+        states = {}
+        group = None if self.column is None else self.child.columns.index(self.column)
+        distinct = [fun == "COUNT_DISTINCT" for fun in self.functions]
+        sketched = [fun == "APPROX_COUNT_DISTINCT" for fun in self.functions]
+        precision = PRECISION if group is None else GROUP_PRECISION
+        for batch in self.child:
+            for row in batch:
+                key = None if group is None else row[group]
+                state = states.get(key)
+                if state is None:
+                    state = states[key] = [[row[pos], row[pos], row[pos], 1] + ([{row[pos]}] if values else [])
+                                           for pos, values in zip(self.positions, distinct)]
+                    for partial, pos, sketch in zip(state, self.positions, sketched):
+                        if sketch:
+                            partial.append(HyperLogLog(precision))
+                            partial[4].add_value(row[pos])
+                    continue
+                for partial, pos, values, sketch in zip(state, self.positions, distinct, sketched):
+                    v = row[pos]
+                    partial[0] += v
+                    if v < partial[1]:
+                        partial[1] = v
+                    if v > partial[2]:
+                        partial[2] = v
+                    partial[3] += 1
+                    if values:
+                        partial[4].add(v)
+                    elif sketch:
+                        partial[4].add_value(v)
+        if group is None:
+            state = states.get(None, [None] * len(self.functions))
+            yield [tuple(Aggregate.total(fun, partial) for fun, partial in zip(self.functions, state))]
+            return
+        result = []
+        for key, state in states.items():
+            result.append(tuple(Aggregate.total(fun, partial) for fun, partial in zip(self.functions, state))
+                          + (key,))
+            if len(result) >= BATCH_SIZE:
+                yield result
+                result = []
+        if len(result) > 0:
+            yield result
+
+    @staticmethod
+    def empty(fun):
+        """
+        Aggregate of no rows, the same on every backend : MIN and MAX are 1e9 and -1e9, SUM and AVG are None (NULL)
+        """
+        if fun in ('SUM', 'AVG'):
+            return None
+        if fun in ('MIN', 'MAX', 'COUNT', 'COUNT_DISTINCT', 'APPROX_COUNT_DISTINCT'):
+            return {'MIN': int(1e9), 'MAX': int(-1e9)}.get(fun, 0)
+        raise NotImplementedError(str(fun) + " function is not implemented in Mini SQL")
+
+    @staticmethod
+    def total(fun, partial):
+        """
+        Final value of the aggregate from its (sum, min, max, count[, values or sketch]), None partial means there
+        were no rows. MIN and MAX start from 1e9 and -1e9 (grouped or not), as aggregate does
+        """
+        if partial is None:
+            return Aggregate.empty(fun)
+        total, low, high, count = partial[:4]
+        if fun == 'SUM':
+            return total
+        elif fun == 'MIN':
+            return min(int(1e9), low)
+        elif fun == 'MAX':
+            return max(int(-1e9), high)
+        elif fun == 'COUNT':
+            return count
+        elif fun == 'COUNT_DISTINCT':
+            return len(partial[4])
+        elif fun == 'APPROX_COUNT_DISTINCT':
+            return partial[4].count()
+        return total / count
+
+
+class Sort:
+    """
+    Sorts the input on a column (blocking, stable), with limit only the first limit rows are kept in a bounded heap
+    """
+    inputs = ("child",)
+
+    def __init__(self, child, column, sorting_type, limit=None):
+        self.child = child
+        self.columns = child.columns
+        self.key = position(self.columns, column)
+        self.sorting_type = sorting_type
+        self.limit = limit
+
+    def describe(self):
+        detail = self.columns[self.key] + " " + self.sorting_type
+        return "Sort", detail + (" (top " + str(self.limit) + " rows)" if self.limit is not None else "")
+
+    def __iter__(self):
+        rows = (row for batch in self.child for row in batch)
+        key = lambda row: row[self.key]
+        if self.limit is not None:
+            if self.sorting_type == "ASC":
+                rows = heapq.nsmallest(self.limit, rows, key=key)
+            else:
+                rows = heapq.nlargest(self.limit, rows, key=key)
+        else:
+            rows = sorted(rows, key=key, reverse=(self.sorting_type != "ASC"))
+        for low in range(0, len(rows), BATCH_SIZE):
+            yield rows[low:low + BATCH_SIZE]
+
+
+class Project:
+    """
+    Keeps the given columns of the rows, in that order
+    """
+    inputs = ("child",)
+
+    def __init__(self, child, column_list):
+        self.child = child
+        if len(column_list) == 1 and column_list[0] == '*':
+            column_list = child.columns
+        for column in column_list:
+            if column not in child.columns:
+                raise NotImplementedError(str(column) + " column does not exist in this table (projection)")
+        self.columns = list(column_list)
+        self.positions = [child.columns.index(column) for column in column_list]
+
+    def describe(self):
+        return "Project", ", ".join(self.columns)
+
+    def __iter__(self):
+        if self.positions == list(range(len(self.child.columns))):
+            yield from self.child
+            return
+        positions = self.positions
+        for batch in self.child:
+            yield [tuple(row[pos] for pos in positions) for row in batch]
+
+
+class Distinct:
+    """
+    Keeps the first occurrence of every row, the rows are given as soon as they are seen
+    """
+    inputs = ("child",)
+
+    def __init__(self, child):
+        self.child = child
+        self.columns = child.columns
+
+    def describe(self):
+        return "Distinct", ", ".join(self.columns)
+
+    def __iter__(self):
+        seen = set()
+        for batch in self.child:
+            kept = []
+            for row in batch:
+                if row not in seen:
+                    seen.add(row)
+                    kept.append(row)
+            if len(kept) > 0:
+                yield kept
+
+
+class Limit:
+    """
+    Skips offset rows and gives the next limit rows (None means all), the input is not pulled any further after that
+    """
+    inputs = ("child",)
+
+    def __init__(self, child, limit, offset=0):
+        self.child = child
+        self.columns = child.columns
+        self.limit = limit
+        self.offset = offset
+
+    def describe(self):
+        return "Limit", "LIMIT " + str(self.limit) + " OFFSET " + str(self.offset)
+
+    def __iter__(self):
+        to_skip = self.offset
+        to_give = self.limit
+        if to_give == 0:
+            return
+        for batch in self.child:
+            if to_skip >= len(batch):
+                to_skip -= len(batch)
+                continue
+            batch = batch[to_skip:]
+            to_skip = 0
+            if to_give is not None:
+                batch = batch[:to_give]
+                to_give -= len(batch)
+            yield batch
+            if to_give == 0:
+                return
+
+
+class Collect:
+    """
+    Passes the batches through and keeps a copy of the rows, as long as there are at most max_rows of them (rows is
+    None after that)
+    """
+    inputs = ("child",)
+
+    def __init__(self, child, max_rows):
+        self.child = child
+        self.columns = child.columns
+        self.max_rows = max_rows
+        self.rows = []
+
+    def describe(self):
+        return "Collect", "copy of the result for the result cache"
+
+    def __iter__(self):
+        for batch in self.child:
+            if self.rows is not None:
+                self.rows.extend(batch)
+                if len(self.rows) > self.max_rows:
+                    self.rows = None
+            yield batch
+
+
+def scan_plan(minisql, table, conditions, op):
+    """
+    Scan of a base table with the conditions pushed on it, a condition served by an index of the table gives the
+    rows to be scanned instead of checking all of them
+    """
+    content = minisql.database[table]
+    rows = None
+    if op != "OR" or len(conditions) == 1:
+        for i in range(len(conditions)):
+            rows = minisql.index_lookup(conditions[i], minisql.indexes.get(table))
+            if rows is not None:
+                conditions = conditions[:i] + conditions[i + 1:]
+                break
+    plan = Scan(content, rows, name=table)
+    if len(conditions) > 0:
+        plan = Filter(plan, conditions, op)
+    return plan
+
+
+def build_plan(minisql, info, col_op, group_by_first=False):
+    """
+    Builds the operator tree of a parsed query
+    args : minisql -> MiniSQL instance having the database
+            info -> dictionary given by MySQLParser
+            col_op -> maps the aggregated columns to their aggregate functions
+            group_by_first -> the WHERE conditions use the aggregates, hence are applied after GROUP BY
+    returns the root operator, None if the query is not run by pipelines (an aggregate without GROUP BY along with
+            other columns, or a TABLESAMPLE, which the materializing engine handles)
+    """
+    if not info["hasgroupby"] and len(col_op) == 1 and len(info["columns"]) != 1:
+        return None
+    if info["sample"] is not None:
+        return None
+    table_list = info["tables"]
+    for table in table_list:
+        if table not in minisql.tableInfo.keys():
+            raise FileNotFoundError(str(table) + " table does not exist in the database")
+    conditions = info["conditions"] if info["where"] else []
+    op = info["between_cond_op"]
+    if len(conditions) > 1 and op not in ("AND", "OR"):
+        raise NotImplementedError("Invalid where condition (syntax error)")
+    # the single table conditions are pushed on the scans of their tables
+    pushed = OrderedDict((table, []) for table in table_list)
+    remaining = conditions
+    if not group_by_first:
+        per_table, remaining = minisql.split_conditions(table_list, conditions, op)
+        pushed.update(per_table)
+    # left deep join in the order of the tables, each table is joined on the equi-join conditions linking it with the
+    # tables before it, so the rows are in the same order as the cartesian product would give
+    joined = [table_list[0]]
+    plan = scan_plan(minisql, table_list[0], pushed[table_list[0]], op)
+    predicates = []
+    if op == "AND" or len(remaining) == 1:
+        predicates = minisql.equi_join_predicates(table_list, remaining)
+    used = set()
+    for table in table_list[1:]:
+        links = []
+        for predicate in minisql.join_links(table, joined, predicates):
+            column, other, other_column = predicate
+            links.append((other_column, column))
+            used.add((column, other_column))
+        plan = Join(plan, scan_plan(minisql, table, pushed[table], op), links)
+        joined.append(table)
+    remaining = [cond for cond in remaining
+                 if cond[2] != '=' or ((cond[0], cond[1]) not in used and (cond[1], cond[0]) not in used)]
+    if group_by_first:
+        plan = Aggregate(plan, info["groupby"][0], col_op)
+    if len(remaining) > 0:
+        plan = Filter(plan, remaining, op if len(remaining) > 1 else None)
+    if info["hasgroupby"] and not group_by_first:
+        plan = Aggregate(plan, info["groupby"][0], col_op)
+    needed_rows = None if info["limit"] is None else info["offset"] + info["limit"]
+    if info["hasorderby"]:
+        top_rows = None
+        if not info["distinct"] and (info["hasgroupby"] or len(col_op) == 0):
+            top_rows = needed_rows
+        plan = Sort(plan, str(info["orderby"][0]), info["orderbytype"], top_rows)
+    if not info["hasgroupby"] and len(col_op) == 1:
+        plan = Aggregate(plan, None, col_op)
+    plan = Project(plan, info["columns"])
+    if info["distinct"]:
+        plan = Distinct(plan)
+    if info["limit"] is not None or info["offset"] > 0:
+        plan = Limit(plan, info["limit"], info["offset"])
+    return plan
+
+
+def describe(plan, depth=0):
+    """
+    Gives the operators of the tree (each one before its inputs, indented by its depth) as a list of
+    (operator, detail), for EXPLAIN
+    """
+    name, detail = plan.describe()
+    operators = [("  " * depth + name, detail)]
+    for child in plan.inputs:
+        operators.extend(describe(getattr(plan, child), depth + 1))
+    return operators
+
+
+class Measured:
+    """
+    Passes the batches of an operator through, counting its rows, the time spent in it (along with its inputs) and,
+    while tracemalloc traces, the peak memory allocated while it gives a batch (along with its inputs), for EXPLAIN
+    ANALYZE
+    """
+    inputs = ("child",)
+
+    def __init__(self, child, active=None):
+        """
+        args : active -> stack of [operator, peak, base] of the measured operators giving a batch, shared by the
+                         operators of the tree (a nested operator resets the peak of tracemalloc, so it passes the peak
+                         reached so far to the operator it is nested in)
+        """
+        self.child = child
+        self.columns = child.columns
+        self.rows = 0
+        self.seconds = 0
+        self.peak_bytes = None
+        self.active = active if active is not None else []
+
+    def enter(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if len(self.active) > 0:
+            self.active[-1][1] = max(self.active[-1][1], peak)
+        tracemalloc.reset_peak()
+        self.active.append([self, current, current])
+
+    def leave(self):
+        _, peak, base = self.active.pop()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        self.peak_bytes = max(self.peak_bytes or 0, peak - base)
+        if len(self.active) > 0:
+            self.active[-1][1] = max(self.active[-1][1], peak)
+
+    def __iter__(self):
+        batches = iter(self.child)
+        while True:
+            tracing = tracemalloc.is_tracing()
+            start = time.perf_counter()
+            if tracing:
+                self.enter()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                return
+            finally:
+                if tracing:
+                    self.leave()
+                self.seconds += time.perf_counter() - start
+            self.rows += len(batch)
+            yield batch
+
+
+def measure(plan):
+    """
+    Wraps every operator of the tree in Measured
+    returns (root, list of (depth, operator, measured, list of the measured inputs))
+    """
+    measured = []
+    active = []
+
+    def wrap(operator, depth):
+        entry = (depth, operator, Measured(operator, active), [])
+        measured.append(entry)
+        for name in operator.inputs:
+            child = wrap(getattr(operator, name), depth + 1)
+            entry[3].append(child)
+            setattr(operator, name, child)
+        return entry[2]
+
+    return wrap(plan, 0), measured
+
+
+def profile(measured, profiler):
+    """
+    Adds the metrics of the measured operators to the profile, the time of an operator is the time spent in it
+    without the time spent in its inputs, its peak memory includes the memory its inputs allocated
+    """
+    for depth, operator, metrics, inputs in measured:
+        name, detail = operator.describe()
+        profiler.add("  " * depth + name, detail, metrics.seconds - sum(child.seconds for child in inputs),
+                     sum(child.rows for child in inputs) if len(inputs) > 0 else None, metrics.rows, metrics.peak_bytes)
+        # the operators reset the peak of tracemalloc, the peak of the query is at least theirs
+        profiler.peak_bytes = max(profiler.peak_bytes, metrics.peak_bytes or 0)
+
+
+def show_output(plan, fmt="table", out=None, distinct=False):
+    """
+    Prints the rows of the plan as they come
+    args : fmt -> one of output.FORMATS
+            out -> file to write to (None means stdout)
+            distinct -> the plan gives the rows of a DISTINCT query, the table (the separator lines are as long as the
+                        rows are many, see output.write_distinct) is printed once all of them are given
+    """
+    if distinct and fmt == "table":
+        output.write_distinct(plan.columns, [row for batch in plan for row in batch], fmt, out)
+    else:
+        output.write_rows(plan.columns, plan, fmt, out)
@@ -0,0 +1,214 @@
+import itertools
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # numpy columns are possible only when numpy is installed
+    np = None
+
+SAMPLE_ROWS = 1 << 16  # rows looked at to estimate the number of distinct values of a column
+DEFAULT_SELECTIVITY = 1 / 3  # fraction of rows kept by a condition the statistics can not estimate
+MAX_DP_TABLES = 10  # more tables than these are ordered greedily
+
+
+def is_array(values):
+    return np is not None and isinstance(values, np.ndarray)
+
+
+def estimate_distinct(sample, n_rows):
+    """
+    Estimates the number of distinct values of a column of n_rows rows from an evenly spaced sample of its rows, using
+    the GEE estimator : the values seen once in the sample are scaled up by sqrt(rows / sample rows), the others are
+    counted as they are. The count is exact when the sample has all the rows.
+    """
+    if len(sample) == 0:
+        return 0
+    if is_array(sample):
+        counts = np.unique(sample, return_counts=True)[1]
+        seen, once = len(counts), int(np.count_nonzero(counts == 1))
+    else:
+        counts = {}
+        for v in sample:
+            counts[v] = counts.get(v, 0) + 1
+        seen, once = len(counts), sum(1 for c in counts.values() if c == 1)
+    if len(sample) == n_rows:
+        return seen
+    return min(n_rows, int(round((n_rows / len(sample)) ** 0.5 * once + seen - once)))
+
+
+class ColumnStats:
+    """
+    Number of distinct values (estimated), minimum and maximum of a column. The distinct values are estimated from a
+    sample of every step-th row, which is kept so that appended rows update the statistics without a new scan.
+    """
+
+    def __init__(self, values):
+        self.rows = 0
+        self.step = max(1, len(values) // SAMPLE_ROWS)
+        self.sample = values[:0] if is_array(values) else []
+        self.min = self.max = None
+        self.distinct = 0
+        self.append(values)
+
+    def append(self, values):
+        """
+        Updates the statistics with the values of rows appended to the column
+        """
+        if len(values) == 0:
+            return
+        first = -self.rows % self.step  # first of the new rows which is a multiple of step
+        if is_array(values):
+            low, high = int(values.min()), int(values.max())
+            self.sample = np.concatenate((np.asarray(self.sample, dtype=values.dtype), values[first::self.step]))
+        else:
+            low, high = min(values), max(values)
+            self.sample.extend(values[first::self.step])
+        self.rows += len(values)
+        while len(self.sample) > 2 * SAMPLE_ROWS:
+            # every other sampled row is dropped, the sample keeps every (2 * step)-th row
+            self.sample = self.sample[::2]
+            self.step *= 2
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self.distinct = estimate_distinct(self.sample, self.rows)
+
+    def selectivity(self, operator, value):
+        """
+        Estimated fraction of the rows whose value satisfies the condition with a constant, assuming the values are
+        spread evenly between the minimum and the maximum
+        """
+        if self.min is None:
+            return 0.0
+        if operator == '=':
+            return 0.0 if value < self.min or value > self.max else 1 / max(1, self.distinct)
+        width = self.max - self.min + 1
+        if operator in ('<', '<='):
+            below = value - self.min + (1 if operator == '<=' else 0)
+            return min(1.0, max(0.0, below / width))
+        if operator in ('>', '>='):
+            above = self.max - value + (1 if operator == '>=' else 0)
+            return min(1.0, max(0.0, above / width))
+        return DEFAULT_SELECTIVITY
+
+    def __repr__(self):
+        return "ColumnStats(distinct={}, min={}, max={})".format(self.distinct, self.min, self.max)
+
+
+class TableStats:
+    """
+    Statistics of a table collected when it is loaded : its number of rows and the ColumnStats of each column
+    """
+
+    def __init__(self, content):
+        """
+        args : content -> the table in column form
+        """
+        self.rows = len(next(iter(content.values()))) if len(content) > 0 else 0
+        self.columns = OrderedDict((column, ColumnStats(values)) for column, values in content.items())
+
+    def append(self, content, low):
+        """
+        Updates the statistics with the rows low onwards of the table, which were appended to it
+        """
+        for column, values in content.items():
+            self.columns[column].append(values[low:])
+        self.rows = len(next(iter(content.values()))) if len(content) > 0 else 0
+
+    def selectivity(self, conditions, op=None):
+        """
+        Estimated fraction of the rows satisfying the conditions on the table, the conditions are taken as
+        independent of each other
+        args : conditions -> list of (first, second, operator), all of them on the columns of this table
+                op -> 'AND' or 'OR' joining the conditions
+        """
+        fractions = []
+        for first, second, operator in conditions:
+            if first in self.columns and second.isdigit():
+                fractions.append(self.columns[first].selectivity(operator, int(second)))
+            else:
+                fractions.append(DEFAULT_SELECTIVITY)
+        if op == "OR" and len(fractions) > 1:
+            none = 1.0
+            for fraction in fractions:
+                none *= 1 - fraction
+            return 1 - none
+        result = 1.0
+        for fraction in fractions:
+            result *= fraction
+        return result
+
+    def distinct(self, column, rows=None):
+        """
+        Estimated number of distinct values of the column among rows of the table (None means all of them)
+        """
+        distinct = self.columns[column].distinct
+        return max(1, distinct if rows is None else min(distinct, rows))
+
+
+def join_rows(rows, size, links, stats, tables):
+    """
+    Estimated rows of joining the already joined rows with a table of size rows
+    args : links -> (column of table, other table, column of other table) as given by MiniSQL.join_links
+            stats -> maps the table names to their TableStats
+            tables -> (new table, estimated rows of each joined table), to bound the distinct counts
+    """
+    table, sizes = tables
+    result = float(rows) * size
+    for column, other, other_column in links:
+        result /= max(stats[table].distinct(column, size), stats[other].distinct(other_column, sizes[other]))
+    return result
+
+
+def join_order(table_list, sizes, predicates, stats, join_links):
+    """
+    Picks the order in which the tables are joined (left deep) and the build side of each hash join, so that the
+    estimated rows of the intermediate results and of the hash tables are the smallest. Every subset of the tables is
+    planned (dynamic programming) for up to MAX_DP_TABLES tables, else the smallest next join is picked greedily.
+    A table not connected by a predicate to the tables joined so far (cartesian product) is added only when no
+    connected table is left. Ties keep the order of the FROM clause.
+    args : table_list -> tables to be joined, in the order of the FROM clause
+            sizes -> maps the table names to their (estimated) rows after the pushed down conditions
+            predicates -> equi-join predicates as given by MiniSQL.equi_join_predicates
+            stats -> maps the table names to their TableStats
+            join_links -> MiniSQL.join_links
+    returns list of (table, build side, estimated rows) in join order, build side is "table" when the hash table is
+            built on the new table and "joined" when it is built on the rows joined so far (None for the first table
+            and for cartesian products)
+    """
+
+    def extend(plan, table):
+        cost, rows, steps = plan
+        joined = [step[0] for step in steps]
+        links = join_links(table, joined, predicates)
+        new_rows = join_rows(rows, sizes[table], links, stats, (table, sizes))
+        build = None
+        if len(links) > 0:
+            build = "table" if sizes[table] <= rows else "joined"
+        return cost + new_rows + min(rows, sizes[table]), new_rows, steps + [(table, build, new_rows)]
+
+    def candidates(joined):
+        left = [table for table in table_list if table not in joined]
+        connected = [table for table in left if len(join_links(table, joined, predicates)) > 0]
+        return connected if len(connected) > 0 else left
+
+    if len(table_list) > MAX_DP_TABLES:
+        first = min(table_list, key=lambda table: sizes[table])
+        plan = (0.0, float(sizes[first]), [(first, None, float(sizes[first]))])
+        while len(plan[2]) < len(table_list):
+            joined = [step[0] for step in plan[2]]
+            plan = min((extend(plan, table) for table in candidates(joined)), key=lambda new: new[1])
+        return plan[2]
+    best = OrderedDict()  # frozenset of joined tables -> (cost, rows, steps)
+    for table in table_list:
+        best[frozenset([table])] = (0.0, float(sizes[table]), [(table, None, float(sizes[table]))])
+    for n_joined in range(1, len(table_list)):
+        for subset in itertools.combinations(table_list, n_joined):
+            plan = best.get(frozenset(subset))
+            if plan is None:
+                continue
+            for table in candidates([step[0] for step in plan[2]]):
+                new = extend(plan, table)
+                key = frozenset(subset + (table,))
+                if key not in best or new[0] < best[key][0]:
+                    best[key] = new
+    return best[frozenset(table_list)][2]
@@ -0,0 +1,94 @@
+import io
+import os
+import threading
+import contextlib
+import socketserver
+
+
+def parse_address(address):
+    """
+    Gives (is_unix, address) for a HOST:PORT address or a unix socket path
+    """
+    host, sep, port = address.rpartition(':')
+    if sep != '' and port.isdigit():
+        return False, (host if host != '' else "127.0.0.1", int(port))
+    return True, address
+
+
+def write_message(stream, status, payload):
+    """
+    Sends one message, a "<status> <length>" line followed by length bytes of payload
+    """
+    data = payload.encode()
+    stream.write((status + " " + str(len(data)) + "\n").encode())
+    stream.write(data)
+    stream.flush()
+
+
+def read_message(stream):
+    """
+    Receives one message sent by write_message
+    returns (status, payload), (None, None) if the connection got closed
+    """
+    header = stream.readline()
+    if header == b"":
+        return None, None
+    status, length = header.decode().split()
+    return status, stream.read(int(length)).decode()
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    """
+    Every line received is a query, the reply is its printed output (status OK) or the error (status ERROR).
+    QUIT closes the connection.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            query = line.decode().strip()
+            if query == "":
+                continue
+            if query.upper() == "QUIT":
+                write_message(self.wfile, "OK", "Ok\n")
+                break
+            out = io.StringIO()
+            try:
+                # the output is captured from stdout, hence one query runs at a time
+                with self.server.lock, contextlib.redirect_stdout(out):
+                    self.server.run(query)
+            except Exception as e:
+                write_message(self.wfile, "ERROR", type(e).__name__ + " : " + str(e))
+            else:
+                write_message(self.wfile, "OK", out.getvalue())
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(address, run):
+    """
+    Serves queries till interrupted, the database stays loaded between the queries
+    args : address -> unix socket path or HOST:PORT
+            run -> function which runs a query and prints its result
+    """
+    is_unix, address = parse_address(address)
+    if is_unix and os.path.exists(address):
+        os.unlink(address)  # stale socket left by an earlier server
+    server_class = ThreadingUnixServer if is_unix else ThreadingTCPServer
+    with server_class(address, QueryHandler) as query_server:
+        query_server.run = run
+        query_server.lock = threading.Lock()
+        print("Mini SQL listening on " + str(address))
+        try:
+            query_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if is_unix and os.path.exists(address):
+                os.unlink(address)
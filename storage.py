@@ -0,0 +1,383 @@
+import os
+import sys
+import json
+import mmap
+import time
+import pickle
+import struct
+import hashlib
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # without numpy the cached columns are read back as python lists
+    np = None
+
+
+class ColumnCache:
+    """
+    Binary columnar cache of the parsed CSV tables.
+    Every table is stored in its own file, a header followed by each column as fixed width int64 values. The header
+    keeps the row count along with the mtime and size of the CSV file and of metadata.txt, if any of them changes the
+    cached file is not used (and is rewritten on the next load).
+    """
+    MAGIC = b"MSQL" + (b"LE" if sys.byteorder == "little" else b"BE") + b"01"
+    # magic, number of columns, number of rows, csv mtime, csv size, metadata mtime, metadata size
+    HEADER = struct.Struct("=8sqqqqqq")
+
+    def __init__(self, directory=".minisql_cache", metadata="metadata.txt"):
+        self.directory = directory
+        self.metadata = metadata
+
+    def path(self, table):
+        return os.path.join(self.directory, str(table) + ".bin")
+
+    def source_stamp(self, table):
+        """
+        Gives (csv mtime, csv size, metadata mtime, metadata size) which the cached file must match
+        """
+        csv_stat = os.stat(str(table) + ".csv")
+        meta_stat = os.stat(self.metadata)
+        return csv_stat.st_mtime_ns, csv_stat.st_size, meta_stat.st_mtime_ns, meta_stat.st_size
+
+    def load(self, table, columns, as_numpy=False):
+        """
+        Memory maps the cached file of the table
+        args : table -> name of the table
+                columns -> names of the columns of the table, in order
+                as_numpy -> give the columns as (read only) numpy arrays backed by the mapped file
+        returns the table in column form, None if there is no valid cached file
+        """
+        try:
+            with open(self.path(table), "rb") as cache_file:
+                mapped = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(mapped) < self.HEADER.size:
+            return None
+        magic, n_cols, n_rows, *stamp = self.HEADER.unpack_from(mapped, 0)
+        if magic != self.MAGIC or n_cols != len(columns) or tuple(stamp) != self.source_stamp(table):
+            return None
+        if len(mapped) != self.HEADER.size + n_cols * n_rows * 8:
+            return None
+        content = OrderedDict()
+        for i in range(n_cols):
+            offset = self.HEADER.size + i * n_rows * 8
+            if as_numpy:
+                content[columns[i]] = np.frombuffer(mapped, dtype=np.int64, count=n_rows, offset=offset)
+            else:
+                content[columns[i]] = memoryview(mapped)[offset:offset + n_rows * 8].cast("q").tolist()
+        return content
+
+    def store(self, table, content):
+        """
+        Writes the table (in column form) to its cached file, tables having values which do not fit in int64 are not
+        cached
+        """
+        stamp = self.source_stamp(table)
+        n_rows = len(next(iter(content.values()))) if len(content) > 0 else 0
+        if any(len(values) != n_rows for values in content.values()):
+            return False
+        try:
+            # numpy arrays and arrays of the array module are written as they are
+            packed = [values if hasattr(values, "tofile") else array("q", values) for values in content.values()]
+        except OverflowError:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        temp = self.path(table) + ".tmp"
+        with open(temp, "wb") as cache_file:
+            cache_file.write(self.HEADER.pack(self.MAGIC, len(content), n_rows, *stamp))
+            for values in packed:
+                values.tofile(cache_file)
+        os.replace(temp, self.path(table))  # readers never see a half written file
+        return True
+
+
+class SketchStore:
+    """
+    Keeps the HyperLogLog sketches of the columns on disk, one file per column : a header with the precision and the
+    mtime and size of the CSV file and of metadata.txt the sketch was built from, followed by the registers. A sketch
+    is used only as long as the files have not changed.
+    """
+    MAGIC = b"MSQLHLL1"
+    # magic, precision, csv mtime, csv size, metadata mtime, metadata size
+    HEADER = struct.Struct("=8sqqqqq")
+
+    def __init__(self, directory=".minisql_cache/sketches"):
+        self.directory = directory
+
+    def path(self, table, column):
+        return os.path.join(self.directory, str(table) + "." + str(column) + ".hll")
+
+    def load(self, table, column, stamp):
+        """
+        args : stamp -> ((mtime, size) of the CSV file, (mtime, size) of metadata.txt) the sketch must match
+        returns (precision, registers), None if there is no valid file
+        """
+        try:
+            with open(self.path(table, column), "rb") as sketch_file:
+                data = sketch_file.read()
+        except OSError:
+            return None
+        if len(data) < self.HEADER.size or not SketchStore.valid(stamp):
+            return None
+        magic, precision, *stored = self.HEADER.unpack_from(data, 0)
+        if magic != self.MAGIC or tuple(stored) != stamp[0] + stamp[1] or (
+                len(data) != self.HEADER.size + (1 << precision)):
+            return None
+        return precision, data[self.HEADER.size:]
+
+    @staticmethod
+    def valid(stamp):
+        """
+        Tells whether both files of the stamp exist and were read whole (a CSV file read up to a line still being
+        written has no mtime)
+        """
+        return None not in stamp and None not in stamp[0] + stamp[1]
+
+    def store(self, table, column, stamp, precision, registers):
+        if not SketchStore.valid(stamp):
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        temp = self.path(table, column) + ".tmp"
+        with open(temp, "wb") as sketch_file:
+            sketch_file.write(self.HEADER.pack(self.MAGIC, precision, *(stamp[0] + stamp[1])))
+            sketch_file.write(registers)
+        os.replace(temp, self.path(table, column))
+        return True
+
+
+def file_stamp(path):
+    """
+    Gives (mtime, size) of the file, None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ResultCache:
+    """
+    LRU cache of query results, keyed by the normalized parsed query. Each entry keeps the mtime and size of the CSV
+    files of the tables used by the query and of metadata.txt, a lookup gives the result only if none of them has
+    changed. The results are kept pickled, the memory used is bounded by max_bytes (least recently used entries are
+    evicted). With a directory each result is written to a file too, so later runs find it, the files are bounded by
+    max_bytes as well.
+    """
+
+    def __init__(self, directory=None, max_bytes=64 << 20, metadata="metadata.txt"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.metadata = metadata
+        self.entries = OrderedDict()  # key -> (stamp, pickled result)
+        self.n_bytes = 0
+
+    @staticmethod
+    def key(info, *extra):
+        """
+        Normalized text of the parsed query, the conditions are sorted as their order does not change the result
+        args : info -> dictionary given by MySQLParser
+                extra -> other settings which change the result
+        """
+        normalized = OrderedDict(info)
+        normalized["conditions"] = sorted(list(cond) for cond in info["conditions"])
+        return json.dumps([normalized, list(extra)], sort_keys=True)
+
+    def stamp(self, tables):
+        """
+        Gives the (mtime, size) of the CSV files of the tables and of metadata.txt
+        """
+        return tuple(file_stamp(str(table) + ".csv") for table in tables) + (file_stamp(self.metadata),)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".pkl")
+
+    def get(self, key, stamp):
+        """
+        returns the cached result, None if there is none for the key or the files have changed since it was stored
+        """
+        entry = self.entries.get(key)
+        if entry is None and self.directory is not None:
+            try:
+                with open(self.path(key), "rb") as result_file:
+                    stored_key, stored_stamp, blob = pickle.load(result_file)
+            except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+                return None
+            if stored_key != key:
+                return None
+            os.utime(self.path(key))  # the modification time orders the files for eviction
+            entry = (tuple(stored_stamp), blob)
+            self.remember(key, entry)
+        if entry is None:
+            return None
+        if entry[0] != stamp:
+            self.forget(key)
+            return None
+        self.entries.move_to_end(key)
+        return pickle.loads(entry[1])
+
+    def put(self, key, stamp, result):
+        """
+        Stores the result (any picklable object) of the query, results bigger than max_bytes are not cached
+        """
+        blob = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return False
+        self.forget(key)
+        self.remember(key, (stamp, blob))
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            temp = self.path(key) + ".tmp"
+            with open(temp, "wb") as result_file:
+                pickle.dump((key, stamp, blob), result_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, self.path(key))
+            self.prune()
+        return True
+
+    def update(self, old_stamp, new_stamp, merge):
+        """
+        Brings the results (in memory) stored with old_stamp up to date with the files, which now have new_stamp
+        args : merge -> function of (key, result) which gives the updated result, None if the result has to be
+                        computed again (the entry is dropped)
+        """
+        for key in [key for key, (stamp, _) in self.entries.items() if stamp == old_stamp]:
+            entry = self.entries.get(key)  # updating an entry may evict others
+            if entry is None:
+                continue
+            result = merge(key, pickle.loads(entry[1]))
+            if result is None:
+                self.forget(key)
+            else:
+                self.put(key, new_stamp, result)
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.n_bytes += len(entry[1])
+        while self.n_bytes > self.max_bytes:
+            _, (_, blob) = self.entries.popitem(last=False)
+            self.n_bytes -= len(blob)
+
+    def forget(self, key):
+        """
+        Drops the entry of the key, from memory and from the directory
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.n_bytes -= len(entry[1])
+        if self.directory is not None:
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def prune(self):
+        """
+        Removes the least recently used files till the files take at most max_bytes
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+
+CHUNK_SIZE = 1 << 22  # bytes of the CSV file parsed at a time
+
+
+def parse_chunk(data, buffers):
+    """
+    Parses complete lines of a CSV file and appends their values to the column buffers, without making a string or a
+    list for each line
+    returns the number of rows parsed
+    """
+    n_cols = len(buffers)
+    n_lines = data.count(b"\n") + (0 if data.endswith(b"\n") else 1)
+    # a line separator becomes a separator followed by the newline, so the first value of every line starts with it
+    cells = data.replace(b"\n", b",\n").split(b",")
+    if data.endswith(b"\n"):
+        cells.pop()  # the last line separator gives a cell with just the newline
+    try:
+        # every line must have n_cols values, else the values would shift into the wrong rows : the first values of
+        # the lines are then at every n_cols-th cell, each of them with its newline
+        firsts = cells[n_cols::n_cols]
+        if len(cells) != n_lines * n_cols or b"".join(firsts).count(b"\n") != len(firsts):
+            raise ValueError
+        values = list(map(int, cells))  # int accepts the bytes along with the surrounding white space
+    except ValueError:
+        # blank lines or rows with the wrong number of values, checked line by line
+        values = []
+        for line in data.split(b"\n"):
+            if line.strip() == b"":
+                continue
+            row = line.split(b",")
+            if len(row) != n_cols:
+                raise ValueError("row " + repr(line.decode().strip()) + " does not have " + str(n_cols) + " values")
+            values.extend(map(int, row))
+        n_lines = len(values) // n_cols
+    for i in range(n_cols):
+        buffers[i].extend(values[i::n_cols])
+    return n_lines
+
+
+def read_csv_columns(path, columns, as_numpy=False, chunk_size=CHUNK_SIZE, offset=0, whole_lines=False):
+    """
+    Streams the CSV file in chunks of chunk_size bytes and parses every chunk straight into the column buffers, so the
+    memory needed is the column data plus one chunk
+    args : path -> CSV file
+            columns -> names of the columns, in order
+            as_numpy -> give the columns as int64 numpy arrays (the values are buffered as 8 byte integers), else as lists
+            offset -> position in the file (the start of a line) the rows are read from, to read just appended rows
+            whole_lines -> leave out a last line which does not end with a newline (it may still be being written)
+    returns (content, stats) where content is the table in column form and stats has the rows, bytes (parsed) and
+    seconds taken
+    """
+    start = time.perf_counter()
+    buffers = [array("q") if as_numpy else [] for _ in columns]
+    n_rows = 0
+    n_bytes = 0
+    rest = b""
+    with open(path, "rb") as csv_file:
+        csv_file.seek(offset)
+        while True:
+            chunk = csv_file.read(chunk_size)
+            if chunk == b"":
+                if whole_lines:
+                    n_bytes -= len(rest)
+                elif rest.strip() != b"":
+                    n_rows += parse_chunk(rest, buffers)
+                break
+            n_bytes += len(chunk)
+            cut = chunk.rfind(b"\n")
+            if cut < 0:
+                rest += chunk
+                continue
+            # the incomplete last line is kept for the next chunk
+            n_rows += parse_chunk(rest + chunk[:cut + 1], buffers)
+            rest = chunk[cut + 1:]
+    content = OrderedDict()
+    for column, values in zip(columns, buffers):
+        content[column] = np.frombuffer(values, dtype=np.int64) if as_numpy else values
+    stats = OrderedDict()
+    stats["rows"] = n_rows
+    stats["bytes"] = n_bytes
+    stats["seconds"] = time.perf_counter() - start
+    return content, stats
+
+
+def format_stats(table, stats):
+    """
+    One line report of the ingest throughput of a table
+    """
+    seconds = max(stats["seconds"], 1e-9)
+    return "{} : {} rows, {:.2f} MB from {} in {:.3f} s ({:.0f} rows/s, {:.2f} MB/s)".format(
+        table, stats["rows"], stats["bytes"] / 1e6, stats["source"], stats["seconds"], stats["rows"] / seconds,
+        stats["bytes"] / 1e6 / seconds)
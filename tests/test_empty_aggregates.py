@@ -0,0 +1,42 @@
+import io
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import MiniSQL, run_query, np  # noqa: E402
+
+BACKENDS = ["list", "compact"] + (["numpy"] if np is not None else [])
+EMPTY_WHERE = " FROM movie WHERE mov_year > 5000;"  # no movie is that recent
+
+
+@pytest.fixture(autouse=True)
+def in_repo(monkeypatch):
+    monkeypatch.chdir(ROOT)  # metadata.txt and the CSV files of the sample database
+
+
+def value(minisql, query):
+    minisql.out = io.StringIO()
+    run_query(minisql, query)
+    return minisql.out.getvalue().splitlines()[-1]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_empty_where(backend, stream, workers):
+    minisql = MiniSQL(backend, cache_dir=None, workers=workers, stream=stream, output_format="csv",
+                      result_cache=False)
+    if minisql.parallel is not None:
+        minisql.parallel.min_rows = 0  # the small sample tables are aggregated by the workers too
+    try:
+        assert value(minisql, "SELECT MAX(earnings)" + EMPTY_WHERE) == "-1000000000"
+        assert value(minisql, "SELECT MIN(earnings)" + EMPTY_WHERE) == "1000000000"
+        assert value(minisql, "SELECT COUNT(earnings)" + EMPTY_WHERE) == "0"
+        for fun in ("SUM", "AVG"):
+            assert value(minisql, "SELECT " + fun + "(earnings)" + EMPTY_WHERE) == ""  # NULL, an empty csv value
+    finally:
+        if minisql.parallel is not None:
+            minisql.parallel.close()
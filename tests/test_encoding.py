@@ -0,0 +1,57 @@
+import os
+import random
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import encoding  # noqa: E402
+
+COLUMNS = [encoding.PlainColumn, encoding.DictionaryColumn, encoding.RunLengthColumn]
+
+
+def clustered(n_rows, seed=7):
+    rng = random.Random(seed)
+    values = []
+    while len(values) < n_rows:
+        values.extend([rng.randint(-1000, 1000)] * rng.randint(1, 20))
+    return values[:n_rows]
+
+
+@pytest.mark.parametrize("kind", COLUMNS)
+def test_take_unsorted_rows(kind):
+    values = clustered(5000)
+    column = kind(values)
+    rng = random.Random(3)
+    rows = [rng.randrange(len(values)) for _ in range(3000)]
+    assert column.take(rows) == [values[i] for i in rows]
+    rows = sorted(rows, reverse=True)
+    assert column.take(rows) == [values[i] for i in rows]
+    rows = sorted(rows)
+    assert column.take(rows) == [values[i] for i in rows]
+
+
+@pytest.mark.parametrize("kind", COLUMNS)
+def test_filter_and_aggregate_match_list(kind):
+    values = clustered(2000)
+    column = kind(values)
+    rows = list(range(0, len(values), 3))
+    for operator, test in (('=', lambda v: v == 5), ('<', lambda v: v < 5), ('>', lambda v: v > 5),
+                           ('>=', lambda v: v >= 5), ('<=', lambda v: v <= 5)):
+        assert column.filter(operator, 5) == [i for i, v in enumerate(values) if test(v)]
+        assert column.filter(operator, 5, rows) == [i for i in rows if test(values[i])]
+    assert column.aggregate('SUM') == sum(values)
+    assert column.aggregate('AVG') == sum(values) / len(values)
+    assert column.aggregate('COUNT_DISTINCT') == len(set(values))
+    assert column.aggregate('MAX') == max(int(-1e9), max(values))
+    assert column.aggregate('MIN') == min(int(1e9), min(values))
+
+
+@pytest.mark.parametrize("kind", COLUMNS)
+def test_extend_widens(kind):
+    values = clustered(300)
+    column = kind(values)
+    extra = [1 << 40, -(1 << 40), values[-1], values[-1]]
+    column.extend(extra)
+    assert list(column) == values + extra
+    assert column[-4] == 1 << 40 and column[10:20] == values[10:20]
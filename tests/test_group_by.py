@@ -0,0 +1,72 @@
+import io
+import os
+import sys
+from collections import OrderedDict
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import MiniSQL, run_query, np  # noqa: E402
+from pipeline import Aggregate  # noqa: E402
+
+# values beyond the 1e9 bounds aggregate gives MIN and MAX, the group 2 stays within them
+KEYS = [1, 1, 2, 2]
+VALUES = [int(3e9), int(2e9), 5, 7]
+EXPECTED = {"MAX": [int(3e9), 7], "MIN": [int(1e9), 5]}
+NEGATIVE = {"MAX": [int(-1e9), 7], "MIN": [int(-3e9), 5]}
+
+
+@pytest.mark.parametrize("fun", ["MIN", "MAX"])
+def test_hash_aggregate_bounds(fun):
+    assert list(MiniSQL.hash_aggregate(KEYS, VALUES, fun).values()) == EXPECTED[fun]
+    assert list(MiniSQL.hash_aggregate(KEYS, [-v for v in VALUES[:2]] + VALUES[2:], fun).values()) == NEGATIVE[fun]
+
+
+@pytest.mark.skipif(np is None, reason="numpy is not installed")
+@pytest.mark.parametrize("fun", ["MIN", "MAX"])
+def test_array_group_by_bounds(fun):
+    for values, expected in ((VALUES, EXPECTED), ([-v for v in VALUES[:2]] + VALUES[2:], NEGATIVE)):
+        table = OrderedDict([("A", np.array(KEYS, dtype=np.int64)), ("B", np.array(values, dtype=np.int64))])
+        result = MiniSQL.array_group_by(table, "A", OrderedDict([("B", fun)]))
+        assert result[fun + "(B)"].tolist() == expected[fun]
+
+
+@pytest.mark.parametrize("fun", ["MIN", "MAX"])
+def test_stream_total_bounds(fun):
+    partials = [(sum(values), min(values), max(values), len(values)) for values in ([int(3e9), int(2e9)], [5, 7])]
+    assert [Aggregate.total(fun, partial) for partial in partials] == EXPECTED[fun]
+
+
+@pytest.mark.parametrize("backend", ["list", "compact"] + (["numpy"] if np is not None else []))
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_grouped_bounds_on_every_path(tmp_path, monkeypatch, backend, stream, workers):
+    (tmp_path / "metadata.txt").write_text("<begin_table>\nt\nA\nB\n<end_table>\n")
+    (tmp_path / "t.csv").write_text("".join("{},{}\n".format(k, v) for k, v in zip(KEYS, VALUES)))
+    monkeypatch.chdir(tmp_path)
+    minisql = MiniSQL(backend, cache_dir=None, workers=workers, stream=stream, output_format="csv",
+                      result_cache=False)
+    if minisql.parallel is not None:
+        minisql.parallel.min_rows = 0  # the small table is aggregated by the workers too
+    try:
+        for fun in ("MIN", "MAX"):
+            minisql.out = io.StringIO()
+            run_query(minisql, "SELECT " + fun + "(B) A FROM t GROUP BY A;")
+            rows = minisql.out.getvalue().splitlines()[1:]
+            assert [int(row.split(",")[0]) for row in rows] == EXPECTED[fun]
+    finally:
+        if minisql.parallel is not None:
+            minisql.parallel.close()
+
+
+def test_sampled_grouped_bounds(tmp_path, monkeypatch):
+    (tmp_path / "metadata.txt").write_text("<begin_table>\nt\nA\nB\n<end_table>\n")
+    (tmp_path / "t.csv").write_text("".join("{},{}\n".format(k, v) for k, v in zip(KEYS, VALUES)))
+    monkeypatch.chdir(tmp_path)
+    minisql = MiniSQL(cache_dir=None, output_format="csv", result_cache=False)
+    for fun in ("MIN", "MAX"):
+        minisql.out = io.StringIO()
+        run_query(minisql, "SELECT " + fun + "(B) A FROM t TABLESAMPLE SYSTEM (100) REPEATABLE (1) GROUP BY A;")
+        rows = minisql.out.getvalue().splitlines()[1:]
+        assert [int(row.split(",")[0]) for row in rows] == EXPECTED[fun]
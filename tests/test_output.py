@@ -0,0 +1,69 @@
+import io
+import json
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import MiniSQL, run_query  # noqa: E402
+
+MIXED = "SELECT mov_id_m SUM(earnings) mov_year FROM movie;"  # one aggregate along with plain columns
+
+
+@pytest.fixture(autouse=True)
+def in_repo(monkeypatch):
+    monkeypatch.chdir(ROOT)  # metadata.txt and the CSV files of the sample database
+
+
+def result(query, fmt, stream=False):
+    minisql = MiniSQL(cache_dir=None, stream=stream, output_format=fmt, result_cache=False)
+    minisql.out = io.StringIO()
+    run_query(minisql, query)
+    return minisql.out.getvalue().splitlines()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_mixed_aggregate_jsonl_keys(stream):
+    rows = [json.loads(line) for line in result(MIXED, "jsonl", stream)]
+    assert len(rows) > 1
+    assert all(list(row.keys()) == ["mov_id_m", "SUM(earnings)", "mov_year"] for row in rows)
+    assert rows[0]["SUM(earnings)"] is not None and all(row["SUM(earnings)"] is None for row in rows[1:])
+
+
+@pytest.mark.parametrize("fmt, delimiter", [("csv", ","), ("tsv", "\t")])
+def test_mixed_aggregate_csv_columns(fmt, delimiter):
+    lines = result(MIXED, fmt)
+    assert lines[0].split(delimiter) == ["mov_id_m", "SUM(earnings)", "mov_year"]
+    assert len(lines) > 2 and all(len(line.split(delimiter)) == 3 for line in lines)
+
+
+def test_create_index_writes_to_the_output(capsys):
+    minisql = MiniSQL(cache_dir=None, result_cache=False)
+    minisql.out = io.StringIO()
+    run_query(minisql, "CREATE INDEX ON movie (mov_year) USING HASH;")
+    assert minisql.out.getvalue() == "Ok\n"
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("query", ["SELECT DISTINCT mov_year FROM movie ORDER BY mov_year;",
+                                   "SELECT DISTINCT act_gender FROM actor;"])
+@pytest.mark.parametrize("fmt", ["table", "csv"])
+def test_stream_distinct_output(query, fmt):
+    assert result(query, fmt, stream=True) == result(query, fmt)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_cached_result_in_another_format(stream):
+    query = "SELECT mov_id_m earnings FROM movie WHERE earnings > 10000000 ORDER BY mov_id_m;"
+    minisql = MiniSQL(cache_dir=None, stream=stream)
+    minisql.out = io.StringIO()
+    run_query(minisql, query)
+    assert len(minisql.results.entries) == 1
+    for fmt in ("csv", "jsonl", "table"):
+        minisql.output_format = fmt
+        minisql.out = io.StringIO()
+        run_query(minisql, query)  # answered from the cache, one entry for every format
+        assert minisql.out.getvalue().splitlines() == result(query, fmt, stream)
+    assert len(minisql.results.entries) == 1
@@ -0,0 +1,33 @@
+import io
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import MiniSQL, MySQLParser, run_query  # noqa: E402
+
+TWO_AGGREGATES = "SELECT SUM(earnings) COUNT(*) FROM movie;"  # the first query of sampleQueries.txt
+
+
+@pytest.fixture(autouse=True)
+def in_repo(monkeypatch):
+    monkeypatch.chdir(ROOT)  # metadata.txt and the CSV files of the sample database
+
+
+def test_every_column_is_kept():
+    # the old sqlparse based parser gave ['SUM(earnings)'] and ['mov_id_m', 'earnings']
+    assert MySQLParser.parse_cached(TWO_AGGREGATES)["columns"] == ["SUM(earnings)", "COUNT(*)"]
+    assert MySQLParser.parse_cached("SELECT mov_id_m earnings mov_year FROM movie;")["columns"] == [
+        "mov_id_m", "earnings", "mov_year"]
+    assert MySQLParser.parse_cached("SELECT a, b FROM x, y, z WHERE a<=3;")["tables"] == ["x", "y", "z"]
+
+
+def test_two_aggregates_without_group_by():
+    minisql = MiniSQL(cache_dir=None, result_cache=False)
+    minisql.out = io.StringIO()
+    with pytest.raises(NotImplementedError, match="Only one aggregation allowed when GROUP BY is not used"):
+        run_query(minisql, TWO_AGGREGATES)
+    run_query(minisql, "SELECT SUM(earnings) FROM movie;")
+    assert minisql.out.getvalue().splitlines()[3].split() == ["378000003"]
@@ -0,0 +1,55 @@
+import io
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main  # noqa: E402
+from main import MiniSQL, repl, run_batch  # noqa: E402
+
+FAILING = "SELECT mov_year FROM movie WHERE mov_year > 2000;"  # made to fail with TypeError below
+
+
+@pytest.fixture(autouse=True)
+def in_repo(monkeypatch):
+    monkeypatch.chdir(ROOT)  # metadata.txt and the CSV files of the sample database
+
+
+def test_repl_goes_on_after_errors(monkeypatch, capsys):
+    run_query = main.run_query
+
+    def failing_run_query(minisql, query):
+        if query == FAILING:
+            raise TypeError("'>' not supported between instances of 'NoneType' and 'int'")
+        run_query(minisql, query)
+
+    monkeypatch.setattr(main, "run_query", failing_run_query)
+    queries = [FAILING, "SELECT * FROM movie WHERE mov_year > abc;", "SELECT COUNT(*) FROM movie;", "QUIT"]
+    monkeypatch.setattr(sys, "stdin", io.StringIO("\n".join(queries) + "\n"))
+    repl(MiniSQL(cache_dir=None, result_cache=False))
+    printed = capsys.readouterr().out
+    assert "Error : '>' not supported" in printed
+    assert "Error : 'abc'" in printed
+    assert printed.rstrip().endswith("Ok")  # the queries after the errors ran till QUIT
+    assert "COUNT(*)" in printed
+
+
+def test_batch_goes_on_after_errors(monkeypatch, capsys):
+    run_query = main.run_query
+
+    def failing_run_query(minisql, query):
+        if query == FAILING:
+            raise TypeError("'>' not supported between instances of 'NoneType' and 'int'")
+        run_query(minisql, query)
+
+    monkeypatch.setattr(main, "run_query", failing_run_query)
+    minisql = MiniSQL(cache_dir=None, result_cache=False)
+    minisql.out = io.StringIO()
+    run_batch(minisql, [FAILING, "SELECT * FROM nosuch WHERE x > 1;",
+                        "SELECT COUNT(*) FROM movie WHERE mov_year > 2000;"])
+    printed = capsys.readouterr().out
+    assert "Error : '>' not supported" in printed
+    assert "Error : nosuch table does not exist in the database" in printed
+    assert minisql.out.getvalue().splitlines()[3].split() == ["6"]  # the last query ran